@@ -19,12 +19,16 @@ DATA_DIR = BASE_DIR / "data"
 LOGS_DIR = BASE_DIR / "logs"
 REPORTS_DIR = DATA_DIR / "reports"
 TEMP_DIR = DATA_DIR / "temp"
+BACKUPS_DIR = DATA_DIR / "backups"
+PROFILES_DIR = DATA_DIR / "profiles"
 
 # Убеждаемся, что директории существуют
 DATA_DIR.mkdir(exist_ok=True)
 LOGS_DIR.mkdir(exist_ok=True)
 REPORTS_DIR.mkdir(exist_ok=True)
 TEMP_DIR.mkdir(exist_ok=True)
+BACKUPS_DIR.mkdir(exist_ok=True)
+PROFILES_DIR.mkdir(exist_ok=True)
 
 
 class Config:
@@ -54,6 +58,38 @@ class Config:
     DEFAULT_ADMIN_NOTIFICATIONS = os.getenv('DEFAULT_ADMIN_NOTIFICATIONS', 'True').lower() == 'true'
     DEFAULT_EMPLOYEE_NOTIFICATIONS = os.getenv('DEFAULT_EMPLOYEE_NOTIFICATIONS', 'True').lower() == 'true'
     
+    # Прием обновлений Telegram: 'polling' или 'webhook' (маршрут Flask в этом же процессе)
+    TELEGRAM_UPDATES_MODE = os.getenv('TELEGRAM_UPDATES_MODE', 'polling')
+    TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL', '')  # Публичный HTTPS адрес веб-интерфейса
+    TELEGRAM_WEBHOOK_PATH = '/telegram/webhook'
+    TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET', '')  # Пусто - производный от токена
+    TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '')  # Другой сервер Bot API, например benchmarks/fake_telegram.py
+    
+    # Массовые рассылки (лимиты Telegram Bot API)
+    TELEGRAM_RATE_LIMIT = float(os.getenv('TELEGRAM_RATE_LIMIT', 30))  # Сообщений в секунду на бота
+    TELEGRAM_PER_CHAT_INTERVAL = float(os.getenv('TELEGRAM_PER_CHAT_INTERVAL', 1.0))  # Секунд между сообщениями в один чат
+    BULK_NOTIFICATION_CONCURRENCY = int(os.getenv('BULK_NOTIFICATION_CONCURRENCY', 10))
+    BULK_NOTIFICATION_RETRIES = int(os.getenv('BULK_NOTIFICATION_RETRIES', 3))
+    
+    # Резервное копирование (SQLite backup API)
+    BACKUP_COMPRESS = os.getenv('BACKUP_COMPRESS', 'False').lower() == 'true'
+    BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', 10))  # Сколько последних копий хранить
+    BACKUP_PAGES_PER_STEP = int(os.getenv('BACKUP_PAGES_PER_STEP', 256))
+    BACKUP_STEP_SLEEP = float(os.getenv('BACKUP_STEP_SLEEP', 0.05))  # Пауза между шагами, сек
+    
+    # Журнал аудита (system_logs)
+    AUDIT_ENABLED = os.getenv('AUDIT_ENABLED', 'True').lower() == 'true'
+    AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', 100))
+    AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', 2.0))  # Секунд
+    AUDIT_QUEUE_SIZE = int(os.getenv('AUDIT_QUEUE_SIZE', 10000))
+    AUDIT_RETENTION_DAYS = int(os.getenv('AUDIT_RETENTION_DAYS', 90))
+    
+    # Профилирование запросов (cProfile)
+    PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')  # Заголовок X-Profile или ?profile=<токен>
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))  # Доля случайно профилируемых запросов
+    PROFILE_TOP_N = int(os.getenv('PROFILE_TOP_N', 30))
+    PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 200))  # Сколько последних профилей хранить
+    
     # Автозакрытие дней
     AUTO_CLOSE_TIME = os.getenv('AUTO_CLOSE_TIME', '17:00')
     AUTO_CLOSE_ENABLED = os.getenv('AUTO_CLOSE_ENABLED', 'True').lower() == 'true'
@@ -76,6 +112,8 @@ class Config:
     LOGS_DIR = LOGS_DIR
     REPORTS_DIR = REPORTS_DIR
     TEMP_DIR = TEMP_DIR
+    BACKUPS_DIR = BACKUPS_DIR
+    PROFILES_DIR = PROFILES_DIR
     
     @classmethod
     def validate(cls) -> bool:
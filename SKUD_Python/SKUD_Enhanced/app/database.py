@@ -6,11 +6,13 @@
 """
 
 import os
+import json
+import threading
 from contextlib import contextmanager
 from typing import Generator
 from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool, StaticPool
 from loguru import logger
 from pathlib import Path
 
@@ -18,12 +20,25 @@ from .config import config
 from .models import Base
 
 
+def _set_sqlite_pragma(dbapi_connection, connection_record):
+    """Настройки каждого соединения SQLite"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA journal_mode=WAL")  # Для лучшей производительности
+    # Ждем освобождения блокировки другим соединением, а не падаем с "database is locked"
+    cursor.execute("PRAGMA busy_timeout=30000")
+    cursor.close()
+
+
 class DatabaseManager:
     """Менеджер базы данных"""
     
     def __init__(self):
         self.engine = None
         self.SessionLocal = None
+        # Сессии фоновых потоков со своими соединениями (см. get_writer_session)
+        self._writer_session_factory = None
+        self._writer_lock = threading.Lock()
         self._initialize()
     
     def _initialize(self):
@@ -45,12 +60,7 @@ class DatabaseManager:
             )
             
             # Включаем поддержку внешних ключей для SQLite
-            @event.listens_for(self.engine, "connect")
-            def set_sqlite_pragma(dbapi_connection, connection_record):
-                cursor = dbapi_connection.cursor()
-                cursor.execute("PRAGMA foreign_keys=ON")
-                cursor.execute("PRAGMA journal_mode=WAL")  # Для лучшей производительности
-                cursor.close()
+            event.listen(self.engine, "connect", _set_sqlite_pragma)
         else:
             # Для других БД (PostgreSQL, MySQL)
             self.engine = create_engine(
@@ -98,6 +108,52 @@ class DatabaseManager:
         finally:
             session.close()
     
+    @contextmanager
+    def get_writer_session(self) -> Generator[Session, None, None]:
+        """
+        Сессия для фоновых потоков (запись журнала аудита)
+        
+        Основной движок SQLite использует StaticPool - одно соединение на все
+        потоки, и commit/rollback фонового потока зафиксировали бы или
+        откатили незавершенные транзакции запросов Flask и бота. Каждая
+        фоновая сессия открывает собственное соединение к тому же файлу
+        (WAL, busy_timeout). Для других БД сессии и так получают соединения из пула.
+        """
+        database_url = config.DATABASE_URL
+        in_memory = database_url in ('sqlite://', 'sqlite:///') or ':memory:' in database_url
+        if not database_url.startswith('sqlite') or in_memory:
+            # База в памяти видна только через общее соединение
+            with self.get_session() as session:
+                yield session
+            return
+        
+        with self._writer_lock:
+            if self._writer_session_factory is None:
+                writer_engine = create_engine(
+                    database_url,
+                    connect_args={"check_same_thread": False, "timeout": 30},
+                    # Соединение на сессию: пакет аудита пишется раз в несколько секунд
+                    poolclass=NullPool,
+                    echo=config.FLASK_DEBUG
+                )
+                event.listen(writer_engine, "connect", _set_sqlite_pragma)
+                self._writer_session_factory = sessionmaker(
+                    autocommit=False,
+                    autoflush=False,
+                    bind=writer_engine
+                )
+        
+        session = self._writer_session_factory()
+        try:
+            yield session
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Ошибка в фоновой сессии базы данных: {e}")
+            raise
+        finally:
+            session.close()
+    
     def get_db_session(self) -> Session:
         """Возвращает новую сессию базы данных (для зависимостей FastAPI/Flask)"""
         return self.SessionLocal()
@@ -225,24 +281,131 @@ def create_initial_data():
         raise
 
 
-def backup_database(backup_path: str = None):
-    """Создает резервную копию базы данных"""
-    if not backup_path:
-        from datetime import datetime
+def _sqlite_db_path() -> str:
+    """Возвращает путь к файлу SQLite базы из DATABASE_URL"""
+    db_path = config.DATABASE_URL.replace('sqlite:///', '')
+    if db_path.startswith('./'):
+        db_path = os.path.abspath(db_path)
+    return db_path
+
+
+def _copy_sqlite_online(source_path: str, target_path: str):
+    """
+    Копирует SQLite базу через backup API порциями страниц
+    
+    Между шагами делается пауза BACKUP_STEP_SLEEP, поэтому запись в
+    исходную базу (в том числе в WAL-режиме) не блокируется на время всей
+    копии, а результат всегда согласован.
+    """
+    import sqlite3
+    import time
+    
+    def pause_between_steps(status, remaining, total):
+        if remaining and config.BACKUP_STEP_SLEEP > 0:
+            time.sleep(config.BACKUP_STEP_SLEEP)
+    
+    source = sqlite3.connect(source_path, timeout=30)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(
+            target,
+            pages=config.BACKUP_PAGES_PER_STEP,
+            progress=pause_between_steps
+        )
+    finally:
+        target.close()
+        source.close()
+
+
+def _rotate_backups(keep: int):
+    """Удаляет старые автоматические резервные копии, оставляя keep последних"""
+    backups = sorted(
+        list(config.BACKUPS_DIR.glob("backup_skud_*.db")) + list(config.BACKUPS_DIR.glob("backup_skud_*.db.gz")),
+        key=lambda path: path.name,
+        reverse=True
+    )
+    for old_backup in backups[keep:]:
+        try:
+            old_backup.unlink()
+            logger.info(f"Удалена старая резервная копия: {old_backup.name}")
+        except OSError as e:
+            logger.warning(f"Не удалось удалить старую резервную копию {old_backup}: {e}")
+
+
+def backup_database(backup_path: str = None, compress: bool = None, rotate: bool = True):
+    """
+    Создает резервную копию базы данных без остановки записи
+    
+    Args:
+        backup_path: Путь к копии (по умолчанию BACKUPS_DIR/backup_skud_<время>.db)
+        compress: Сжать копию gzip (по умолчанию BACKUP_COMPRESS)
+        rotate: Удалить старые автоматические копии сверх BACKUP_KEEP
+        
+    Returns:
+        Путь к созданной копии
+    """
+    import gzip
+    import shutil
+    import time
+    from datetime import datetime, timezone
+    from .models import get_or_create_job_state
+    
+    if compress is None:
+        compress = config.BACKUP_COMPRESS
+    
+    auto_named = backup_path is None
+    if auto_named:
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_path = config.DATA_DIR / f"backup_skud_{timestamp}.db"
+        backup_path = config.BACKUPS_DIR / f"backup_skud_{timestamp}.db"
+    backup_path = Path(backup_path)
     
     try:
-        if config.DATABASE_URL.startswith('sqlite'):
-            import shutil
-            db_path = config.DATABASE_URL.replace('sqlite:///', '')
-            if db_path.startswith('./'):
-                db_path = os.path.abspath(db_path)
-            
-            shutil.copy2(db_path, backup_path)
-            logger.info(f"Создана резервная копия базы данных: {backup_path}")
-        else:
+        if not config.DATABASE_URL.startswith('sqlite'):
             logger.warning("Резервное копирование поддерживается только для SQLite")
+            return None
+        
+        started_at = time.monotonic()
+        backup_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        # Копия сначала пишется во временный файл, чтобы не оставить половину при сбое
+        tmp_path = backup_path.with_name(backup_path.name + ".tmp")
+        if tmp_path.exists():
+            tmp_path.unlink()
+        _copy_sqlite_online(_sqlite_db_path(), str(tmp_path))
+        
+        if compress:
+            if backup_path.suffix != '.gz':
+                backup_path = backup_path.with_name(backup_path.name + ".gz")
+            with open(tmp_path, 'rb') as src, gzip.open(backup_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            tmp_path.unlink()
+        else:
+            os.replace(tmp_path, backup_path)
+        
+        duration = time.monotonic() - started_at
+        size_bytes = backup_path.stat().st_size
+        
+        logger.info(
+            f"Создана резервная копия базы данных: {backup_path} "
+            f"({size_bytes / (1024 * 1024):.2f} МБ за {duration:.2f} с)"
+        )
+        
+        # Метрики последнего резервного копирования
+        try:
+            with db_manager.get_session() as session:
+                state = get_or_create_job_state(session, "backup")
+                state.last_run_at = datetime.now(timezone.utc)
+                state.last_success_at = state.last_run_at
+                state.last_duration_ms = int(duration * 1000)
+                state.last_result = json.dumps({"path": str(backup_path), "size_bytes": size_bytes})
+                state.run_count = (state.run_count or 0) + 1
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить метрики резервного копирования: {e}")
+        
+        if auto_named and rotate:
+            _rotate_backups(config.BACKUP_KEEP)
+        
+        return backup_path
             
     except Exception as e:
         logger.error(f"Ошибка при создании резервной копии: {e}")
@@ -250,19 +413,38 @@ def backup_database(backup_path: str = None):
 
 
 def restore_database(backup_path: str):
-    """Восстанавливает базу данных из резервной копии"""
+    """
+    Восстанавливает базу данных из резервной копии
+    
+    Данные переносятся в рабочую базу через backup API, а не копированием
+    файла, поэтому WAL и открытые соединения остаются согласованными.
+    """
+    import gzip
+    import shutil
+    import tempfile
+    
     try:
         if config.DATABASE_URL.startswith('sqlite'):
-            import shutil
-            db_path = config.DATABASE_URL.replace('sqlite:///', '')
-            if db_path.startswith('./'):
-                db_path = os.path.abspath(db_path)
+            db_path = _sqlite_db_path()
             
             # Создаем резервную копию текущей базы
-            backup_database(f"{db_path}.before_restore")
-            
-            # Восстанавливаем из резервной копии
-            shutil.copy2(backup_path, db_path)
+            backup_database(f"{db_path}.before_restore", compress=False, rotate=False)
+            
+            source_path = str(backup_path)
+            tmp_source = None
+            if source_path.endswith('.gz'):
+                fd, tmp_source = tempfile.mkstemp(dir=str(config.TEMP_DIR), suffix='.db')
+                with os.fdopen(fd, 'wb') as dst, gzip.open(source_path, 'rb') as src:
+                    shutil.copyfileobj(src, dst)
+                source_path = tmp_source
+            
+            try:
+                # Закрываем соединения пула, чтобы они не держали старое состояние
+                db_manager.engine.dispose()
+                _copy_sqlite_online(source_path, db_path)
+            finally:
+                if tmp_source and os.path.exists(tmp_source):
+                    os.remove(tmp_source)
             
             # Переинициализируем подключения
             db_manager._initialize()
@@ -292,9 +474,7 @@ def get_database_info():
             
             # Информация о размере файла (только для SQLite)
             if config.DATABASE_URL.startswith('sqlite'):
-                db_path = config.DATABASE_URL.replace('sqlite:///', '')
-                if db_path.startswith('./'):
-                    db_path = os.path.abspath(db_path)
+                db_path = _sqlite_db_path()
                 
                 if os.path.exists(db_path):
                     size_bytes = os.path.getsize(db_path)
@@ -309,16 +489,23 @@ def get_database_info():
         return {"error": str(e)} 
 
 
-def migrate_from_legacy_system(legacy_data_dir: str = "../data"):
+def migrate_from_legacy_system(
+    legacy_data_dir: str = "../data",
+    bulk: bool = False,
+    chunk_size: int = 5000
+):
     """
     Миграция данных из старой системы (CSV + JSON файлы) в новую SQLite базу
     
     Args:
         legacy_data_dir: Путь к папке с данными старой системы
+        bulk: Пакетный режим - события строятся из DataFrame целиком и
+            вставляются чанками в одной транзакции без запросов на каждую строку
+        chunk_size: Размер чанка вставки в пакетном режиме
     """
-    from .models import Employee, RFIDCard, AttendanceEvent, EventType, UserRole
+    from .models import AttendanceEvent, EventType
     import pandas as pd
-    import json
+    import time
     from datetime import datetime
     
     try:
@@ -341,54 +528,9 @@ def migrate_from_legacy_system(legacy_data_dir: str = "../data"):
             backup_database()
             
             # 1. Загружаем сотрудников из employees.json
-            logger.info("Миграция сотрудников...")
-            with open(employees_file, 'r', encoding='utf-8') as f:
-                legacy_employees = json.load(f)
-            
-            card_to_employee = {}  # Маппинг серийный_номер -> employee_id
-            
-            for serial_number, employee_name in legacy_employees.items():
-                # Проверяем, есть ли уже такая карта
-                existing_card = session.query(RFIDCard).filter(
-                    RFIDCard.serial_number == serial_number.upper()
-                ).first()
-                
-                if existing_card:
-                    logger.info(f"Карта {serial_number} уже существует, пропускаю")
-                    card_to_employee[employee_name] = existing_card.employee_id
-                    continue
-                
-                # Проверяем, есть ли сотрудник с таким именем
-                existing_employee = session.query(Employee).filter(
-                    Employee.name == employee_name
-                ).first()
-                
-                if not existing_employee:
-                    # Создаем нового сотрудника
-                    employee = Employee(
-                        name=employee_name,
-                        role=UserRole.EMPLOYEE,
-                        notifications_enabled=True,
-                        arrival_notifications=True,
-                        departure_notifications=True
-                    )
-                    session.add(employee)
-                    session.flush()  # Получаем ID
-                    logger.info(f"Создан сотрудник: {employee_name}")
-                else:
-                    employee = existing_employee
-                    logger.info(f"Сотрудник {employee_name} уже существует")
-                
-                # Создаем карту
-                card = RFIDCard(
-                    serial_number=serial_number.upper(),
-                    employee_id=employee.id,
-                    card_type="MIFARE",
-                    description=f"Мигрировано из старой системы"
-                )
-                session.add(card)
-                card_to_employee[employee_name] = employee.id
-                logger.info(f"Создана карта {serial_number} для {employee_name}")
+            legacy_employees, card_to_employee, card_ids = _migrate_legacy_employees(
+                session, employees_file
+            )
             
             session.commit()
             
@@ -398,73 +540,83 @@ def migrate_from_legacy_system(legacy_data_dir: str = "../data"):
             
             migrated_events = 0
             skipped_events = 0
+            started_at = time.monotonic()
             
-            for _, row in df.iterrows():
-                date_str = row['date']
-                employee_name = row['employee']
-                arrival_time = row['arrival'] if pd.notna(row['arrival']) else None
-                departure_time = row['departure'] if pd.notna(row['departure']) else None
+            if bulk:
+                migrated_events, skipped_events = _bulk_migrate_attendance(
+                    session, df, card_to_employee, card_ids, chunk_size
+                )
+            else:
+                for _, row in df.iterrows():
+                    date_str = row['date']
+                    employee_name = row['employee']
+                    arrival_time = row['arrival'] if pd.notna(row['arrival']) else None
+                    departure_time = row['departure'] if pd.notna(row['departure']) else None
                 
-                if employee_name not in card_to_employee:
-                    logger.warning(f"Сотрудник {employee_name} не найден в маппинге, пропускаю")
-                    skipped_events += 1
-                    continue
+                    if employee_name not in card_to_employee:
+                        logger.warning(f"Сотрудник {employee_name} не найден в маппинге, пропускаю")
+                        skipped_events += 1
+                        continue
                 
-                employee_id = card_to_employee[employee_name]
+                    employee_id = card_to_employee[employee_name]
                 
-                # Создаем событие прихода
-                if arrival_time:
-                    arrival_datetime = datetime.strptime(f"{date_str} {arrival_time}", "%Y-%m-%d %H:%M")
+                    # Создаем событие прихода
+                    if arrival_time:
+                        arrival_datetime = datetime.strptime(f"{date_str} {arrival_time}", "%Y-%m-%d %H:%M")
                     
-                    # Проверяем, есть ли уже такое событие
-                    existing_arrival = session.query(AttendanceEvent).filter(
-                        AttendanceEvent.employee_id == employee_id,
-                        AttendanceEvent.event_date == date_str,
-                        AttendanceEvent.event_type == EventType.ARRIVAL
-                    ).first()
+                        # Проверяем, есть ли уже такое событие
+                        existing_arrival = session.query(AttendanceEvent).filter(
+                            AttendanceEvent.employee_id == employee_id,
+                            AttendanceEvent.event_date == date_str,
+                            AttendanceEvent.event_type == EventType.ARRIVAL
+                        ).first()
                     
-                    if not existing_arrival:
-                        arrival_event = AttendanceEvent(
-                            employee_id=employee_id,
-                            event_type=EventType.ARRIVAL,
-                            event_time=arrival_datetime,
-                            event_date=date_str,
-                            local_time=arrival_datetime.time(),
-                            notes="Мигрировано из старой системы"
-                        )
-                        session.add(arrival_event)
-                        migrated_events += 1
+                        if not existing_arrival:
+                            arrival_event = AttendanceEvent(
+                                employee_id=employee_id,
+                                event_type=EventType.ARRIVAL,
+                                event_time=arrival_datetime,
+                                event_date=date_str,
+                                local_time=arrival_datetime.time(),
+                                notes="Мигрировано из старой системы"
+                            )
+                            session.add(arrival_event)
+                            migrated_events += 1
                 
-                # Создаем событие ухода
-                if departure_time:
-                    departure_datetime = datetime.strptime(f"{date_str} {departure_time}", "%Y-%m-%d %H:%M")
+                    # Создаем событие ухода
+                    if departure_time:
+                        departure_datetime = datetime.strptime(f"{date_str} {departure_time}", "%Y-%m-%d %H:%M")
                     
-                    # Проверяем, есть ли уже такое событие
-                    existing_departure = session.query(AttendanceEvent).filter(
-                        AttendanceEvent.employee_id == employee_id,
-                        AttendanceEvent.event_date == date_str,
-                        AttendanceEvent.event_type == EventType.DEPARTURE
-                    ).first()
+                        # Проверяем, есть ли уже такое событие
+                        existing_departure = session.query(AttendanceEvent).filter(
+                            AttendanceEvent.employee_id == employee_id,
+                            AttendanceEvent.event_date == date_str,
+                            AttendanceEvent.event_type == EventType.DEPARTURE
+                        ).first()
                     
-                    if not existing_departure:
-                        departure_event = AttendanceEvent(
-                            employee_id=employee_id,
-                            event_type=EventType.DEPARTURE,
-                            event_time=departure_datetime,
-                            event_date=date_str,
-                            local_time=departure_datetime.time(),
-                            notes="Мигрировано из старой системы"
-                        )
-                        session.add(departure_event)
-                        migrated_events += 1
+                        if not existing_departure:
+                            departure_event = AttendanceEvent(
+                                employee_id=employee_id,
+                                event_type=EventType.DEPARTURE,
+                                event_time=departure_datetime,
+                                event_date=date_str,
+                                local_time=departure_datetime.time(),
+                                notes="Мигрировано из старой системы"
+                            )
+                            session.add(departure_event)
+                            migrated_events += 1
             
             session.commit()
             
+            elapsed = time.monotonic() - started_at
+            rate = migrated_events / elapsed if elapsed > 0 else 0
+            
             logger.success(f"Миграция завершена!")
             logger.info(f"Создано сотрудников: {len(legacy_employees)}")
             logger.info(f"Создано карт: {len(legacy_employees)}")
             logger.info(f"Мигрировано событий: {migrated_events}")
             logger.info(f"Пропущено событий: {skipped_events}")
+            logger.info(f"Время миграции посещаемости: {elapsed:.2f} с ({rate:.0f} событий/с)")
             
             return True
             
@@ -473,62 +625,391 @@ def migrate_from_legacy_system(legacy_data_dir: str = "../data"):
         raise
 
 
+def _migrate_legacy_employees(session, employees_file: Path):
+    """
+    Переносит сотрудников и карты из employees.json старой системы
+    
+    Returns:
+        Кортеж (сотрудники старой системы, имя -> employee_id, имя -> card_id)
+    """
+    from .models import Employee, RFIDCard, UserRole
+    import json
+    
+    logger.info("Миграция сотрудников...")
+    with open(employees_file, 'r', encoding='utf-8') as f:
+        legacy_employees = json.load(f)
+    
+    card_to_employee = {}  # Маппинг имя_сотрудника -> employee_id
+    employee_cards = {}  # Маппинг имя_сотрудника -> RFIDCard (для card_id событий)
+    
+    for serial_number, employee_name in legacy_employees.items():
+        # Проверяем, есть ли уже такая карта
+        existing_card = session.query(RFIDCard).filter(
+            RFIDCard.serial_number == serial_number.upper()
+        ).first()
+        
+        if existing_card:
+            logger.info(f"Карта {serial_number} уже существует, пропускаю")
+            card_to_employee[employee_name] = existing_card.employee_id
+            employee_cards.setdefault(employee_name, existing_card)
+            continue
+        
+        # Проверяем, есть ли сотрудник с таким именем
+        existing_employee = session.query(Employee).filter(
+            Employee.name == employee_name
+        ).first()
+        
+        if not existing_employee:
+            # Создаем нового сотрудника
+            employee = Employee(
+                name=employee_name,
+                role=UserRole.EMPLOYEE,
+                notifications_enabled=True,
+                arrival_notifications=True,
+                departure_notifications=True
+            )
+            session.add(employee)
+            session.flush()  # Получаем ID
+            logger.info(f"Создан сотрудник: {employee_name}")
+        else:
+            employee = existing_employee
+            logger.info(f"Сотрудник {employee_name} уже существует")
+        
+        # Создаем карту
+        card = RFIDCard(
+            serial_number=serial_number.upper(),
+            employee_id=employee.id,
+            card_type="MIFARE",
+            description=f"Мигрировано из старой системы"
+        )
+        session.add(card)
+        card_to_employee[employee_name] = employee.id
+        employee_cards.setdefault(employee_name, card)
+        logger.info(f"Создана карта {serial_number} для {employee_name}")
+    
+    session.flush()  # Получаем ID новых карт
+    card_ids = {name: card.id for name, card in employee_cards.items()}
+    
+    return legacy_employees, card_to_employee, card_ids
+
+
+def _build_legacy_event_rows(df, employee_ids: dict, card_ids: dict):
+    """
+    Строит строки событий из DataFrame старой системы без запросов к базе
+    
+    Returns:
+        Кортеж (список словарей событий, пропущено строк)
+    """
+    from .models import EventType
+    import pandas as pd
+    
+    known = df['employee'].isin(employee_ids.keys()) & df['employee'].isin(card_ids.keys())
+    skipped_rows = int((~known).sum())
+    if skipped_rows:
+        unknown_names = sorted(df.loc[~known, 'employee'].astype(str).unique())
+        logger.warning(f"Сотрудники не найдены в маппинге, пропускаю {skipped_rows} строк: {', '.join(unknown_names)}")
+    
+    df = df[known].copy()
+    df['employee_id'] = df['employee'].map(employee_ids)
+    df['card_id'] = df['employee'].map(card_ids)
+    df['date'] = df['date'].astype(str)
+    
+    rows = []
+    for event_type, column in ((EventType.ARRIVAL, 'arrival'), (EventType.DEPARTURE, 'departure')):
+        part = df[df[column].notna()]
+        event_times = pd.to_datetime(
+            part['date'] + ' ' + part[column].astype(str),
+            format='%Y-%m-%d %H:%M',
+            errors='coerce'
+        )
+        invalid = int(event_times.isna().sum())
+        if invalid:
+            logger.warning(f"Пропущено {invalid} значений '{column}' с некорректным временем")
+        
+        part = part.assign(event_time=event_times)[event_times.notna()]
+        
+        for employee_id, card_id, date_str, event_time in zip(
+            part['employee_id'], part['card_id'], part['date'], part['event_time']
+        ):
+            rows.append({
+                "employee_id": int(employee_id),
+                "card_id": int(card_id),
+                "event_type": event_type,
+                "event_time": event_time.to_pydatetime(),
+                "event_date": date_str,
+                "notes": "Мигрировано из старой системы"
+            })
+    
+    return rows, skipped_rows
+
+
+def _load_existing_event_keys(session, start_date: str, end_date: str) -> set:
+    """Загружает ключи (employee_id, date, type) событий за период одним запросом"""
+    from .models import AttendanceEvent, EventType
+    
+    return set(
+        session.query(
+            AttendanceEvent.employee_id,
+            AttendanceEvent.event_date,
+            AttendanceEvent.event_type
+        ).filter(
+            AttendanceEvent.event_date >= start_date,
+            AttendanceEvent.event_date <= end_date,
+            AttendanceEvent.event_type.in_([EventType.ARRIVAL, EventType.DEPARTURE])
+        ).all()
+    )
+
+
+def _bulk_migrate_attendance(session, df, employee_ids: dict, card_ids: dict, chunk_size: int):
+    """
+    Пакетная миграция посещаемости из DataFrame старой системы
+    
+    Существующие ключи (employee_id, date, type) за период DataFrame
+    загружаются одним запросом, события строятся по столбцам DataFrame
+    и вставляются через bulk_insert_mappings чанками. Коммит выполняет
+    вызывающий код.
+    
+    Returns:
+        Кортеж (мигрировано событий, пропущено строк)
+    """
+    from .models import AttendanceEvent
+    
+    rows, skipped_rows = _build_legacy_event_rows(df, employee_ids, card_ids)
+    if not rows:
+        return 0, skipped_rows
+    
+    dates = [row["event_date"] for row in rows]
+    existing_keys = _load_existing_event_keys(session, min(dates), max(dates))
+    
+    new_rows = []
+    for row in rows:
+        key = (row["employee_id"], row["event_date"], row["event_type"])
+        if key in existing_keys:
+            continue
+        existing_keys.add(key)
+        new_rows.append(row)
+    
+    for offset in range(0, len(new_rows), chunk_size):
+        session.bulk_insert_mappings(AttendanceEvent, new_rows[offset:offset + chunk_size])
+        logger.debug(f"Вставлено событий: {min(offset + chunk_size, len(new_rows))}/{len(new_rows)}")
+    
+    return len(new_rows), skipped_rows
+
+
+def migrate_from_legacy_system_streaming(
+    legacy_data_dir: str = "../data",
+    chunk_size: int = 5000,
+    resume: bool = True,
+    validate: bool = False
+):
+    """
+    Потоковая миграция посещаемости из старой системы с контрольными точками
+    
+    attendance.csv читается чанками по chunk_size строк, каждый чанк
+    вставляется и фиксируется в отдельной транзакции вместе с контрольной
+    точкой (количество обработанных строк). После сбоя повторный запуск
+    продолжает с последней зафиксированной строки, а для дописанного
+    файла переносит только новые строки.
+    
+    Args:
+        legacy_data_dir: Путь к папке с данными старой системы
+        chunk_size: Количество строк CSV в одном чанке
+        resume: Продолжить с контрольной точки (False - начать заново)
+        validate: Проверить после миграции, что все события есть в базе
+    """
+    from .models import MigrationCheckpoint
+    import pandas as pd
+    import time
+    
+    try:
+        logger.info("Начинаю потоковую миграцию данных из старой системы...")
+        
+        legacy_path = Path(legacy_data_dir)
+        employees_file = legacy_path / "employees.json"
+        attendance_file = legacy_path / "attendance.csv"
+        
+        if not employees_file.exists():
+            logger.warning(f"Файл сотрудников не найден: {employees_file}")
+            return False
+            
+        if not attendance_file.exists():
+            logger.warning(f"Файл посещаемости не найден: {attendance_file}")
+            return False
+        
+        MigrationCheckpoint.__table__.create(bind=db_manager.engine, checkfirst=True)
+        
+        source = str(attendance_file.resolve())
+        source_size = attendance_file.stat().st_size
+        
+        with db_manager.get_session() as session:
+            _, employee_ids, card_ids = _migrate_legacy_employees(session, employees_file)
+            
+            checkpoint = session.query(MigrationCheckpoint).filter(
+                MigrationCheckpoint.source == source
+            ).first()
+            
+            if not checkpoint:
+                checkpoint = MigrationCheckpoint(source=source)
+                session.add(checkpoint)
+            elif not resume or (checkpoint.source_size or 0) > source_size:
+                # Файл стал меньше - это уже другой файл, начинаем заново
+                logger.info("Контрольная точка сброшена, миграция начнется с начала")
+                checkpoint.rows_processed = 0
+                checkpoint.events_migrated = 0
+            
+            checkpoint.source_size = source_size
+            checkpoint.is_completed = False
+            start_row = checkpoint.rows_processed or 0
+            total_events = checkpoint.events_migrated or 0
+        
+        if start_row:
+            logger.info(f"Продолжаю миграцию со строки {start_row}")
+        else:
+            # Создаем резервную копию перед началом миграции
+            backup_database()
+        
+        started_at = time.monotonic()
+        rows_processed = start_row
+        migrated_events = 0
+        skipped_rows = 0
+        
+        # Пропущенные строки не попадают в память, заголовок сохраняется.
+        # Функция, а не range: из списка номеров pandas строит множество всех
+        # пропускаемых строк (сотни МБ при продолжении после миллионов строк)
+        reader = pd.read_csv(
+            attendance_file,
+            chunksize=chunk_size,
+            skiprows=lambda i: 0 < i <= start_row
+        )
+        
+        for chunk in reader:
+            with db_manager.get_session() as session:
+                migrated, skipped = _bulk_migrate_attendance(
+                    session, chunk, employee_ids, card_ids, chunk_size
+                )
+                
+                rows_processed += len(chunk)
+                migrated_events += migrated
+                skipped_rows += skipped
+                
+                # Контрольная точка фиксируется в той же транзакции, что и данные
+                checkpoint = session.query(MigrationCheckpoint).filter(
+                    MigrationCheckpoint.source == source
+                ).one()
+                checkpoint.rows_processed = rows_processed
+                checkpoint.events_migrated = total_events + migrated_events
+            
+            logger.info(f"Обработано строк: {rows_processed}, мигрировано событий: {migrated_events}")
+        
+        with db_manager.get_session() as session:
+            checkpoint = session.query(MigrationCheckpoint).filter(
+                MigrationCheckpoint.source == source
+            ).one()
+            checkpoint.is_completed = True
+        
+        elapsed = time.monotonic() - started_at
+        rate = (rows_processed - start_row) / elapsed if elapsed > 0 else 0
+        
+        logger.success("Потоковая миграция завершена!")
+        logger.info(f"Обработано строк: {rows_processed - start_row} (всего {rows_processed})")
+        logger.info(f"Мигрировано событий: {migrated_events}")
+        logger.info(f"Пропущено строк: {skipped_rows}")
+        logger.info(f"Время миграции: {elapsed:.2f} с ({rate:.0f} строк/с)")
+        
+        if validate:
+            return validate_legacy_migration(legacy_data_dir, chunk_size)
+        
+        return True
+        
+    except Exception as e:
+        logger.error(f"Ошибка при потоковой миграции данных: {e}")
+        raise
+
+
+def validate_legacy_migration(legacy_data_dir: str = "../data", chunk_size: int = 5000) -> bool:
+    """
+    Проверяет, что все события из attendance.csv старой системы есть в базе
+    
+    Файл читается чанками, для каждого чанка выполняется один запрос
+    существующих ключей за его период.
+    
+    Returns:
+        True если отсутствующих событий нет
+    """
+    from .models import RFIDCard
+    import pandas as pd
+    import json
+    
+    legacy_path = Path(legacy_data_dir)
+    attendance_file = legacy_path / "attendance.csv"
+    
+    with open(legacy_path / "employees.json", 'r', encoding='utf-8') as f:
+        serial_to_name = {serial.upper(): name for serial, name in json.load(f).items()}
+    
+    with db_manager.get_session() as session:
+        employee_ids = {}
+        card_ids = {}
+        cards = session.query(RFIDCard).filter(
+            RFIDCard.serial_number.in_(list(serial_to_name))
+        ).all()
+        for card in cards:
+            if card.employee_id is None:
+                continue
+            name = serial_to_name[card.serial_number]
+            employee_ids.setdefault(name, card.employee_id)
+            card_ids.setdefault(name, card.id)
+        
+        expected_events = 0
+        missing_events = 0
+        total_rows = 0
+        
+        for chunk in pd.read_csv(attendance_file, chunksize=chunk_size):
+            total_rows += len(chunk)
+            rows, _ = _build_legacy_event_rows(chunk, employee_ids, card_ids)
+            if not rows:
+                continue
+            
+            expected_keys = {
+                (row["employee_id"], row["event_date"], row["event_type"]) for row in rows
+            }
+            dates = [key[1] for key in expected_keys]
+            existing_keys = _load_existing_event_keys(session, min(dates), max(dates))
+            
+            expected_events += len(expected_keys)
+            missing_events += len(expected_keys - existing_keys)
+    
+    logger.info(f"Проверка миграции: строк CSV {total_rows}, ожидается событий {expected_events}, отсутствует {missing_events}")
+    
+    if missing_events:
+        logger.error(f"В базе отсутствует {missing_events} событий из старой системы")
+        return False
+    
+    logger.success("Проверка миграции пройдена: все события перенесены")
+    return True
+
+
 def auto_close_previous_day():
     """
     Автоматическое закрытие незавершенных дней (аналог auto_close.py)
+    
+    Закрывает вчерашний день и все дни, пропущенные с последнего
+    успешного запуска (см. AttendanceService.auto_close_pending).
     """
-    from .models import Employee, AttendanceEvent, EventType
-    from datetime import datetime, timedelta, time
+    from .services.attendance import AttendanceService
     
     try:
         logger.info("Запуск автоматического закрытия незавершенных дней")
         
         with db_manager.get_session() as session:
-            # Получаем вчерашнюю дату
-            yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
-            default_end_time = time(17, 0)  # 17:00
-            
-            # Ищем сотрудников, которые пришли вчера, но не ушли
-            arrivals = session.query(AttendanceEvent).filter(
-                AttendanceEvent.event_date == yesterday,
-                AttendanceEvent.event_type == EventType.ARRIVAL
-            ).all()
-            
-            closed_count = 0
-            
-            for arrival in arrivals:
-                # Проверяем, есть ли событие ухода для этого сотрудника
-                departure = session.query(AttendanceEvent).filter(
-                    AttendanceEvent.employee_id == arrival.employee_id,
-                    AttendanceEvent.event_date == yesterday,
-                    AttendanceEvent.event_type == EventType.DEPARTURE
-                ).first()
-                
-                if not departure:
-                    # Создаем автоматическое событие ухода
-                    auto_departure = AttendanceEvent(
-                        employee_id=arrival.employee_id,
-                        event_type=EventType.DEPARTURE,
-                        event_time=datetime.strptime(f"{yesterday} 17:00", "%Y-%m-%d %H:%M"),
-                        event_date=yesterday,
-                        local_time=default_end_time,
-                        notes="Автоматическое закрытие дня"
-                    )
-                    session.add(auto_departure)
-                    closed_count += 1
-                    
-                    employee_name = arrival.employee.name if arrival.employee else "Неизвестный"
-                    logger.info(f"Автоматически закрыт день для {employee_name} на {yesterday}")
-            
-            session.commit()
+            closed_count = AttendanceService().auto_close_pending(session, config.AUTO_CLOSE_TIME)
+        
+        if closed_count > 0:
+            logger.success(f"Автоматически закрыто дней: {closed_count}")
+        else:
+            logger.info("Нет незавершенных дней для закрытия")
             
-            if closed_count > 0:
-                logger.success(f"Автоматически закрыто дней: {closed_count}")
-            else:
-                logger.info("Нет незавершенных дней для закрытия")
-                
-            return closed_count
+        return closed_count
             
     except Exception as e:
         logger.error(f"Ошибка при автоматическом закрытии дней: {e}")
-        raise 
\ No newline at end of file
+        raise
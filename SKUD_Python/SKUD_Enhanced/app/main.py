@@ -6,20 +6,29 @@
 """
 
 import asyncio
+import hmac
 import json
 from datetime import datetime, timezone, timedelta
 from typing import Optional
 
-from flask import Flask, request, jsonify, render_template, redirect, url_for, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, redirect, url_for, send_from_directory
 from flask_cors import CORS
 from loguru import logger
 
 from .config import config
 from .database import get_db, init_database, create_initial_data, get_database_info
 from .models import Employee, RFIDCard, AttendanceEvent, RegistrationRequest, EventType
-from .services import AttendanceService, RegistrationService, NotificationService, ReportService
-from .telegram_bot import bot, send_attendance_notification, send_admin_notification, send_unknown_card_notification
+from .services import AttendanceService, RegistrationService, NotificationService, ReportService, audit_service
+from .telegram_bot import (
+    bot, send_attendance_notification, send_admin_notification, send_unknown_card_notification,
+    feed_webhook_update, webhook_secret
+)
 from .models import UserRole
+from .profiling import init_flask_profiling
+from .metrics import (
+    stage_timer, render_metrics, STAGE_PARSE, STAGE_NOTIFY_ENQUEUE,
+    SCAN_REQUESTS, REPORT_GENERATION_SECONDS, AUDIT_QUEUE_DEPTH
+)
 
 
 # Создаем Flask приложение
@@ -36,12 +45,18 @@ app.config.update(
 # Включаем CORS для API
 CORS(app, resources={"/api/*": {"origins": "*"}})
 
+# Профилирование по запросу (X-Profile / ?profile=) и по доле выборки
+init_flask_profiling(app)
+
 # Инициализируем сервисы
 attendance_service = AttendanceService()
 registration_service = RegistrationService()
 notification_service = NotificationService()
 report_service = ReportService()
 
+# Глубина очереди аудита считывается в момент запроса /metrics
+AUDIT_QUEUE_DEPTH.set_function(lambda: audit_service.get_stats()['queue_size'])
+
 
 @app.before_first_request
 def initialize_app():
@@ -88,36 +103,65 @@ def health_check():
         }), 500
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Метрики в формате Prometheus"""
+    body, content_type = render_metrics()
+    return Response(body, mimetype=content_type)
+
+
+@app.route(config.TELEGRAM_WEBHOOK_PATH, methods=['POST'])
+def telegram_webhook():
+    """Обновления Telegram в режиме вебхука (TELEGRAM_UPDATES_MODE=webhook)"""
+    # Сравниваются байты: compare_digest не принимает строки с не-ASCII символами
+    token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '').encode('utf-8')
+    if not hmac.compare_digest(token, webhook_secret().encode('utf-8')):
+        logger.warning(f"Запрос к вебхуку с неверным секретом от {request.remote_addr}")
+        return jsonify({'ok': False}), 403
+    
+    update = request.get_json(silent=True)
+    if not isinstance(update, dict):
+        return jsonify({'ok': False}), 400
+    
+    # 503: бот еще не запущен или работает через polling - Telegram повторит доставку
+    if not feed_webhook_update(update):
+        return jsonify({'ok': False}), 503
+    return jsonify({'ok': True})
+
+
 @app.route('/api/attendance', methods=['POST'])
 def record_attendance():
     """API endpoint для обработки запросов от ESP32 (полная совместимость со старой системой)"""
     try:
-        data = request.json
-        logger.info(f"Получены данные: {data}")
-        
-        if not data or 'serial' not in data or 'time' not in data:
-            logger.error("Неверный формат данных")
-            return jsonify({
-                'status': 'error',
-                'message': 'Неверный формат данных'
-            }), 400
-        
-        card_serial = data['serial']
-        timestamp_str = data['time']
-        
-        # Получаем дополнительную информацию для логирования
-        user_agent = request.headers.get('User-Agent')
-        ip_address = request.remote_addr
-        
-        # Парсим timestamp
-        try:
-            timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-        except ValueError:
-            logger.error(f"Неверный формат времени: {timestamp_str}")
-            return jsonify({
-                'status': 'error',
-                'message': 'Неверный формат времени'
-            }), 400
+        with stage_timer(STAGE_PARSE):
+            data = request.json
+            logger.info(f"Получены данные: {data}")
+            
+            if not data or 'serial' not in data or 'time' not in data:
+                logger.error("Неверный формат данных")
+                SCAN_REQUESTS.labels(status='bad_request').inc()
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Неверный формат данных'
+                }), 400
+            
+            card_serial = data['serial']
+            timestamp_str = data['time']
+            
+            # Получаем дополнительную информацию для логирования
+            user_agent = request.headers.get('User-Agent')
+            ip_address = request.remote_addr
+            
+            # Парсим timestamp
+            try:
+                timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                logger.error(f"Неверный формат времени: {timestamp_str}")
+                SCAN_REQUESTS.labels(status='bad_request').inc()
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Неверный формат времени'
+                }), 400
         
         # Обрабатываем событие через сервис
         with next(get_db()) as db:
@@ -130,23 +174,26 @@ def record_attendance():
             )
             
             if success:
-                # Отправляем уведомления
-                if event_data.get('telegram_id'):
-                    # Уведомление сотруднику
-                    asyncio.create_task(send_attendance_notification(
-                        telegram_id=event_data['telegram_id'],
-                        employee_name=event_data['employee_name'],
-                        event_type=event_data['event_type'],
-                        event_time=event_data['local_time'],
-                        date=event_data['date']
-                    ))
+                SCAN_REQUESTS.labels(status='success').inc()
                 
-                # Уведомление администратору
-                admin_message = (
-                    f"СКУД: {event_data['employee_name']}: "
-                    f"{event_data['event_type']} в {event_data['local_time']} ({event_data['date']})"
-                )
-                asyncio.create_task(send_admin_notification(admin_message))
+                # Отправляем уведомления
+                with stage_timer(STAGE_NOTIFY_ENQUEUE):
+                    if event_data.get('telegram_id'):
+                        # Уведомление сотруднику
+                        asyncio.create_task(send_attendance_notification(
+                            telegram_id=event_data['telegram_id'],
+                            employee_name=event_data['employee_name'],
+                            event_type=event_data['event_type'],
+                            event_time=event_data['local_time'],
+                            date=event_data['date']
+                        ))
+                    
+                    # Уведомление администратору
+                    admin_message = (
+                        f"СКУД: {event_data['employee_name']}: "
+                        f"{event_data['event_type']} в {event_data['local_time']} ({event_data['date']})"
+                    )
+                    asyncio.create_task(send_admin_notification(admin_message))
                 
                 # Возвращаем ответ в формате, совместимом со старым ESP32 кодом
                 return jsonify({
@@ -160,19 +207,23 @@ def record_attendance():
             else:
                 # Обработка ошибок
                 if event_data and event_data.get('status') == 'unknown_card':
+                    SCAN_REQUESTS.labels(status='unknown').inc()
+                    
                     # Уведомление администратору о неизвестной карте
                     admin_message = (
                         f"СКУД: Обнаружена неизвестная карта: {card_serial}\n\n"
                         f"Для добавления сотрудника отправьте команду:\n"
                         f"/add_employee {card_serial} Имя_Сотрудника"
                     )
-                    asyncio.create_task(send_unknown_card_notification(card_serial, admin_message))
+                    with stage_timer(STAGE_NOTIFY_ENQUEUE):
+                        asyncio.create_task(send_unknown_card_notification(card_serial, admin_message))
                     
                     return jsonify({
                         'status': 'unknown',  # Для совместимости со старым ESP32 кодом
                         'message': f'Неизвестный ключ: {card_serial}'
                     }), 404
                 else:
+                    SCAN_REQUESTS.labels(status='error').inc()
                     return jsonify({
                         'status': 'error',
                         'message': message
@@ -180,6 +231,7 @@ def record_attendance():
                     
     except Exception as e:
         logger.error(f"Ошибка при обработке события посещаемости: {e}")
+        SCAN_REQUESTS.labels(status='error').inc()
         return jsonify({
             'status': 'error',
             'message': f'Внутренняя ошибка сервера: {str(e)}'
@@ -424,6 +476,15 @@ def add_employee_web():
             db.commit()
             
             logger.info(f"Добавлен сотрудник {name} с картой {serial}")
+            audit_service.log(
+                "employee_added",
+                f"Добавлен сотрудник {name} с картой {serial}",
+                module="web",
+                employee_id=employee.id,
+                card_id=card.id,
+                ip_address=request.remote_addr,
+                user_agent=request.headers.get('User-Agent')
+            )
         
         return redirect(url_for('employees'))
         
@@ -458,6 +519,15 @@ def edit_employee():
             
             db.commit()
             logger.info(f"Обновлено имя сотрудника для карты {serial}: {name}")
+            audit_service.log(
+                "employee_updated",
+                f"Обновлено имя сотрудника для карты {serial}: {name}",
+                module="web",
+                employee_id=card.employee_id,
+                card_id=card.id,
+                ip_address=request.remote_addr,
+                user_agent=request.headers.get('User-Agent')
+            )
         
         return redirect(url_for('employees'))
         
@@ -569,14 +639,15 @@ def generate_report():
             
             # Простейший Excel файл для тестирования
             try:
-                import pandas as pd
-                df = pd.DataFrame({
-                    'Дата': ['2024-01-01'],
-                    'Сотрудник': ['Тест'],
-                    'Приход': ['09:00'],
-                    'Уход': ['18:00']
-                })
-                df.to_excel(report_path, index=False)
+                with REPORT_GENERATION_SECONDS.time():
+                    import pandas as pd
+                    df = pd.DataFrame({
+                        'Дата': ['2024-01-01'],
+                        'Сотрудник': ['Тест'],
+                        'Приход': ['09:00'],
+                        'Уход': ['18:00']
+                    })
+                    df.to_excel(report_path, index=False)
                 
                 logger.info(f"Сгенерирован отчет: {report_path}")
                 return jsonify({
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Метрики СКУД Enhanced в формате Prometheus (эндпоинт /metrics)
+
+Время обработки /api/attendance разбито по этапам в гистограмме
+skud_scan_stage_seconds, чтобы под реальной нагрузкой было видно, на что
+уходит задержка сканирования.
+"""
+
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+
+# Этапы обработки сканирования
+STAGE_PARSE = "parse"
+STAGE_LOOKUP = "employee_lookup"
+STAGE_STORAGE_LOAD = "storage_load"
+STAGE_STORAGE_WRITE = "storage_write"
+STAGE_NOTIFY_ENQUEUE = "notify_enqueue"
+STAGE_NOTIFY_SEND = "notify_send"
+
+SCAN_STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+REPORT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+SCAN_STAGE_SECONDS = Histogram(
+    "skud_scan_stage_seconds",
+    "Время этапа обработки сканирования карты",
+    ["stage"],
+    buckets=SCAN_STAGE_BUCKETS
+)
+SCAN_REQUESTS = Counter(
+    "skud_scan_requests_total",
+    "Запросы /api/attendance по результату",
+    ["status"]
+)
+UNKNOWN_CARDS = Counter(
+    "skud_unknown_cards_total",
+    "Сканирования неизвестных карт"
+)
+NOTIFICATIONS = Counter(
+    "skud_notifications_total",
+    "Уведомления Telegram по типу и результату",
+    ["kind", "result"]
+)
+NOTIFICATIONS_IN_FLIGHT = Gauge(
+    "skud_notifications_in_flight",
+    "Уведомления, ожидающие отправки или отправляемые сейчас"
+)
+REPORT_GENERATION_SECONDS = Histogram(
+    "skud_report_generation_seconds",
+    "Время генерации месячного отчета",
+    buckets=REPORT_BUCKETS
+)
+JOB_DURATION_SECONDS = Histogram(
+    "skud_job_duration_seconds",
+    "Время выполнения задачи планировщика",
+    ["job"],
+    buckets=JOB_BUCKETS
+)
+JOB_RUNS = Counter(
+    "skud_job_runs_total",
+    "Запуски задач планировщика по результату",
+    ["job", "result"]
+)
+JOB_LAST_SUCCESS = Gauge(
+    "skud_job_last_success_timestamp_seconds",
+    "Время последнего успешного выполнения задачи (Unix time)",
+    ["job"]
+)
+JOB_NEXT_RUN = Gauge(
+    "skud_job_next_run_timestamp_seconds",
+    "Время следующего запуска задачи по расписанию (Unix time)",
+    ["job"]
+)
+AUDIT_QUEUE_DEPTH = Gauge(
+    "skud_audit_queue_depth",
+    "Записи аудита, ожидающие сохранения"
+)
+AUDIT_DROPPED = Counter(
+    "skud_audit_dropped_total",
+    "Потерянные записи аудита (переполнение очереди или ошибка записи)"
+)
+
+
+def stage_timer(stage: str):
+    """Контекстный менеджер, измеряющий длительность этапа сканирования"""
+    return SCAN_STAGE_SECONDS.labels(stage=stage).time()
+
+
+def record_notification(kind: str, success: bool):
+    """Учитывает результат отправки уведомления"""
+    NOTIFICATIONS.labels(kind=kind, result="sent" if success else "failed").inc()
+
+
+def render_metrics():
+    """Возвращает (тело, content-type) для ответа эндпоинта /metrics"""
+    return generate_latest(), CONTENT_TYPE_LATEST
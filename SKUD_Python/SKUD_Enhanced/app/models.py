@@ -274,6 +274,53 @@ class SystemLog(Base):
         return f"<SystemLog(level={self.level}, module={self.module}, action={self.action})>"
 
 
+class MigrationCheckpoint(Base):
+    """Модель контрольной точки потоковой миграции из старой системы"""
+    __tablename__ = "migration_checkpoints"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String(500), unique=True, nullable=False)  # Абсолютный путь к CSV
+    source_size = Column(Integer, nullable=True)  # Размер файла в байтах при последнем запуске
+    
+    # Прогресс
+    rows_processed = Column(Integer, default=0)  # Строк CSV обработано (без заголовка)
+    events_migrated = Column(Integer, default=0)
+    is_completed = Column(Boolean, default=False)
+    
+    # Метаданные
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<MigrationCheckpoint(source='{self.source}', rows={self.rows_processed})>"
+
+
+class JobState(Base):
+    """Модель состояния фоновой задачи (время и результат последних запусков)"""
+    __tablename__ = "job_states"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), unique=True, nullable=False, index=True)
+    
+    # Последние запуски
+    last_run_at = Column(DateTime(timezone=True), nullable=True)
+    last_success_at = Column(DateTime(timezone=True), nullable=True)
+    last_duration_ms = Column(Integer, nullable=True)
+    last_result = Column(Text, nullable=True)  # Произвольный результат задачи (например, последняя закрытая дата)
+    last_error = Column(Text, nullable=True)
+    
+    # Счетчики
+    run_count = Column(Integer, default=0)
+    failure_count = Column(Integer, default=0)
+    
+    # Метаданные
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<JobState(name='{self.name}', last_success_at={self.last_success_at})>"
+
+
 # Утилитарные функции для работы с моделями
 
 def get_or_create_employee(db: Session, telegram_id: str) -> Employee:
@@ -339,4 +386,14 @@ def get_today_events(db: Session, employee_id: int, date: str = None) -> List[At
     return db.query(AttendanceEvent).filter(
         AttendanceEvent.employee_id == employee_id,
         AttendanceEvent.event_date == date
-    ).order_by(AttendanceEvent.event_time).all() 
\ No newline at end of file
+    ).order_by(AttendanceEvent.event_time).all()
+
+
+def get_or_create_job_state(db: Session, name: str) -> JobState:
+    """Получает или создает состояние фоновой задачи"""
+    state = db.query(JobState).filter(JobState.name == name).first()
+    if not state:
+        state = JobState(name=name, run_count=0, failure_count=0)
+        db.add(state)
+        db.flush()
+    return state
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Профилирование запросов Flask и обработчиков Telegram бота (cProfile)
+
+Запрос профилируется, если в нем передан PROFILE_TOKEN (заголовок X-Profile
+или параметр ?profile=), либо случайно с вероятностью PROFILE_SAMPLE_RATE.
+Для каждого профиля в PROFILES_DIR сохраняются два файла: .prof (формат
+pstats, открывается snakeviz, конвертируется во flamegraph через flameprof)
+и .txt с топ-N функций по накопленному времени.
+"""
+
+import cProfile
+import hmac
+import io
+import pstats
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+from .config import config
+
+
+# Одновременно активен только один профилировщик: в Python 3.12+ это
+# ограничение интерпретатора, а в asyncio профили соседних задач смешались бы
+_active_lock = threading.Lock()
+
+
+def should_profile(token: Optional[str] = None) -> bool:
+    """Решает, профилировать ли запрос (по токену или по доле выборки)"""
+    # Сравниваются байты: compare_digest не принимает строки с не-ASCII символами
+    if token and config.PROFILE_TOKEN and hmac.compare_digest(token.encode('utf-8'), config.PROFILE_TOKEN.encode('utf-8')):
+        return True
+    return config.PROFILE_SAMPLE_RATE > 0 and random.random() < config.PROFILE_SAMPLE_RATE
+
+
+def start_profile() -> Optional[cProfile.Profile]:
+    """Запускает профилировщик; None, если уже идет другое профилирование"""
+    if not _active_lock.acquire(blocking=False):
+        return None
+    
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Профилировщик уже установлен другим инструментом (отладчик, coverage)
+        _active_lock.release()
+        return None
+    return profiler
+
+
+def finish_profile(profiler: cProfile.Profile, name: str, duration: float) -> Optional[Path]:
+    """Останавливает профилировщик и сохраняет результат"""
+    try:
+        profiler.disable()
+    finally:
+        _active_lock.release()
+    
+    try:
+        safe_name = re.sub(r'[^A-Za-z0-9_-]+', '_', name).strip('_')[:80]
+        base_path = config.PROFILES_DIR / f"{datetime.now():%Y%m%d_%H%M%S_%f}_{safe_name}"
+        
+        profiler.dump_stats(str(base_path.with_suffix('.prof')))
+        
+        summary = io.StringIO()
+        summary.write(f"{name}: {duration * 1000:.1f} мс\n\n")
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats('cumulative').print_stats(config.PROFILE_TOP_N)
+        base_path.with_suffix('.txt').write_text(summary.getvalue(), encoding='utf-8')
+        
+        _rotate_profiles(config.PROFILE_KEEP)
+        logger.info(f"Профиль {name} ({duration * 1000:.1f} мс) сохранен: {base_path.with_suffix('.prof')}")
+        return base_path.with_suffix('.prof')
+    
+    except Exception as e:
+        logger.error(f"Ошибка сохранения профиля {name}: {e}")
+        return None
+
+
+def _rotate_profiles(keep: int):
+    """Удаляет старые профили, оставляя keep последних"""
+    profiles = sorted(config.PROFILES_DIR.glob("*.prof"), reverse=True)
+    for old_profile in profiles[keep:]:
+        old_profile.unlink(missing_ok=True)
+        old_profile.with_suffix('.txt').unlink(missing_ok=True)
+
+
+def init_flask_profiling(app):
+    """Подключает профилирование ко всем маршрутам Flask приложения"""
+    from flask import g, request
+    
+    @app.before_request
+    def _start_request_profile():
+        token = request.headers.get('X-Profile') or request.args.get('profile')
+        if should_profile(token):
+            g.profiler = start_profile()
+            g.profile_started_at = time.perf_counter()
+    
+    @app.teardown_request
+    def _finish_request_profile(exc):
+        profiler = g.pop('profiler', None)
+        if profiler:
+            duration = time.perf_counter() - g.pop('profile_started_at')
+            finish_profile(profiler, f"{request.method} {request.path}", duration)
+
+
+async def profiling_middleware(handler, event, data):
+    """Outer middleware aiogram: профилирует обработку update по доле выборки"""
+    if not should_profile():
+        return await handler(event, data)
+    
+    profiler = start_profile()
+    if not profiler:
+        return await handler(event, data)
+    
+    started_at = time.perf_counter()
+    try:
+        return await handler(event, data)
+    finally:
+        # Пока обработчик ждет (await), профиль захватывает и другие задачи цикла
+        finish_profile(profiler, f"update_{event.event_type}", time.perf_counter() - started_at)
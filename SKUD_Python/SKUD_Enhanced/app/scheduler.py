@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Планировщик фоновых задач СКУД Enhanced
+
+Задачи хранятся в куче по времени следующего запуска, планировщик спит
+ровно до ближайшей задачи. Время последних запусков сохраняется в таблице
+job_states, поэтому после простоя пропущенные запуски выполняются сразу
+при старте (catch-up). Длительность, результаты запусков и время
+следующего запуска экспортируются в /metrics (skud_job_*).
+"""
+
+import asyncio
+import heapq
+import inspect
+import itertools
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional, Dict, Any, List
+
+from loguru import logger
+
+from .database import db_manager
+from .metrics import JOB_DURATION_SECONDS, JOB_RUNS, JOB_LAST_SUCCESS, JOB_NEXT_RUN
+from .models import get_or_create_job_state
+
+
+# Максимальный сон: защищает от перевода системных часов во время ожидания
+MAX_SLEEP_SECONDS = 3600
+
+
+class Job:
+    """
+    Фоновая задача планировщика
+    
+    Расписание задается как в cron: minute/hour/day (день месяца), None
+    означает "любое значение". Например, hour=0, minute=1 - ежедневно в
+    00:01; hour=None, minute=0 - каждый час; day=1, hour=2, minute=0 -
+    первого числа каждого месяца. Вместо cron-полей можно задать interval.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], Any],
+        minute: Optional[int] = 0,
+        hour: Optional[int] = None,
+        day: Optional[int] = None,
+        interval: Optional[timedelta] = None,
+        catch_up: bool = True,
+        enabled: bool = True
+    ):
+        self.name = name
+        self.func = func
+        self.minute = minute
+        self.hour = hour
+        self.day = day
+        self.interval = interval
+        self.catch_up = catch_up
+        self.enabled = enabled
+        
+        self.last_run_at: Optional[datetime] = None
+        self.next_run_at: Optional[datetime] = None
+    
+    def __repr__(self):
+        return f"<Job(name='{self.name}', next_run_at={self.next_run_at})>"
+    
+    def next_run_after(self, moment: datetime) -> datetime:
+        """Возвращает первое время запуска строго после moment"""
+        if self.interval:
+            return moment + self.interval
+        
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        minutes = [self.minute] if self.minute is not None else range(60)
+        hours = [self.hour] if self.hour is not None else range(24)
+        
+        # Перебираем дни (не более двух месяцев вперед - хватает для любого дня месяца)
+        for day_offset in range(62):
+            day_start = (candidate + timedelta(days=day_offset)).replace(hour=0, minute=0)
+            if self.day is not None and day_start.day != self.day:
+                continue
+            
+            for hour in hours:
+                for minute in minutes:
+                    run_at = day_start.replace(hour=hour, minute=minute)
+                    if run_at >= candidate:
+                        return run_at
+        
+        raise ValueError(f"Не удалось вычислить расписание задачи {self.name}")
+
+
+class Scheduler:
+    """Планировщик задач на основе кучи таймеров"""
+    
+    def __init__(self, executor=None):
+        self.executor = executor
+        self.jobs: Dict[str, Job] = {}
+        self._heap: List = []
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._running = False
+    
+    def add_job(self, job: Job) -> Job:
+        """Регистрирует задачу (можно вызывать и после запуска)"""
+        if job.name in self.jobs:
+            raise ValueError(f"Задача {job.name} уже зарегистрирована")
+        
+        self.jobs[job.name] = job
+        if self._running and job.enabled:
+            self._schedule(job, self._initial_run_at(job))
+            self._wakeup.set()
+        return job
+    
+    async def run(self):
+        """Основной цикл: спит до ближайшей задачи и выполняет ее"""
+        self._wakeup = asyncio.Event()
+        self._running = True
+        
+        try:
+            self._load_states()
+            for job in self.jobs.values():
+                if job.enabled:
+                    self._schedule(job, self._initial_run_at(job))
+            
+            logger.info(f"Планировщик задач запущен, задач: {len(self._heap)}")
+            
+            while self._running:
+                if not self._heap:
+                    await self._sleep(MAX_SLEEP_SECONDS)
+                    continue
+                
+                run_at, _, job = self._heap[0]
+                delay = (run_at - datetime.now()).total_seconds()
+                
+                if delay > 0:
+                    await self._sleep(min(delay, MAX_SLEEP_SECONDS))
+                    continue
+                
+                heapq.heappop(self._heap)
+                if job.next_run_at != run_at or not job.enabled:
+                    # Устаревшая запись кучи
+                    continue
+                
+                await self._run_job(job)
+                self._schedule(job, job.next_run_after(datetime.now()))
+        
+        except asyncio.CancelledError:
+            logger.info("Планировщик остановлен")
+            raise
+        finally:
+            self._running = False
+    
+    def stop(self):
+        """Останавливает основной цикл"""
+        self._running = False
+        if self._wakeup:
+            self._wakeup.set()
+    
+    async def run_job_now(self, name: str):
+        """Выполняет задачу немедленно вне расписания"""
+        await self._run_job(self.jobs[name])
+    
+    def _schedule(self, job: Job, run_at: datetime):
+        job.next_run_at = run_at
+        JOB_NEXT_RUN.labels(job=job.name).set(run_at.timestamp())
+        heapq.heappush(self._heap, (run_at, next(self._counter), job))
+    
+    def _initial_run_at(self, job: Job) -> datetime:
+        """Время первого запуска с учетом пропущенных во время простоя"""
+        now = datetime.now()
+        
+        if job.catch_up and job.last_run_at:
+            missed_run_at = job.next_run_after(job.last_run_at)
+            if missed_run_at <= now:
+                logger.info(f"Задача {job.name} пропустила запуск в {missed_run_at:%d.%m.%Y %H:%M}, выполняю сейчас")
+                return now
+        
+        return job.next_run_after(now)
+    
+    async def _sleep(self, seconds: float):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+    
+    async def _run_job(self, job: Job):
+        """Выполняет задачу, учитывает ее в метриках и сохраняет состояние"""
+        logger.info(f"Выполняется задача {job.name}...")
+        started_at = time.monotonic()
+        job.last_run_at = datetime.now()
+        error = None
+        result = None
+        
+        try:
+            if inspect.iscoroutinefunction(job.func):
+                result = await job.func()
+            else:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self.executor, job.func)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = str(e)
+            logger.error(f"Ошибка выполнения задачи {job.name}: {e}")
+        
+        duration = time.monotonic() - started_at
+        JOB_DURATION_SECONDS.labels(job=job.name).observe(duration)
+        JOB_RUNS.labels(job=job.name, result="failed" if error else "success").inc()
+        if not error:
+            JOB_LAST_SUCCESS.labels(job=job.name).set_to_current_time()
+            logger.info(f"Задача {job.name} выполнена за {duration:.2f} с")
+        
+        self._save_state(job, duration, result, error)
+    
+    def _load_states(self):
+        """Загружает время последних запусков из базы"""
+        try:
+            with db_manager.get_session() as session:
+                for job in self.jobs.values():
+                    state = get_or_create_job_state(session, self._state_name(job))
+                    if state.last_run_at:
+                        job.last_run_at = _to_local_naive(state.last_run_at)
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить состояние задач планировщика: {e}")
+    
+    def _save_state(self, job: Job, duration: float, result: Any, error: Optional[str]):
+        try:
+            with db_manager.get_session() as session:
+                state = get_or_create_job_state(session, self._state_name(job))
+                now = datetime.now(timezone.utc)
+                state.last_run_at = now
+                state.last_duration_ms = int(duration * 1000)
+                state.run_count = (state.run_count or 0) + 1
+                state.last_error = error
+                if error:
+                    state.failure_count = (state.failure_count or 0) + 1
+                else:
+                    state.last_success_at = now
+                    state.last_result = None if result is None else str(result)
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить состояние задачи {job.name}: {e}")
+    
+    @staticmethod
+    def _state_name(job: Job) -> str:
+        return f"scheduler:{job.name}"
+
+
+def _to_local_naive(moment: datetime) -> datetime:
+    """Переводит время из базы (UTC, в SQLite без tzinfo) в локальное без tzinfo"""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone().replace(tzinfo=None)
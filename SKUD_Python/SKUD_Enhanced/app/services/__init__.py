@@ -6,10 +6,13 @@ from .reports import ReportService
 from .registration import RegistrationService
 from .notifications import NotificationService
 from .attendance import AttendanceService
+from .audit import AuditService, audit_service
 
 __all__ = [
     'ReportService',
     'RegistrationService', 
     'NotificationService',
-    'AttendanceService'
+    'AttendanceService',
+    'AuditService',
+    'audit_service'
 ] 
\ No newline at end of file
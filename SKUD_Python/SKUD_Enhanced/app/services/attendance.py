@@ -7,18 +7,28 @@
 
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Tuple, List, Dict, Any
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, func
+from sqlalchemy.orm import Session, aliased
 from loguru import logger
 
+from ..config import config
+from ..metrics import (
+    stage_timer, UNKNOWN_CARDS, STAGE_LOOKUP, STAGE_STORAGE_LOAD, STAGE_STORAGE_WRITE
+)
 from ..models import (
     Employee, RFIDCard, AttendanceEvent, DailyAttendance,
-    EventType, get_card_by_serial, create_attendance_event, get_today_events
+    EventType, get_card_by_serial, create_attendance_event, get_today_events,
+    get_or_create_job_state
 )
+from .audit import audit_service
 
 
 class AttendanceService:
     """Сервис для обработки посещаемости"""
     
+    # Имя состояния в job_states: last_result хранит последнюю закрытую дату
+    AUTO_CLOSE_STATE = "auto_close_days"
+    
     def __init__(self):
         pass
     
@@ -46,41 +56,63 @@ class AttendanceService:
         try:
             card_serial = card_serial.upper().strip()
             
-            # Ищем карту
-            card = get_card_by_serial(db, card_serial)
+            # Ищем карту и сотрудника
+            with stage_timer(STAGE_LOOKUP):
+                card = get_card_by_serial(db, card_serial)
+                employee = card.employee if card else None
             
             if not card:
                 logger.warning(f"Неизвестная карта: {card_serial}")
+                UNKNOWN_CARDS.inc()
+                audit_service.log(
+                    "unknown_card",
+                    f"Неизвестная карта: {card_serial}",
+                    level="WARNING",
+                    module="attendance",
+                    extra_data={"card_serial": card_serial, "timestamp": timestamp.isoformat()},
+                    ip_address=ip_address,
+                    user_agent=user_agent
+                )
                 return False, f"Неизвестная карта: {card_serial}", {
                     "status": "unknown_card",
                     "card_serial": card_serial,
                     "timestamp": timestamp.isoformat()
                 }
             
-            if not card.employee:
+            if not employee:
                 logger.warning(f"Карта {card_serial} не привязана к сотруднику")
+                audit_service.log(
+                    "unassigned_card",
+                    f"Карта {card_serial} не привязана к сотруднику",
+                    level="WARNING",
+                    module="attendance",
+                    card_id=card.id,
+                    extra_data={"card_serial": card_serial, "timestamp": timestamp.isoformat()},
+                    ip_address=ip_address,
+                    user_agent=user_agent
+                )
                 return False, f"Карта не привязана к сотруднику", {
                     "status": "unassigned_card",
                     "card_serial": card_serial,
                     "timestamp": timestamp.isoformat()
                 }
             
-            employee = card.employee
-            
             # Определяем тип события (приход или уход)
-            event_type = self._determine_event_type(db, employee.id, timestamp)
-            
-            # Создаем событие посещаемости
-            event = create_attendance_event(
-                db=db,
-                card=card,
-                event_type=event_type,
-                event_time=timestamp,
-                notes=f"IP: {ip_address}, UA: {user_agent}" if ip_address or user_agent else None
-            )
-            
-            # Обновляем дневную посещаемость
-            self._update_daily_attendance(db, employee.id, timestamp, event_type)
+            with stage_timer(STAGE_STORAGE_LOAD):
+                event_type = self._determine_event_type(db, employee.id, timestamp)
+            
+            with stage_timer(STAGE_STORAGE_WRITE):
+                # Создаем событие посещаемости
+                event = create_attendance_event(
+                    db=db,
+                    card=card,
+                    event_type=event_type,
+                    event_time=timestamp,
+                    notes=f"IP: {ip_address}, UA: {user_agent}" if ip_address or user_agent else None
+                )
+                
+                # Обновляем дневную посещаемость
+                self._update_daily_attendance(db, employee.id, timestamp, event_type)
             
             event_data = {
                 "status": "success",
@@ -98,6 +130,16 @@ class AttendanceService:
             message = f"Записано: {employee.name} - {action} в {event.local_time.strftime('%H:%M')}"
             
             logger.info(f"Обработано событие: {employee.name} - {action} в {timestamp}")
+            audit_service.log(
+                "card_scan",
+                message,
+                module="attendance",
+                employee_id=employee.id,
+                card_id=card.id,
+                extra_data={"event_type": event_type.value, "event_id": event.id},
+                ip_address=ip_address,
+                user_agent=user_agent
+            )
             
             return True, message, event_data
             
@@ -382,63 +424,209 @@ class AttendanceService:
         self, 
         db: Session, 
         date: str = None, 
-        default_departure_time: str = "17:00"
+        default_departure_time: str = None
     ) -> int:
         """
         Автоматически закрывает день для незакрытых записей
         
         Args:
             db: Сессия базы данных
-            date: Дата для закрытия (по умолчанию вчера)
+            date: Дата для закрытия (по умолчанию - все дни, пропущенные
+                с последнего успешного запуска, по вчерашний включительно)
+            default_departure_time: Время ухода по умолчанию (по умолчанию AUTO_CLOSE_TIME)
+            
+        Returns:
+            Количество закрытых записей
+        """
+        if date:
+            return max(self.auto_close_range(db, date, date, default_departure_time), 0)
+        return self.auto_close_pending(db, default_departure_time)
+    
+    def auto_close_pending(self, db: Session, default_departure_time: str = None) -> int:
+        """
+        Закрывает все незакрытые дни с последнего успешного запуска по вчерашний
+        
+        Если задача не запускалась несколько дней (простой сервера, пропущенный
+        запуск планировщика), все пропущенные дни закрываются за один проход.
+        
+        Args:
+            db: Сессия базы данных
             default_departure_time: Время ухода по умолчанию
             
         Returns:
             Количество закрытых записей
         """
         try:
-            if not date:
-                yesterday = datetime.now() - timedelta(days=1)
-                date = yesterday.strftime('%Y-%m-%d')
-            
-            # Ищем незакрытые записи
-            unclosed_records = db.query(DailyAttendance).filter(
-                DailyAttendance.date == date,
-                DailyAttendance.arrival_time.isnot(None),
-                DailyAttendance.departure_time.is_(None),
-                DailyAttendance.is_closed == False
-            ).all()
+            end_date = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+            
+            state = get_or_create_job_state(db, self.AUTO_CLOSE_STATE)
+            start_date = None
+            if state.last_result:
+                start_date = (
+                    datetime.strptime(state.last_result, '%Y-%m-%d') + timedelta(days=1)
+                ).strftime('%Y-%m-%d')
             
             closed_count = 0
+            if not start_date or start_date <= end_date:
+                closed_count = self.auto_close_range(db, start_date, end_date, default_departure_time)
+                if closed_count < 0:
+                    return 0
+            
+            state.last_result = end_date
+            state.last_success_at = datetime.now(timezone.utc)
+            state.run_count = (state.run_count or 0) + 1
+            db.commit()
             
-            for record in unclosed_records:
-                try:
-                    # Устанавливаем время ухода
-                    departure_datetime = datetime.strptime(
-                        f"{date} {default_departure_time}", 
-                        '%Y-%m-%d %H:%M'
-                    )
-                    
-                    record.departure_time = departure_datetime
-                    record.is_closed = True
-                    record.auto_closed = True
-                    
-                    # Пересчитываем отработанные часы
-                    if record.arrival_time:
-                        duration = departure_datetime - record.arrival_time
-                        record.hours_worked = int(duration.total_seconds() // 60)
-                    
-                    closed_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"Ошибка закрытия записи {record.id}: {e}")
+            return closed_count
+            
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Ошибка автозакрытия пропущенных дней: {e}")
+            return 0
+    
+    def auto_close_range(
+        self, 
+        db: Session, 
+        start_date: Optional[str], 
+        end_date: str, 
+        default_departure_time: str = None
+    ) -> int:
+        """
+        Закрывает незавершенные дни за период набором запросов без N+1
+        
+        Незакрытые дни (есть приход, нет ухода) находятся одним anti-join
+        запросом, затем события ухода и дневные записи вставляются и
+        обновляются пакетно.
+        
+        Args:
+            db: Сессия базы данных
+            start_date: Начало периода YYYY-MM-DD (None - без ограничения)
+            end_date: Конец периода YYYY-MM-DD включительно
+            default_departure_time: Время ухода по умолчанию
+            
+        Returns:
+            Количество закрытых записей (-1 при ошибке)
+        """
+        try:
+            default_departure_time = default_departure_time or config.AUTO_CLOSE_TIME
+            hour, minute = (int(part) for part in default_departure_time.split(':'))
+            
+            arrival = aliased(AttendanceEvent)
+            departure = aliased(AttendanceEvent)
+            
+            query = db.query(
+                arrival.employee_id,
+                arrival.event_date,
+                func.min(arrival.event_time).label('arrival_time'),
+                func.min(arrival.card_id).label('card_id')
+            ).outerjoin(
+                departure,
+                and_(
+                    departure.employee_id == arrival.employee_id,
+                    departure.event_date == arrival.event_date,
+                    departure.event_type == EventType.DEPARTURE
+                )
+            ).filter(
+                arrival.event_type == EventType.ARRIVAL,
+                arrival.event_date <= end_date,
+                departure.id.is_(None)
+            )
+            
+            if start_date:
+                query = query.filter(arrival.event_date >= start_date)
+            
+            unclosed = query.group_by(arrival.employee_id, arrival.event_date).all()
+            
+            if not unclosed:
+                return 0
+            
+            # Синтетические события ухода
+            departure_events = []
+            closing = {}  # (employee_id, date) -> (время прихода, время ухода)
+            
+            for employee_id, date_str, arrival_time, card_id in unclosed:
+                departure_time = datetime.strptime(date_str, '%Y-%m-%d').replace(hour=hour, minute=minute)
+                if arrival_time is not None and arrival_time.tzinfo is not None:
+                    departure_time = departure_time.replace(tzinfo=arrival_time.tzinfo)
+                
+                departure_events.append({
+                    "employee_id": employee_id,
+                    "card_id": card_id,
+                    "event_type": EventType.DEPARTURE,
+                    "event_time": departure_time,
+                    "event_date": date_str,
+                    "notes": "Автоматическое закрытие дня",
+                    "is_manual": False
+                })
+                closing[(employee_id, date_str)] = (arrival_time, departure_time)
+            
+            # Дневные записи за период одним запросом
+            dates = [date_str for _, date_str in closing]
+            employee_ids = {employee_id for employee_id, _ in closing}
+            
+            daily_records = db.query(
+                DailyAttendance.id,
+                DailyAttendance.employee_id,
+                DailyAttendance.date,
+                DailyAttendance.arrival_time
+            ).filter(
+                DailyAttendance.date >= min(dates),
+                DailyAttendance.date <= max(dates),
+                DailyAttendance.employee_id.in_(employee_ids)
+            ).all()
+            
+            daily_updates = []
+            for record_id, employee_id, date_str, record_arrival in daily_records:
+                key = (employee_id, date_str)
+                if key not in closing:
                     continue
+                
+                arrival_time, departure_time = closing.pop(key)
+                daily_updates.append({
+                    "id": record_id,
+                    "departure_time": departure_time,
+                    "hours_worked": self._worked_minutes(record_arrival or arrival_time, departure_time),
+                    "is_closed": True,
+                    "auto_closed": True
+                })
             
-            if closed_count > 0:
-                db.commit()
-                logger.info(f"Автоматически закрыто {closed_count} записей за {date}")
+            # Дни без дневной записи (например, мигрированные из старой системы)
+            daily_inserts = []
+            for (employee_id, date_str), (arrival_time, departure_time) in closing.items():
+                day = datetime.strptime(date_str, '%Y-%m-%d')
+                daily_inserts.append({
+                    "employee_id": employee_id,
+                    "date": date_str,
+                    "arrival_time": arrival_time,
+                    "departure_time": departure_time,
+                    "hours_worked": self._worked_minutes(arrival_time, departure_time),
+                    "is_weekend": self._is_weekend(day),
+                    "is_holiday": self._is_holiday(day),
+                    "is_closed": True,
+                    "auto_closed": True
+                })
             
-            return closed_count
+            db.bulk_insert_mappings(AttendanceEvent, departure_events)
+            if daily_updates:
+                db.bulk_update_mappings(DailyAttendance, daily_updates)
+            if daily_inserts:
+                db.bulk_insert_mappings(DailyAttendance, daily_inserts)
+            db.commit()
+            
+            period = f"{start_date or 'начала истории'} — {end_date}"
+            logger.info(f"Автоматически закрыто {len(departure_events)} записей за период {period}")
+            
+            return len(departure_events)
             
         except Exception as e:
-            logger.error(f"Ошибка автозакрытия дня: {e}")
-            return 0 
\ No newline at end of file
+            db.rollback()
+            logger.error(f"Ошибка автозакрытия дней: {e}")
+            return -1
+    
+    def _worked_minutes(self, arrival_time: Optional[datetime], departure_time: datetime) -> Optional[int]:
+        """Считает отработанные минуты, не допуская отрицательных значений"""
+        if arrival_time is None:
+            return None
+        if (arrival_time.tzinfo is None) != (departure_time.tzinfo is None):
+            arrival_time = arrival_time.replace(tzinfo=departure_time.tzinfo)
+        return max(int((departure_time - arrival_time).total_seconds() // 60), 0)
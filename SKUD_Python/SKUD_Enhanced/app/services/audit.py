@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Сервис журнала аудита (таблица system_logs)
+
+Записи не пишутся в базу в момент события: они складываются в очередь в
+памяти, а фоновый поток сохраняет их пакетами - при накоплении
+AUDIT_BATCH_SIZE записей или раз в AUDIT_FLUSH_INTERVAL секунд. Тот же
+поток периодически удаляет записи старше AUDIT_RETENTION_DAYS.
+
+Поток пишет через собственное соединение (db_manager.get_writer_session),
+а не через общее соединение запросов Flask и бота.
+"""
+
+import atexit
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Dict, Any
+from loguru import logger
+
+from ..config import config
+from ..database import db_manager
+from ..metrics import AUDIT_DROPPED
+from ..models import SystemLog
+
+
+# Как часто удалять устаревшие записи, сек
+PRUNE_INTERVAL_SECONDS = 3600
+
+
+class AuditService:
+    """Сервис пакетной записи журнала аудита"""
+    
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=config.AUDIT_QUEUE_SIZE)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._last_prune_at = 0.0
+        
+        # Статистика
+        self.written_count = 0
+        self.dropped_count = 0
+        self.batches_count = 0
+        self.last_flush_duration = None
+    
+    def log(
+        self,
+        action: str,
+        message: str,
+        level: str = "INFO",
+        module: str = "system",
+        employee_id: int = None,
+        card_id: int = None,
+        extra_data: Optional[Dict[str, Any]] = None,
+        ip_address: str = None,
+        user_agent: str = None
+    ) -> bool:
+        """
+        Ставит запись аудита в очередь (без обращения к базе)
+        
+        Args:
+            action: Действие (card_scan, unknown_card, employee_added, ...)
+            message: Текст записи
+            level: Уровень (INFO, WARNING, ERROR, DEBUG)
+            module: Источник (api, web, bot, ...)
+            employee_id: ID связанного сотрудника
+            card_id: ID связанной карты
+            extra_data: Дополнительные данные (сохраняются как JSON)
+            ip_address: IP адрес клиента
+            user_agent: User-Agent клиента
+        
+        Returns:
+            True если запись поставлена в очередь
+        """
+        if not config.AUDIT_ENABLED:
+            return False
+        
+        self._ensure_started()
+        
+        entry = {
+            "level": level,
+            "module": module,
+            "action": action,
+            "message": message,
+            "employee_id": employee_id,
+            "card_id": card_id,
+            "extra_data": json.dumps(extra_data, ensure_ascii=False, default=str) if extra_data else None,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "created_at": datetime.now(timezone.utc)
+        }
+        
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            self.dropped_count += 1
+            AUDIT_DROPPED.inc()
+            if self.dropped_count % 100 == 1:
+                logger.warning(f"Очередь аудита переполнена, потеряно записей: {self.dropped_count}")
+            return False
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Возвращает статистику журнала аудита"""
+        return {
+            "queue_size": self._queue.qsize(),
+            "written": self.written_count,
+            "dropped": self.dropped_count,
+            "batches": self.batches_count,
+            "last_flush_duration_seconds": self.last_flush_duration
+        }
+    
+    def prune(self, retention_days: int = None) -> int:
+        """
+        Удаляет записи аудита старше retention_days
+        
+        Returns:
+            Количество удаленных записей
+        """
+        retention_days = retention_days or config.AUDIT_RETENTION_DAYS
+        cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+        
+        try:
+            with db_manager.get_writer_session() as session:
+                deleted = session.query(SystemLog).filter(
+                    SystemLog.created_at < cutoff
+                ).delete(synchronize_session=False)
+            
+            if deleted:
+                logger.info(f"Удалено записей аудита старше {retention_days} дней: {deleted}")
+            return deleted
+        
+        except Exception as e:
+            logger.error(f"Ошибка очистки журнала аудита: {e}")
+            return 0
+    
+    def stop(self, timeout: float = 5.0):
+        """Останавливает фоновый поток, сохранив оставшиеся записи"""
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout)
+    
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run,
+                name="audit-writer",
+                daemon=True
+            )
+            self._thread.start()
+    
+    def _run(self):
+        """Цикл фонового потока: собирает пакет и сохраняет его"""
+        batch: List[Dict[str, Any]] = []
+        deadline = time.monotonic() + config.AUDIT_FLUSH_INTERVAL
+        
+        while not self._stop_event.is_set() or not self._queue.empty():
+            try:
+                timeout = max(deadline - time.monotonic(), 0.01)
+                batch.append(self._queue.get(timeout=timeout))
+                
+                # Забираем все, что уже накопилось, не дожидаясь таймаута
+                while len(batch) < config.AUDIT_BATCH_SIZE:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            
+            if len(batch) >= config.AUDIT_BATCH_SIZE or time.monotonic() >= deadline:
+                if batch:
+                    self._write_batch(batch)
+                    batch = []
+                deadline = time.monotonic() + config.AUDIT_FLUSH_INTERVAL
+                self._maybe_prune()
+        
+        if batch:
+            self._write_batch(batch)
+    
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        """Сохраняет пакет одной транзакцией (executemany)"""
+        started_at = time.monotonic()
+        try:
+            with db_manager.get_writer_session() as session:
+                session.bulk_insert_mappings(SystemLog, batch)
+            
+            self.written_count += len(batch)
+            self.batches_count += 1
+            self.last_flush_duration = round(time.monotonic() - started_at, 4)
+        
+        except Exception as e:
+            self.dropped_count += len(batch)
+            AUDIT_DROPPED.inc(len(batch))
+            logger.error(f"Ошибка записи пакета аудита ({len(batch)} записей): {e}")
+    
+    def _maybe_prune(self):
+        now = time.monotonic()
+        if now - self._last_prune_at >= PRUNE_INTERVAL_SECONDS:
+            self._last_prune_at = now
+            self.prune()
+
+
+# Глобальный экземпляр сервиса аудита
+audit_service = AuditService()
+atexit.register(audit_service.stop)
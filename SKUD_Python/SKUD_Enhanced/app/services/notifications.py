@@ -5,18 +5,86 @@
 Сервис для отправки уведомлений
 """
 
+import asyncio
+import inspect
+import time
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict, Callable, Any
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramNetworkError, TelegramServerError
+)
 from loguru import logger
 
+from ..config import config
+from ..metrics import record_notification, NOTIFICATIONS_IN_FLIGHT
 from ..models import Employee, AttendanceEvent, EventType
 
 
+class TokenBucket:
+    """
+    Ограничитель скорости отправки сообщений в Telegram
+    
+    Глобальный token bucket (сообщений в секунду на бота) плюс минимальный
+    интервал между сообщениями в один чат. При получении 429 от Telegram
+    все отправки приостанавливаются на retry_after секунд.
+    """
+    
+    def __init__(self, rate: float, per_chat_interval: float):
+        self.rate = max(rate, 0.1)
+        self.capacity = max(rate, 1.0)
+        self.per_chat_interval = per_chat_interval
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._chat_last_sent: Dict[str, float] = {}
+        self._lock = None
+    
+    def _get_lock(self) -> asyncio.Lock:
+        # Создаем лок лениво, внутри работающего event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+    
+    def pause(self, seconds: float):
+        """Приостанавливает все отправки (ответ 429 с retry_after)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+    
+    async def acquire(self, chat_id: str):
+        """Ожидает, пока отправка в указанный чат станет допустимой"""
+        while True:
+            async with self._get_lock():
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated_at) * self.rate
+                )
+                self._updated_at = now
+                
+                wait = self._paused_until - now
+                chat_ready_at = self._chat_last_sent.get(chat_id, 0.0) + self.per_chat_interval
+                wait = max(wait, chat_ready_at - now)
+                if self._tokens < 1.0:
+                    wait = max(wait, (1.0 - self._tokens) / self.rate)
+                
+                if wait <= 0:
+                    self._tokens -= 1.0
+                    self._chat_last_sent[chat_id] = now
+                    return
+            
+            await asyncio.sleep(wait)
+
+
 class NotificationService:
     """Сервис для управления уведомлениями"""
     
     def __init__(self, bot=None):
         self.bot = bot
+        # Общий для всех рассылок сервиса, чтобы параллельные рассылки не превышали лимиты
+        self.rate_limiter = TokenBucket(
+            rate=config.TELEGRAM_RATE_LIMIT,
+            per_chat_interval=config.TELEGRAM_PER_CHAT_INTERVAL
+        )
     
     async def send_attendance_notification(
         self, 
@@ -222,14 +290,24 @@ class NotificationService:
     async def send_bulk_notification(
         self, 
         employee_ids: List[str], 
-        message: str
+        message: str,
+        concurrency: int = None,
+        max_retries: int = None,
+        progress_callback: Optional[Callable[[int, int], Any]] = None
     ) -> dict:
         """
         Отправляет массовое уведомление сотрудникам
         
+        Сообщения отправляются параллельно (не более concurrency одновременно)
+        с соблюдением лимитов Telegram. Ответ 429 приостанавливает рассылку
+        на retry_after секунд, после чего сообщение отправляется повторно.
+        
         Args:
             employee_ids: Список Telegram ID сотрудников
             message: Текст сообщения
+            concurrency: Максимум одновременных запросов (по умолчанию из конфигурации)
+            max_retries: Количество повторов при 429 и сетевых ошибках
+            progress_callback: Функция (отправлено, всего), может быть корутиной
             
         Returns:
             Словарь со статистикой отправки
@@ -239,34 +317,100 @@ class NotificationService:
                 logger.warning("Telegram бот не инициализирован")
                 return {"success": 0, "failed": len(employee_ids)}
             
-            success_count = 0
-            failed_count = 0
-            
-            for employee_id in employee_ids:
-                try:
-                    await self.bot.send_message(
-                        chat_id=employee_id,
-                        text=message,
-                        parse_mode='HTML'
-                    )
-                    success_count += 1
-                    
-                except Exception as e:
-                    logger.warning(f"Не удалось отправить сообщение {employee_id}: {e}")
-                    failed_count += 1
-            
-            logger.info(f"Массовая рассылка: {success_count} успешно, {failed_count} неудач")
+            concurrency = concurrency or config.BULK_NOTIFICATION_CONCURRENCY
+            if max_retries is None:
+                max_retries = config.BULK_NOTIFICATION_RETRIES
+            
+            total = len(employee_ids)
+            semaphore = asyncio.Semaphore(max(concurrency, 1))
+            stats = {"success": 0, "failed": 0, "retried": 0, "done": 0}
+            failed_ids = []
+            started_at = time.monotonic()
+            
+            async def send_one(employee_id: str):
+                chat_id = str(employee_id)
+                with NOTIFICATIONS_IN_FLIGHT.track_inprogress():
+                    async with semaphore:
+                        sent = await self._send_with_retries(chat_id, message, max_retries, stats)
+                record_notification("bulk", sent)
+                
+                if sent:
+                    stats["success"] += 1
+                else:
+                    stats["failed"] += 1
+                    failed_ids.append(chat_id)
+                stats["done"] += 1
+                
+                if progress_callback:
+                    try:
+                        result = progress_callback(stats["done"], total)
+                        if inspect.isawaitable(result):
+                            await result
+                    except Exception as e:
+                        logger.warning(f"Ошибка в обработчике прогресса рассылки: {e}")
+            
+            await asyncio.gather(*(send_one(employee_id) for employee_id in employee_ids))
+            
+            duration = time.monotonic() - started_at
+            logger.info(
+                f"Массовая рассылка: {stats['success']} успешно, {stats['failed']} неудач, "
+                f"{stats['retried']} повторов за {duration:.1f} с"
+            )
             
             return {
-                "success": success_count,
-                "failed": failed_count,
-                "total": len(employee_ids)
+                "success": stats["success"],
+                "failed": stats["failed"],
+                "total": total,
+                "retried": stats["retried"],
+                "failed_ids": failed_ids,
+                "duration_seconds": round(duration, 2)
             }
             
         except Exception as e:
             logger.error(f"Ошибка массовой рассылки: {e}")
             return {"success": 0, "failed": len(employee_ids), "error": str(e)}
     
+    async def _send_with_retries(
+        self, 
+        chat_id: str, 
+        message: str, 
+        max_retries: int, 
+        stats: dict
+    ) -> bool:
+        """Отправляет одно сообщение рассылки с учетом лимитов и повторами"""
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire(chat_id)
+            try:
+                await self.bot.send_message(
+                    chat_id=chat_id,
+                    text=message,
+                    parse_mode='HTML'
+                )
+                return True
+                
+            except TelegramRetryAfter as e:
+                # Telegram просит подождать - приостанавливаем всю рассылку
+                self.rate_limiter.pause(e.retry_after)
+                error = e
+                
+            except (TelegramNetworkError, TelegramServerError) as e:
+                await asyncio.sleep(min(2 ** attempt, 30))
+                error = e
+                
+            except Exception as e:
+                # Заблокированный бот, несуществующий чат и т.п. - повтор не поможет
+                logger.warning(f"Не удалось отправить сообщение {chat_id}: {e}")
+                return False
+            
+            attempt += 1
+            if attempt > max_retries:
+                logger.warning(f"Не удалось отправить сообщение {chat_id} после {max_retries} повторов: {error}")
+                return False
+            
+            stats["retried"] += 1
+            logger.debug(f"Повтор отправки сообщения {chat_id} ({attempt}/{max_retries}): {error}")
+    
     async def send_report_notification(
         self, 
         employee_id: str, 
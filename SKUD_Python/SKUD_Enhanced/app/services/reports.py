@@ -6,7 +6,10 @@
 """
 
 import os
+import json
 import calendar
+import tempfile
+import threading
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional, Tuple, List, Dict, Any
@@ -15,13 +18,43 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import seaborn as sns
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from loguru import logger
 
 from ..config import config
+from ..metrics import REPORT_GENERATION_SECONDS
 from ..models import Employee, AttendanceEvent, DailyAttendance, EventType
 
 
+# Готовые месячные отчеты: "YYYY-MM" -> файлы и версия данных, по которой
+# они построены. Общий для бота, веб-интерфейса и планировщика
+REPORT_CACHE_FILE = config.REPORTS_DIR / "report_cache.json"
+_report_cache_lock = threading.Lock()
+
+# pyplot хранит текущую фигуру глобально: графики из потока планировщика и
+# из цикла событий бота не должны строиться одновременно
+_chart_lock = threading.Lock()
+
+
+def _atomic_write(path: Path, write):
+    """
+    Пишет файл отчета через временный файл и os.replace: тот же месяц могут
+    одновременно строить бот и планировщик, пока файл отдается пользователю
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        # mkstemp создает файл с правами 0600
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
 class ReportService:
     """Сервис для генерации отчетов"""
     
@@ -40,13 +73,31 @@ class ReportService:
         """
         Генерирует месячный отчет посещаемости
         
+        Если отчет за месяц уже построен по тем же данным (например,
+        предварительной генерацией по расписанию), файлы берутся с диска.
+        
         Returns:
             Tuple[excel_file_path, chart_file_path, period_name]
         """
+        return self.build_monthly_report(db, year, month)
+    
+    def build_monthly_report(
+        self,
+        db: Session,
+        year: int,
+        month: int
+    ) -> Tuple[Optional[str], Optional[str], str]:
+        """Синхронная генерация месячного отчета (для задач в пуле потоков)"""
         try:
             month_name = calendar.month_name[month]
             period_name = f"{month_name} {year}"
             
+            version = self._data_version(db, year, month)
+            cached = self._get_cached_report(year, month, version)
+            if cached:
+                logger.info(f"Отчет за {period_name} взят из кэша")
+                return cached['excel'], cached['chart'], period_name
+            
             logger.info(f"Генерация отчета за {period_name}")
             
             # Получаем данные
@@ -56,15 +107,18 @@ class ReportService:
                 logger.warning(f"Нет данных за {period_name}")
                 return None, None, period_name
             
-            # Создаем DataFrame
-            df = pd.DataFrame(data)
-            
-            # Генерируем Excel отчет
-            excel_file = await self._create_excel_report(df, year, month, period_name)
-            
-            # Генерируем график
-            chart_file = await self._create_chart(df, year, month, period_name)
+            with REPORT_GENERATION_SECONDS.time():
+                # Создаем DataFrame
+                df = pd.DataFrame(data)
+                
+                # Генерируем Excel отчет
+                excel_file = self._create_excel_report(df, year, month, period_name)
+                
+                # Генерируем график
+                with _chart_lock:
+                    chart_file = self._create_chart(df, year, month, period_name)
             
+            self._put_cached_report(year, month, version, excel_file, chart_file)
             logger.success(f"Отчет за {period_name} успешно создан")
             return excel_file, chart_file, period_name
             
@@ -72,6 +126,80 @@ class ReportService:
             logger.error(f"Ошибка при генерации отчета: {e}")
             raise
     
+    def _data_version(self, db: Session, year: int, month: int) -> List[Any]:
+        """
+        Версия данных месяца: число событий, последний id события и время
+        последнего изменения сотрудников (имена попадают в отчет).
+        События не редактируются, поэтому новые и удаленные события меняют версию
+        """
+        start_date = f"{year:04d}-{month:02d}-01"
+        end_date = f"{year:04d}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}"
+        
+        events_count, last_event_id = db.query(
+            func.count(AttendanceEvent.id),
+            func.max(AttendanceEvent.id)
+        ).filter(
+            AttendanceEvent.event_date >= start_date,
+            AttendanceEvent.event_date <= end_date
+        ).one()
+        employees_updated_at = db.query(func.max(Employee.updated_at)).scalar()
+        
+        return [
+            events_count,
+            last_event_id,
+            employees_updated_at.isoformat() if employees_updated_at else None
+        ]
+    
+    def _load_report_cache(self) -> Dict[str, Any]:
+        try:
+            with open(REPORT_CACHE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Кэш отчетов поврежден, начинаем с пустого: {e}")
+            return {}
+    
+    def _get_cached_report(self, year: int, month: int, version: List[Any]) -> Optional[Dict[str, Any]]:
+        """Готовый отчет за месяц, если он построен по той же версии данных и файлы на месте"""
+        with _report_cache_lock:
+            entry = self._load_report_cache().get(f"{year:04d}-{month:02d}")
+        
+        if not entry or entry['version'] != version:
+            return None
+        if not Path(entry['excel']).exists():
+            return None
+        if entry['chart'] and not Path(entry['chart']).exists():
+            return None
+        return entry
+    
+    def _put_cached_report(
+        self,
+        year: int,
+        month: int,
+        version: List[Any],
+        excel_file: str,
+        chart_file: Optional[str]
+    ):
+        """Запоминает построенный отчет (атомарная замена файла кэша)"""
+        with _report_cache_lock:
+            cache = self._load_report_cache()
+            cache[f"{year:04d}-{month:02d}"] = {
+                'version': version,
+                'excel': excel_file,
+                'chart': chart_file,
+                'generated_at': datetime.now().isoformat(timespec='seconds')
+            }
+            
+            fd, tmp_path = tempfile.mkstemp(dir=REPORT_CACHE_FILE.parent, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(cache, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, REPORT_CACHE_FILE)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+    
     def _get_monthly_data(self, db: Session, year: int, month: int) -> List[Dict[str, Any]]:
         """Получает данные посещаемости за месяц"""
         try:
@@ -157,7 +285,7 @@ class ReportService:
         except:
             return False
     
-    async def _create_excel_report(
+    def _create_excel_report(
         self, 
         df: pd.DataFrame, 
         year: int, 
@@ -174,25 +302,7 @@ class ReportService:
             filename = f"attendance_report_{year}_{month:02d}_{calendar.month_name[month]}.xlsx"
             filepath = reports_dir / filename
             
-            with pd.ExcelWriter(filepath, engine='xlsxwriter') as writer:
-                # Сводный отчет
-                summary = self._create_summary_data(df)
-                summary.to_excel(writer, sheet_name='Сводный отчет', index=False)
-                
-                # Детальный отчет
-                detailed = self._prepare_detailed_data(df)
-                detailed.to_excel(writer, sheet_name='Детальный отчет', index=False)
-                
-                # Получаем объекты для форматирования
-                workbook = writer.book
-                
-                # Форматирование сводного отчета
-                if 'Сводный отчет' in writer.sheets:
-                    self._format_summary_sheet(writer.sheets['Сводный отчет'], workbook)
-                
-                # Форматирование детального отчета
-                if 'Детальный отчет' in writer.sheets:
-                    self._format_detailed_sheet(writer.sheets['Детальный отчет'], workbook)
+            _atomic_write(filepath, lambda f: self._write_excel_report(f, df))
             
             logger.info(f"Excel отчет создан: {filepath}")
             return str(filepath)
@@ -201,6 +311,28 @@ class ReportService:
             logger.error(f"Ошибка создания Excel отчета: {e}")
             raise
     
+    def _write_excel_report(self, f, df: pd.DataFrame):
+        """Записывает листы Excel отчета в открытый файл"""
+        with pd.ExcelWriter(f, engine='xlsxwriter') as writer:
+            # Сводный отчет
+            summary = self._create_summary_data(df)
+            summary.to_excel(writer, sheet_name='Сводный отчет', index=False)
+            
+            # Детальный отчет
+            detailed = self._prepare_detailed_data(df)
+            detailed.to_excel(writer, sheet_name='Детальный отчет', index=False)
+            
+            # Получаем объекты для форматирования
+            workbook = writer.book
+            
+            # Форматирование сводного отчета
+            if 'Сводный отчет' in writer.sheets:
+                self._format_summary_sheet(writer.sheets['Сводный отчет'], workbook)
+            
+            # Форматирование детального отчета
+            if 'Детальный отчет' in writer.sheets:
+                self._format_detailed_sheet(writer.sheets['Детальный отчет'], workbook)
+    
     def _create_summary_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """Создает сводные данные по сотрудникам"""
         if df.empty:
@@ -293,7 +425,7 @@ class ReportService:
         except Exception as e:
             logger.warning(f"Ошибка форматирования детального отчета: {e}")
     
-    async def _create_chart(
+    def _create_chart(
         self, 
         df: pd.DataFrame, 
         year: int, 
@@ -342,7 +474,7 @@ class ReportService:
             chart_filename = f"chart_{year}_{month:02d}.png"
             chart_filepath = config.REPORTS_DIR / chart_filename
             
-            plt.savefig(chart_filepath, dpi=300, bbox_inches='tight')
+            _atomic_write(chart_filepath, lambda f: plt.savefig(f, format='png', dpi=300, bbox_inches='tight'))
             plt.close()
             
             logger.info(f"График создан: {chart_filepath}")
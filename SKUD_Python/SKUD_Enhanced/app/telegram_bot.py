@@ -6,6 +6,7 @@ Telegram бот для системы СКУД Enhanced на Aiogram 3.x
 """
 
 import asyncio
+import hashlib
 import json
 import secrets
 from datetime import datetime, timedelta
@@ -13,6 +14,8 @@ from typing import Optional, List
 
 from aiogram import Bot, Dispatcher, Router, F
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from aiogram.filters import Command, CommandStart, StateFilter
 from aiogram.fsm.context import FSMContext
@@ -28,6 +31,8 @@ from sqlalchemy.orm import Session
 
 from .config import config
 from .database import get_db, db_manager
+from .profiling import profiling_middleware
+from .metrics import stage_timer, record_notification, NOTIFICATIONS_IN_FLIGHT, STAGE_NOTIFY_SEND
 from .models import (
     Employee, RFIDCard, AttendanceEvent, RegistrationRequest,
     UserRole, EventType, get_card_by_serial, create_attendance_event
@@ -35,6 +40,7 @@ from .models import (
 from .services.reports import ReportService
 from .services.registration import RegistrationService
 from .services.notifications import NotificationService
+from .services.audit import audit_service
 
 
 class RegistrationStates(StatesGroup):
@@ -50,16 +56,20 @@ class AddEmployeeStates(StatesGroup):
     waiting_for_telegram_id = State()
 
 
-# Инициализация бота
+# Инициализация бота (TELEGRAM_API_URL - другой сервер Bot API, например для тестов)
 bot = Bot(
     token=config.TELEGRAM_BOT_TOKEN,
-    default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    session=AiohttpSession(
+        api=TelegramAPIServer.from_base(config.TELEGRAM_API_URL.rstrip('/'))
+    ) if config.TELEGRAM_API_URL else None
 )
 
 # Создаем диспетчер и роутер
 dp = Dispatcher(storage=MemoryStorage())
 router = Router()
 dp.include_router(router)
+dp.update.outer_middleware(profiling_middleware)
 
 # Сервисы
 report_service = ReportService()
@@ -260,6 +270,14 @@ async def add_employee_with_card(message: Message, db: Session, serial: str, nam
         
         await message.answer(success_text)
         logger.info(f"Администратор добавил сотрудника: {name} с картой {serial}")
+        audit_service.log(
+            "employee_added",
+            f"Администратор добавил сотрудника: {name} с картой {serial}",
+            module="bot",
+            employee_id=employee.id,
+            card_id=card.id,
+            extra_data={"admin_telegram_id": str(message.from_user.id)}
+        )
         
     except Exception as e:
         logger.error(f"Ошибка при добавлении сотрудника: {e}")
@@ -584,14 +602,17 @@ async def send_attendance_notification(employee: Employee, event: AttendanceEven
     message_text += f"📅 Дата: {date_str}\n"
     message_text += f"💳 Карта: <code>{card.serial_number}</code>"
     
-    try:
-        await bot.send_message(
-            chat_id=employee.telegram_id,
-            text=message_text
-        )
-        logger.info(f"Отправлено уведомление сотруднику {employee.name} ({employee.telegram_id})")
-    except Exception as e:
-        logger.error(f"Ошибка при отправке уведомления сотруднику {employee.name}: {e}")
+    with NOTIFICATIONS_IN_FLIGHT.track_inprogress(), stage_timer(STAGE_NOTIFY_SEND):
+        try:
+            await bot.send_message(
+                chat_id=employee.telegram_id,
+                text=message_text
+            )
+            record_notification("attendance", True)
+            logger.info(f"Отправлено уведомление сотруднику {employee.name} ({employee.telegram_id})")
+        except Exception as e:
+            record_notification("attendance", False)
+            logger.error(f"Ошибка при отправке уведомления сотруднику {employee.name}: {e}")
 
 
 async def send_admin_notification(message_text: str):
@@ -599,14 +620,17 @@ async def send_admin_notification(message_text: str):
     if not config.TELEGRAM_ADMIN_ID:
         return
     
-    try:
-        await bot.send_message(
-            chat_id=config.TELEGRAM_ADMIN_ID,
-            text=message_text
-        )
-        logger.info("Отправлено уведомление администратору")
-    except Exception as e:
-        logger.error(f"Ошибка при отправке уведомления администратору: {e}")
+    with NOTIFICATIONS_IN_FLIGHT.track_inprogress(), stage_timer(STAGE_NOTIFY_SEND):
+        try:
+            await bot.send_message(
+                chat_id=config.TELEGRAM_ADMIN_ID,
+                text=message_text
+            )
+            record_notification("admin", True)
+            logger.info("Отправлено уведомление администратору")
+        except Exception as e:
+            record_notification("admin", False)
+            logger.error(f"Ошибка при отправке уведомления администратору: {e}")
 
 
 async def send_unknown_card_notification(serial: str, timestamp: datetime):
@@ -635,15 +659,18 @@ async def send_unknown_card_notification(serial: str, timestamp: datetime):
     message_text += f"⏰ Время: {local_time}\n\n"
     message_text += f"Выберите действие:"
     
-    try:
-        await bot.send_message(
-            chat_id=config.TELEGRAM_ADMIN_ID,
-            text=message_text,
-            reply_markup=builder.as_markup()
-        )
-        logger.info(f"Отправлено уведомление о неизвестной карте: {serial}")
-    except Exception as e:
-        logger.error(f"Ошибка при отправке уведомления о неизвестной карте: {e}")
+    with NOTIFICATIONS_IN_FLIGHT.track_inprogress(), stage_timer(STAGE_NOTIFY_SEND):
+        try:
+            await bot.send_message(
+                chat_id=config.TELEGRAM_ADMIN_ID,
+                text=message_text,
+                reply_markup=builder.as_markup()
+            )
+            record_notification("unknown_card", True)
+            logger.info(f"Отправлено уведомление о неизвестной карте: {serial}")
+        except Exception as e:
+            record_notification("unknown_card", False)
+            logger.error(f"Ошибка при отправке уведомления о неизвестной карте: {e}")
 
 
 async def start_bot():
@@ -655,9 +682,6 @@ async def start_bot():
         
         logger.info("Запуск Telegram бота СКУД Enhanced...")
         
-        # Удаляем вебхук если есть
-        await bot.delete_webhook(drop_pending_updates=True)
-        
         # Получаем информацию о боте
         bot_info = await bot.get_me()
         logger.info(f"Бот запущен: @{bot_info.username} ({bot_info.full_name})")
@@ -674,6 +698,16 @@ async def start_bot():
             except Exception as e:
                 logger.warning(f"Не удалось отправить уведомление о запуске: {e}")
         
+        if config.TELEGRAM_UPDATES_MODE == 'webhook':
+            if await _set_webhook():
+                await _serve_webhook()
+                return
+            # Вебхук не установлен: принимаем обновления через polling, не теряя накопленные
+            await bot.delete_webhook()
+        else:
+            # Удаляем вебхук если есть
+            await bot.delete_webhook(drop_pending_updates=True)
+        
         # Запускаем polling
         await dp.start_polling(bot)
         
@@ -682,6 +716,75 @@ async def start_bot():
         raise
 
 
+# Цикл событий бота в режиме вебхука: маршрут Flask (другой поток) передает в него обновления
+_webhook_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def webhook_secret() -> str:
+    """Секрет вебхука: TELEGRAM_WEBHOOK_SECRET или производный от токена бота"""
+    if config.TELEGRAM_WEBHOOK_SECRET:
+        return config.TELEGRAM_WEBHOOK_SECRET
+    return hashlib.sha256(config.TELEGRAM_BOT_TOKEN.encode('utf-8')).hexdigest()
+
+
+async def _set_webhook() -> bool:
+    """Устанавливает вебхук; False, если это не удалось"""
+    if not config.TELEGRAM_WEBHOOK_URL:
+        logger.warning("TELEGRAM_WEBHOOK_URL не задан, обновления принимаются через polling")
+        return False
+    
+    url = config.TELEGRAM_WEBHOOK_URL.rstrip('/') + config.TELEGRAM_WEBHOOK_PATH
+    try:
+        await bot.set_webhook(
+            url,
+            secret_token=webhook_secret(),
+            allowed_updates=dp.resolve_used_update_types()
+        )
+    except Exception as e:
+        logger.warning(f"Не удалось установить вебхук {url}: {e}; переходим на polling")
+        return False
+    
+    logger.info(f"Вебхук установлен: {url}")
+    return True
+
+
+async def _serve_webhook():
+    """Принимает обновления через вебхук до отмены задачи бота"""
+    global _webhook_loop
+    
+    workflow_data = {"dispatcher": dp, **dp.workflow_data}
+    await dp.emit_startup(bot=bot, **workflow_data)
+    _webhook_loop = asyncio.get_running_loop()
+    try:
+        # Обновления приходят через feed_webhook_update, задача только ждет остановки
+        await asyncio.Event().wait()
+    finally:
+        # Вебхук не удаляется: пока система перезапускается, Telegram копит обновления
+        _webhook_loop = None
+        await dp.emit_shutdown(bot=bot, **workflow_data)
+
+
+def feed_webhook_update(update: dict) -> bool:
+    """
+    Передает обновление из маршрута вебхука (поток Flask) в цикл событий бота
+    
+    Обработка идет в фоне, Telegram сразу получает ответ. Возвращает False,
+    если бот сейчас не принимает обновления через вебхук.
+    """
+    loop = _webhook_loop
+    if loop is None:
+        return False
+    
+    future = asyncio.run_coroutine_threadsafe(dp.feed_raw_update(bot, update), loop)
+    future.add_done_callback(_log_update_error)
+    return True
+
+
+def _log_update_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Ошибка обработки обновления из вебхука: {future.exception()}")
+
+
 async def stop_bot():
     """Останавливает бота"""
     try:
@@ -707,7 +810,7 @@ async def stop_bot():
 
 # Экспорт функций для использования в других модулях
 __all__ = [
-    'bot', 'dp', 'router', 'start_bot', 'stop_bot',
+    'bot', 'dp', 'router', 'start_bot', 'stop_bot', 'feed_webhook_update', 'webhook_secret',
     'send_attendance_notification', 'send_admin_notification', 'send_unknown_card_notification'
 ]
 
@@ -5,6 +5,7 @@
 Скрипт миграции данных из старой системы СКУД в новую Enhanced версию
 """
 
+import argparse
 import os
 import sys
 from pathlib import Path
@@ -12,11 +13,19 @@ from pathlib import Path
 # Добавляем путь к приложению
 sys.path.insert(0, str(Path(__file__).parent))
 
-from app.database import migrate_from_legacy_system
+from app.database import (
+    migrate_from_legacy_system, migrate_from_legacy_system_streaming, validate_legacy_migration
+)
 from loguru import logger
 
 
-def main():
+def main(
+    bulk: bool = False,
+    stream: bool = False,
+    chunk_size: int = 5000,
+    resume: bool = True,
+    validate: bool = False
+):
     """Главная функция миграции"""
     try:
         logger.info("Запуск миграции данных из старой системы СКУД")
@@ -32,7 +41,17 @@ def main():
             return False
         
         # Запускаем миграцию
-        success = migrate_from_legacy_system(legacy_data_dir)
+        if stream:
+            success = migrate_from_legacy_system_streaming(
+                legacy_data_dir,
+                chunk_size=chunk_size,
+                resume=resume,
+                validate=validate
+            )
+        else:
+            success = migrate_from_legacy_system(legacy_data_dir, bulk=bulk, chunk_size=chunk_size)
+            if success and validate:
+                success = validate_legacy_migration(legacy_data_dir, chunk_size)
         
         if success:
             logger.success("✅ Миграция данных завершена успешно!")
@@ -48,5 +67,40 @@ def main():
 
 
 if __name__ == "__main__":
-    success = main()
+    parser = argparse.ArgumentParser(description="Миграция данных из старой системы СКУД")
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="Пакетный режим: вставка событий чанками в одной транзакции"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Потоковый режим: чтение CSV чанками с контрольными точками и продолжением после сбоя"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=5000,
+        help="Размер чанка (строк CSV / событий), по умолчанию 5000"
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Игнорировать контрольную точку и начать потоковую миграцию заново"
+    )
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="Проверить после миграции, что все события перенесены"
+    )
+    args = parser.parse_args()
+    
+    success = main(
+        bulk=args.bulk,
+        stream=args.stream,
+        chunk_size=args.chunk_size,
+        resume=not args.restart,
+        validate=args.validate
+    )
     sys.exit(0 if success else 1) 
\ No newline at end of file
@@ -10,15 +10,19 @@ import asyncio
 import signal
 import sys
 from concurrent.futures import ThreadPoolExecutor
-from threading import Thread
 from datetime import datetime
+from typing import Optional
+from threading import Thread
 from loguru import logger
 
 from app.config import config
-from app.database import init_database, create_initial_data
+from app.database import init_database, create_initial_data, db_manager
 from app.telegram_bot import start_bot, stop_bot
 from app.main import create_app
+from app.scheduler import Scheduler, Job
 from app.services.attendance import AttendanceService
+from app.services.registration import RegistrationService
+from app.services.reports import ReportService
 
 
 class SKUDSystem:
@@ -34,6 +38,11 @@ class SKUDSystem:
         
         # Сервисы
         self.attendance_service = AttendanceService()
+        self.registration_service = RegistrationService()
+        self.report_service = ReportService()
+        
+        # Планировщик задач
+        self.scheduler = self._create_scheduler()
         
         # Настройка обработчиков сигналов
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -117,57 +126,79 @@ class SKUDSystem:
             logger.error(f"Ошибка запуска Flask: {e}")
             raise
     
+    def _create_scheduler(self) -> Scheduler:
+        """Создает планировщик и регистрирует фоновые задачи"""
+        scheduler = Scheduler(executor=self.executor)
+        
+        # Автозакрытие дней в 00:01 (пропущенные дни закрываются при следующем запуске)
+        scheduler.add_job(Job(
+            "auto_close",
+            self._auto_close_job,
+            hour=0,
+            minute=1,
+            enabled=config.AUTO_CLOSE_ENABLED
+        ))
+        
+        # Отчет за закрытый месяц 1-го числа в 00:05, после автозакрытия: первый
+        # запрос отчета администратором получает готовые файлы
+        scheduler.add_job(Job(
+            "prerender_reports",
+            self._prerender_reports_job,
+            day=1,
+            hour=0,
+            minute=5
+        ))
+        
+        # Очистка просроченных запросов регистрации каждый час
+        scheduler.add_job(Job(
+            "cleanup_registrations",
+            self._cleanup_registrations_job,
+            minute=0
+        ))
+        
+        return scheduler
+    
+    def _auto_close_job(self) -> int:
+        """Задача автозакрытия дней (выполняется в пуле потоков)"""
+        with db_manager.get_session() as db:
+            closed_count = self.attendance_service.auto_close_day(db)
+        
+        if closed_count > 0:
+            logger.info(f"Автоматически закрыто {closed_count} дней")
+        return closed_count
+    
+    def _prerender_reports_job(self) -> Optional[str]:
+        """
+        Задача предварительной генерации отчета за прошлый месяц
+        
+        Синхронная: pandas, matplotlib и xlsxwriter работают в пуле потоков
+        планировщика, а не в цикле событий бота
+        """
+        today = datetime.now()
+        year, month = (today.year - 1, 12) if today.month == 1 else (today.year, today.month - 1)
+        
+        with db_manager.get_session() as db:
+            excel_file, _, period_name = self.report_service.build_monthly_report(db, year, month)
+        
+        if excel_file:
+            logger.info(f"Отчет за {period_name} подготовлен заранее")
+        return excel_file
+    
+    async def _cleanup_registrations_job(self) -> int:
+        """Задача очистки просроченных запросов регистрации"""
+        with db_manager.get_session() as db:
+            cleaned_count = await self.registration_service.cleanup_expired_requests(db)
+        
+        if cleaned_count > 0:
+            logger.info(f"Очищено {cleaned_count} просроченных запросов")
+        return cleaned_count
+    
     async def _run_scheduler(self):
         """Планировщик фоновых задач"""
         try:
-            logger.info("Планировщик задач запущен")
-            
-            last_auto_close_date = None
-            last_cleanup_hour = None
-            
-            while self.running:
-                try:
-                    now = datetime.now()
-                    
-                    # Автозакрытие дней в 00:01
-                    if (config.AUTO_CLOSE_ENABLED and 
-                        now.hour == 0 and now.minute <= 5 and 
-                        now.strftime('%Y-%m-%d') != last_auto_close_date):
-                        
-                        logger.info("Выполняется автозакрытие дней...")
-                        
-                        from app.database import get_db
-                        with next(get_db()) as db:
-                            closed_count = await self.attendance_service.auto_close_day(db)
-                            if closed_count > 0:
-                                logger.info(f"Автоматически закрыто {closed_count} дней")
-                        
-                        last_auto_close_date = now.strftime('%Y-%m-%d')
-                    
-                    # Очистка просроченных запросов регистрации каждый час
-                    if now.minute == 0 and now.hour != last_cleanup_hour:
-                        logger.info("Очистка просроченных запросов регистрации...")
-                        
-                        from app.services.registration import RegistrationService
-                        from app.database import get_db
-                        
-                        reg_service = RegistrationService()
-                        with next(get_db()) as db:
-                            cleaned_count = await reg_service.cleanup_expired_requests(db)
-                            if cleaned_count > 0:
-                                logger.info(f"Очищено {cleaned_count} просроченных запросов")
-                        
-                        last_cleanup_hour = now.hour
-                    
-                    # Спим 30 секунд
-                    await asyncio.sleep(30)
-                    
-                except Exception as e:
-                    logger.error(f"Ошибка в планировщике: {e}")
-                    await asyncio.sleep(60)  # Увеличиваем интервал при ошибках
-            
+            await self.scheduler.run()
         except asyncio.CancelledError:
-            logger.info("Планировщик остановлен")
+            pass
         except Exception as e:
             logger.error(f"Критическая ошибка планировщика: {e}")
     
@@ -210,6 +241,7 @@ class SKUDSystem:
             # Останавливаем планировщик
             if self.scheduler_task and not self.scheduler_task.done():
                 logger.info("Остановка планировщика...")
+                self.scheduler.stop()
                 self.scheduler_task.cancel()
                 try:
                     await self.scheduler_task
@@ -2,71 +2,202 @@
 # -*- coding: utf-8 -*-
 
 import os
+import csv
+import io
+import json
+import time
+import shutil
 import logging
-import pandas as pd
+import tempfile
 from datetime import datetime, timedelta
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('auto_close.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 # Настройки
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
 ATTENDANCE_FILE = os.path.join(DATA_DIR, 'attendance.csv')
+STATE_FILE = os.path.join(DATA_DIR, 'auto_close_state.json')
 DEFAULT_END_TIME = "17:00"  # Время автоматического закрытия дня
+INITIAL_BACKFILL_DAYS = 7  # Сколько дней проверять при первом запуске (нет состояния)
+BLOCK_SIZE = 64 * 1024
+PATCH_ATTEMPTS = 3  # Попыток закрытия, если файл дописали во время переписывания хвоста
 
-# Загрузка данных посещаемости
-def load_attendance_data():
-    if os.path.exists(ATTENDANCE_FILE):
-        return pd.read_csv(ATTENDANCE_FILE)
-    else:
-        return pd.DataFrame(columns=['date', 'employee', 'arrival', 'departure'])
+# Файл дописывается по мере сканирования карт, поэтому записи упорядочены по дате
+# и все дни начиная с последнего закрытого находятся в конце файла. Закрытие
+# читает файл с конца только до первой более ранней даты и переписывает этот
+# хвост, не разбирая всю историю.
+
+# Состояние: последняя закрытая дата
+def load_state():
+    if os.path.exists(STATE_FILE):
+        try:
+            with open(STATE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось прочитать состояние автозакрытия: {e}")
+    return {}
 
-# Сохранение данных посещаемости
-def save_attendance_data(df):
-    df.to_csv(ATTENDANCE_FILE, index=False)
+def save_state(state):
+    tmp_path = STATE_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, STATE_FILE)
+
+# Поиск начала хвоста файла, содержащего даты >= start_date
+def find_tail_offset(f, file_size, start_date):
+    start_key = start_date.encode('ascii')
+    position = file_size
+    buffer = b''
+    
+    while position > 0:
+        read_size = min(BLOCK_SIZE, position)
+        position -= read_size
+        f.seek(position)
+        buffer = f.read(read_size) + buffer
+        
+        # Проверяем полные строки с конца; первая строка буфера может быть неполной
+        lines = buffer.split(b'\n')
+        offset = position + len(lines[0]) + 1
+        complete = lines[1:]
+        line_offsets = []
+        for line in complete:
+            line_offsets.append(offset)
+            offset += len(line) + 1
+        
+        for line, line_offset in zip(reversed(complete), reversed(line_offsets)):
+            date_key = line[:10]
+            if len(date_key) == 10 and date_key[4:5] == b'-' and date_key < start_key:
+                return min(line_offset + len(line) + 1, file_size)
+        
+        # Полные строки проверены, для следующего блока оставляем только неполную первую
+        buffer = lines[0]
+    
+    # Дошли до начала файла: хвост начинается после заголовка
+    f.seek(0)
+    header = f.readline()
+    return len(header)
+
+# Переписывание хвоста файла с закрытыми записями
+def patch_tail(start_date, yesterday, end_time):
+    """
+    Закрывает записи за [start_date, yesterday] в хвосте файла
+    
+    Возвращает (закрыто записей, проверено строк) или None, если файл
+    изменился (например, main.py дописал сканирование) до замены: тогда
+    замена не выполняется, чтобы не потерять новые строки.
+    """
+    with open(ATTENDANCE_FILE, 'rb') as f:
+        before = os.fstat(f.fileno())
+        file_size = before.st_size
+        tail_offset = find_tail_offset(f, file_size, start_date)
+        f.seek(tail_offset)
+        tail = f.read(file_size - tail_offset)
+        
+        newline = '\r\n' if b'\r\n' in tail else '\n'
+        rows = list(csv.reader(io.StringIO(tail.decode('utf-8'), newline='')))
+        
+        closed_count = 0
+        for row in rows:
+            if len(row) < 4:
+                continue
+            date, employee, arrival, departure = row[:4]
+            if start_date <= date <= yesterday and arrival and not departure:
+                row[3] = end_time
+                closed_count += 1
+                logger.info(f"Закрыта запись: {employee} на {date}, приход: {arrival}, уход: {end_time}")
+        
+        if closed_count == 0:
+            return closed_count, len(rows)
+        
+        output = io.StringIO()
+        csv.writer(output, lineterminator=newline).writerows(rows)
+        patched_tail = output.getvalue().encode('utf-8')
+        
+        # Атомарная замена: неизменный префикс копируется без разбора из того же
+        # дескриптора, что и хвост, хвост пишется заново
+        fd, tmp_path = tempfile.mkstemp(dir=DATA_DIR, prefix='.attendance_', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                f.seek(0)
+                remaining = tail_offset
+                while remaining > 0:
+                    chunk = f.read(min(BLOCK_SIZE * 16, remaining))
+                    if not chunk:
+                        break
+                    tmp.write(chunk)
+                    remaining -= len(chunk)
+                tmp.write(patched_tail)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            # mkstemp создает файл с правами 0600, сохраняем права исходного
+            shutil.copymode(ATTENDANCE_FILE, tmp_path)
+            
+            after = os.stat(ATTENDANCE_FILE)
+            if (after.st_ino, after.st_size, after.st_mtime_ns) != (before.st_ino, before.st_size, before.st_mtime_ns):
+                os.remove(tmp_path)
+                return None
+            os.replace(tmp_path, ATTENDANCE_FILE)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    return closed_count, len(rows)
 
 # Закрытие незавершенных дней
-def close_unfinished_days():
+def close_unfinished_days(end_time=DEFAULT_END_TIME):
     logger.info("Запуск автоматического закрытия незавершенных дней")
+    started_at = time.monotonic()
     
-    # Загружаем данные посещаемости
-    df = load_attendance_data()
-    
-    if df.empty:
+    if not os.path.exists(ATTENDANCE_FILE):
         logger.info("Нет данных посещаемости")
-        return
+        return 0
     
-    # Получаем текущую дату
-    today = datetime.now().strftime('%Y-%m-%d')
     yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
     
-    # Ищем записи за вчерашний день с приходом, но без ухода
-    mask = (df['date'] == yesterday) & pd.notna(df['arrival']) & pd.isna(df['departure'])
-    unfinished_count = mask.sum()
+    # Закрываем все дни с последнего успешного запуска по вчерашний
+    state = load_state()
+    last_closed = state.get('last_closed_date')
+    if last_closed:
+        start_date = (datetime.strptime(last_closed, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    else:
+        start_date = (datetime.now() - timedelta(days=INITIAL_BACKFILL_DAYS)).strftime('%Y-%m-%d')
     
-    if unfinished_count > 0:
-        logger.info(f"Найдено {unfinished_count} незавершенных записей за {yesterday}")
-        
-        # Заполняем уход временем по умолчанию
-        df.loc[mask, 'departure'] = DEFAULT_END_TIME
-        
-        # Сохраняем обновленные данные
-        save_attendance_data(df)
-        
-        # Выводим информацию о закрытых записях
-        closed_records = df[mask]
-        for _, row in closed_records.iterrows():
-            logger.info(f"Закрыта запись: {row['employee']} на {row['date']}, приход: {row['arrival']}, уход: {DEFAULT_END_TIME}")
+    if start_date > yesterday:
+        logger.info(f"Дни по {yesterday} уже закрыты")
+        return 0
+    
+    for _ in range(PATCH_ATTEMPTS):
+        result = patch_tail(start_date, yesterday, end_time)
+        if result is not None:
+            break
+        logger.info("Файл посещаемости изменился во время закрытия дней, повторяем")
+    else:
+        # Состояние не сохраняем: следующий запуск закроет эти дни
+        logger.warning("Файл посещаемости постоянно меняется, закрытие дней отложено")
+        return 0
+    closed_count, rows_count = result
+    
+    state['last_closed_date'] = yesterday
+    state['last_run_at'] = datetime.now().isoformat(timespec='seconds')
+    save_state(state)
+    
+    elapsed = time.monotonic() - started_at
+    if closed_count > 0:
+        logger.info(f"Закрыто {closed_count} записей за период {start_date} — {yesterday} ({elapsed:.3f} с, проверено строк: {rows_count})")
     else:
-        logger.info(f"Нет незавершенных записей за {yesterday}")
+        logger.info(f"Нет незавершенных записей за период {start_date} — {yesterday} ({elapsed:.3f} с)")
+    
+    return closed_count
 
 if __name__ == '__main__':
-    close_unfinished_days() 
\ No newline at end of file
+    # Настройка логирования только при запуске как скрипта
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('auto_close.log'),
+            logging.StreamHandler()
+        ]
+    )
+    close_unfinished_days()
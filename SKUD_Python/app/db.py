@@ -1,9 +1,16 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+# Импорт модуля не трогает файловую систему: схему создает init_db().
+# Приложение его не вызывает - код, работающий с базой, должен вызвать
+# init_db() до первого обращения (так делают benchmarks/legacy_db.py и
+# benchmarks/scan_ingest.py)
+
 import sqlite3
 import os
 import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
 # Настройка логирования
@@ -13,51 +20,139 @@ logger = logging.getLogger(__name__)
 DB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
 DB_FILE = os.path.join(DB_DIR, 'skud.db')
 
-# Убедимся, что директория существует
-os.makedirs(DB_DIR, exist_ok=True)
+# Сколько ждать снятия блокировки записи другим соединением, мс
+BUSY_TIMEOUT_MS = 5000
+
+# Сколько строк iter_attendance читает из курсора за раз
+ATTENDANCE_BATCH_SIZE = 1000
+
+# Соединение у каждого потока свое: sqlite3.Connection нельзя делить между потоками
+_local = threading.local()
+
+def get_connection():
+    """
+    Постоянное соединение текущего потока (открывается при первом вызове)
+    
+    Returns:
+        sqlite3.Connection: Соединение в режиме WAL с row_factory = sqlite3.Row
+    """
+    conn = getattr(_local, 'conn', None)
+    # DB_FILE могли переназначить (тесты, бенчмарки) - переоткрываем
+    if conn is not None and _local.path == DB_FILE:
+        return conn
+    close_connection()
+    
+    # Убедимся, что директория существует
+    os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
+    
+    # isolation_level=None: транзакции открываются явно в _transaction
+    conn = sqlite3.connect(DB_FILE, isolation_level=None, timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.row_factory = sqlite3.Row
+    # WAL: читатели не блокируют писателя и наоборот
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    
+    _local.conn = conn
+    _local.path = DB_FILE
+    return conn
+
+def close_connection():
+    """Закрывает соединение текущего потока (например, при завершении потока)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+@contextmanager
+def _transaction(conn):
+    """
+    Транзакция записи: BEGIN IMMEDIATE сразу берет блокировку записи, поэтому
+    чтение и следующая за ним запись не перемежаются с другими писателями
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+def _month_range(year, month):
+    """Полуинтервал дат месяца [первое число, первое число следующего месяца)"""
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
 
 def init_db():
     """
     Инициализация базы данных
     """
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        # Создаем таблицу сотрудников
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS employees (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            serial TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
-        # Создаем таблицу посещаемости
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS attendance (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            employee_id INTEGER NOT NULL,
-            date TEXT NOT NULL,
-            arrival TEXT,
-            departure TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (employee_id) REFERENCES employees (id)
-        )
-        ''')
+        conn = get_connection()
+        with _transaction(conn):
+            # Создаем таблицу сотрудников
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS employees (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                serial TEXT UNIQUE NOT NULL,
+                name TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+            
+            # Создаем таблицу посещаемости
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS attendance (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                employee_id INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                arrival TEXT,
+                departure TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (employee_id) REFERENCES employees (id)
+            )
+            ''')
+            
+            _create_attendance_indexes(conn)
         
-        conn.commit()
         logger.info("База данных инициализирована")
         return True
     except Exception as e:
         logger.error(f"Ошибка при инициализации базы данных: {str(e)}")
         return False
-    finally:
-        if conn:
-            conn.close()
+
+def _create_attendance_indexes(conn):
+    """Индексы посещаемости: уникальный (employee_id, date) и по дате"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_attendance_employee_date'"
+    ).fetchone()
+    
+    if not exists:
+        # В базах, созданных до индекса, могли накопиться дубли записей за день:
+        # сводим их в самую раннюю (первый приход, последний уход)
+        conn.execute('''
+            UPDATE attendance SET
+                arrival = (SELECT MIN(d.arrival) FROM attendance d
+                           WHERE d.employee_id = attendance.employee_id AND d.date = attendance.date),
+                departure = (SELECT MAX(d.departure) FROM attendance d
+                             WHERE d.employee_id = attendance.employee_id AND d.date = attendance.date)
+            WHERE id IN (SELECT MIN(id) FROM attendance GROUP BY employee_id, date HAVING COUNT(*) > 1)
+        ''')
+        removed = conn.execute('''
+            DELETE FROM attendance
+            WHERE id NOT IN (SELECT MIN(id) FROM attendance GROUP BY employee_id, date)
+        ''').rowcount
+        if removed:
+            logger.warning(f"Объединены дублирующиеся записи посещаемости: удалено {removed}")
+        
+        conn.execute("CREATE UNIQUE INDEX idx_attendance_employee_date ON attendance (employee_id, date)")
+    
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance (date)")
 
 def add_employee(serial, name):
     """
@@ -66,41 +161,35 @@ def add_employee(serial, name):
     Args:
         serial (str): Серийный номер карты
         name (str): Имя сотрудника
-        
+    
     Returns:
         bool: Результат операции
     """
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        # Проверяем, существует ли уже такой серийный номер
-        cursor.execute("SELECT id FROM employees WHERE serial = ?", (serial,))
-        existing = cursor.fetchone()
-        
-        if existing:
-            # Обновляем имя существующего сотрудника
-            cursor.execute(
-                "UPDATE employees SET name = ?, updated_at = ? WHERE serial = ?",
-                (name, datetime.now(), serial)
-            )
-            logger.info(f"Обновлен сотрудник с серийным номером {serial}: {name}")
-        else:
-            # Добавляем нового сотрудника
-            cursor.execute(
-                "INSERT INTO employees (serial, name) VALUES (?, ?)",
-                (serial, name)
-            )
-            logger.info(f"Добавлен новый сотрудник: {name} с картой {serial}")
+        conn = get_connection()
+        with _transaction(conn):
+            # Проверяем, существует ли уже такой серийный номер
+            existing = conn.execute("SELECT id FROM employees WHERE serial = ?", (serial,)).fetchone()
+            
+            if existing:
+                # Обновляем имя существующего сотрудника
+                conn.execute(
+                    "UPDATE employees SET name = ?, updated_at = ? WHERE serial = ?",
+                    (name, datetime.now(), serial)
+                )
+                logger.info(f"Обновлен сотрудник с серийным номером {serial}: {name}")
+            else:
+                # Добавляем нового сотрудника
+                conn.execute(
+                    "INSERT INTO employees (serial, name) VALUES (?, ?)",
+                    (serial, name)
+                )
+                logger.info(f"Добавлен новый сотрудник: {name} с картой {serial}")
         
-        conn.commit()
         return True
     except Exception as e:
         logger.error(f"Ошибка при добавлении сотрудника: {str(e)}")
         return False
-    finally:
-        if conn:
-            conn.close()
 
 def get_employee_by_serial(serial):
     """
@@ -108,17 +197,14 @@ def get_employee_by_serial(serial):
     
     Args:
         serial (str): Серийный номер карты
-        
+    
     Returns:
         dict: Информация о сотруднике или None
     """
     try:
-        conn = sqlite3.connect(DB_FILE)
-        conn.row_factory = sqlite3.Row  # Для получения словаря
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT id, serial, name FROM employees WHERE serial = ?", (serial,))
-        row = cursor.fetchone()
+        row = get_connection().execute(
+            "SELECT id, serial, name FROM employees WHERE serial = ?", (serial,)
+        ).fetchone()
         
         if row:
             return dict(row)
@@ -126,78 +212,103 @@ def get_employee_by_serial(serial):
     except Exception as e:
         logger.error(f"Ошибка при получении информации о сотруднике: {str(e)}")
         return None
-    finally:
-        if conn:
-            conn.close()
 
 def record_attendance(employee_id, date, arrival=None, departure=None):
     """
     Запись посещаемости
     
+    Одна транзакция: чтение текущей записи по уникальному индексу
+    (employee_id, date) для определения типа события и upsert.
+    
     Args:
         employee_id (int): ID сотрудника
         date (str): Дата в формате YYYY-MM-DD
         arrival (str, optional): Время прихода в формате HH:MM
         departure (str, optional): Время ухода в формате HH:MM
-        
+    
     Returns:
-        bool: Результат операции
+        tuple: (bool результат операции, тип события или None)
     """
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        # Проверяем, существует ли запись за этот день
-        cursor.execute(
-            "SELECT id, arrival, departure FROM attendance WHERE employee_id = ? AND date = ?",
-            (employee_id, date)
-        )
-        existing = cursor.fetchone()
-        
-        if existing:
-            # Запись существует, обновляем её
-            record_id, existing_arrival, existing_departure = existing
+        conn = get_connection()
+        with _transaction(conn):
+            existing = conn.execute(
+                "SELECT arrival, departure FROM attendance WHERE employee_id = ? AND date = ?",
+                (employee_id, date)
+            ).fetchone()
             
-            if arrival and not existing_arrival:
-                # Записываем приход
-                cursor.execute(
-                    "UPDATE attendance SET arrival = ?, updated_at = ? WHERE id = ?",
-                    (arrival, datetime.now(), record_id)
-                )
+            if existing is None:
+                event_type = 'приход' if arrival else 'уход'
+            elif arrival and not existing['arrival']:
                 event_type = 'приход'
-            elif departure and not existing_departure:
-                # Записываем уход
-                cursor.execute(
-                    "UPDATE attendance SET departure = ?, updated_at = ? WHERE id = ?",
-                    (departure, datetime.now(), record_id)
-                )
+            elif departure and not existing['departure']:
                 event_type = 'уход'
             elif departure:
-                # Обновляем уход
-                cursor.execute(
-                    "UPDATE attendance SET departure = ?, updated_at = ? WHERE id = ?",
-                    (departure, datetime.now(), record_id)
-                )
                 event_type = 'уход (повтор)'
             else:
                 event_type = 'без изменений'
-        else:
-            # Создаем новую запись
-            cursor.execute(
-                "INSERT INTO attendance (employee_id, date, arrival, departure) VALUES (?, ?, ?, ?)",
-                (employee_id, date, arrival, departure)
-            )
-            event_type = 'приход' if arrival else 'уход'
+            
+            if event_type != 'без изменений':
+                # Приход записывается только в пустое поле, уход - если в этом
+                # же сканировании не записывается приход
+                conn.execute('''
+                    INSERT INTO attendance (employee_id, date, arrival, departure)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (employee_id, date) DO UPDATE SET
+                        arrival = COALESCE(attendance.arrival, excluded.arrival),
+                        departure = CASE
+                            WHEN attendance.arrival IS NULL AND excluded.arrival IS NOT NULL
+                                THEN attendance.departure
+                            ELSE COALESCE(excluded.departure, attendance.departure)
+                        END,
+                        updated_at = ?
+                ''', (employee_id, date, arrival, departure, datetime.now()))
         
-        conn.commit()
         logger.info(f"Записано событие: {event_type} для сотрудника ID {employee_id} на {date}")
         return True, event_type
     except Exception as e:
         logger.error(f"Ошибка при записи посещаемости: {str(e)}")
         return False, None
+
+def iter_attendance(start, end, employee=None, batch_size=ATTENDANCE_BATCH_SIZE):
+    """
+    Потоковое чтение посещаемости за период
+    
+    Строки читаются из курсора пачками по batch_size, поэтому память не
+    зависит от длины периода (выгрузки, отчеты, миграция).
+    
+    Args:
+        start (str): Начало периода YYYY-MM-DD (включительно)
+        end (str): Конец периода YYYY-MM-DD (не включительно)
+        employee (str, optional): Имя сотрудника
+        batch_size (int): Размер пачки чтения
+    
+    Yields:
+        dict: Запись посещаемости (id, date, employee, arrival, departure)
+    """
+    query = """
+        SELECT a.id, a.date, e.name as employee, a.arrival, a.departure
+        FROM attendance a
+        JOIN employees e ON a.employee_id = e.id
+        WHERE a.date >= ? AND a.date < ?
+    """
+    params = [start, end]
+    if employee is not None:
+        query += " AND e.name = ?"
+        params.append(employee)
+    query += " ORDER BY a.date, e.name"
+    
+    # В режиме WAL другие потоки могут писать, пока генератор не дочитан
+    cursor = get_connection().execute(query, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
     finally:
-        if conn:
-            conn.close()
+        cursor.close()
 
 def get_monthly_attendance(year, month):
     """
@@ -206,34 +317,13 @@ def get_monthly_attendance(year, month):
     Args:
         year (int): Год
         month (int): Месяц (1-12)
-        
+    
     Returns:
         list: Список записей посещаемости
     """
     try:
-        conn = sqlite3.connect(DB_FILE)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Формируем шаблон для поиска по месяцу (YYYY-MM-%)
-        date_pattern = f"{year:04d}-{month:02d}-%"
-        
-        cursor.execute("""
-            SELECT a.id, a.date, e.name as employee, a.arrival, a.departure
-            FROM attendance a
-            JOIN employees e ON a.employee_id = e.id
-            WHERE a.date LIKE ?
-            ORDER BY a.date, e.name
-        """, (date_pattern,))
-        
-        rows = cursor.fetchall()
-        return [dict(row) for row in rows]
+        # Полуинтервал дат вместо LIKE 'YYYY-MM-%', чтобы работал индекс по дате
+        return list(iter_attendance(*_month_range(year, month)))
     except Exception as e:
         logger.error(f"Ошибка при получении данных посещаемости: {str(e)}")
         return []
-    finally:
-        if conn:
-            conn.close()
-
-# Инициализируем базу данных при импорте модуля
-init_db() 
\ No newline at end of file
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Кэш file_id Telegram для уже отправленных отчетов и графиков
+
+Отправленный файл Telegram хранит у себя и возвращает его file_id: повторная
+отправка по file_id не загружает байты заново. Здесь хранится соответствие
+(вид, путь, sha256 содержимого) -> file_id в data/telegram_file_ids.json,
+поэтому повторный запрос того же отчета отправляется без выгрузки файла.
+Перегенерированный отчет меняет хэш, и его file_id уже не подходит.
+
+Вид ('document' или 'photo') входит в ключ: file_id документа нельзя
+отправить как фото и наоборот.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+FILE_IDS_FILE = os.path.join(DATA_DIR, 'telegram_file_ids.json')
+
+def file_sha256(path):
+    """sha256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class FileIdCache:
+    """(вид, путь, хэш содержимого) -> file_id, с сохранением в JSON"""
+    
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None
+        # Хэши по (mtime_ns, size), чтобы не перечитывать неизменный файл
+        self._hashes = {}
+    
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+            except (OSError, ValueError) as e:
+                logger.warning(f"Кэш file_id поврежден, начинаем с пустого: {e}")
+                self._entries = {}
+        return self._entries
+    
+    def _save(self):
+        # Временный файл и os.replace: прерванная запись не портит кэш
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def _digest(self, file_path):
+        stat = os.stat(file_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._hashes.get(file_path)
+        if cached is None or cached[0] != signature:
+            cached = (signature, file_sha256(file_path))
+            self._hashes[file_path] = cached
+        return cached[1]
+    
+    @staticmethod
+    def _key(kind, file_path):
+        return f"{kind}:{os.path.abspath(file_path)}"
+    
+    def digest(self, file_path):
+        """sha256 содержимого файла или None, если его нет (неизменный файл не перечитывается)"""
+        with self._lock:
+            try:
+                return self._digest(file_path)
+            except OSError:
+                return None
+    
+    def get(self, kind, file_path, digest):
+        """file_id файла, если он уже отправлялся с содержимым digest, иначе None"""
+        if digest is None:
+            return None
+        with self._lock:
+            entry = self._load().get(self._key(kind, file_path))
+            if entry is None:
+                return None
+            return entry['file_id'] if entry['sha256'] == digest else None
+    
+    def put(self, kind, file_path, file_id, digest):
+        """
+        Запоминает file_id отправленного файла
+        
+        digest снимается до отправки: если отчет перегенерировали, пока шла
+        загрузка, file_id старого содержимого не записывается под хэш нового.
+        """
+        if digest is None:
+            return
+        with self._lock:
+            self._load()[self._key(kind, file_path)] = {'sha256': digest, 'file_id': file_id}
+            self._save()
+    
+    def forget(self, kind, file_path):
+        """Удаляет file_id, который Telegram больше не принимает"""
+        with self._lock:
+            if self._load().pop(self._key(kind, file_path), None) is not None:
+                self._save()
+
+telegram_file_ids = FileIdCache(FILE_IDS_FILE)
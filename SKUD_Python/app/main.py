@@ -5,7 +5,7 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
-from flask import Flask, request, jsonify, render_template, redirect, url_for, send_from_directory, flash
+from flask import Flask, Response, request, jsonify, render_template, redirect, url_for, send_from_directory, flash
 import pandas as pd
 import os
 import json
@@ -17,6 +17,16 @@ import calendar
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from metrics import (
+    stage_timer, record_notification, render_metrics,
+    SCAN_REQUESTS, UNKNOWN_CARDS, NOTIFICATIONS_IN_FLIGHT, REPORT_GENERATION_SECONDS,
+    STAGE_PARSE, STAGE_LOOKUP, STAGE_STORAGE_LOAD, STAGE_STORAGE_WRITE, STAGE_NOTIFY_SEND
+)
+from profiling import init_profiling
+from debounce import scan_debouncer
+from report_catalog import report_catalog, recent_reports as recent_reports_from_catalog
+from report_jobs import ReportJobQueue
+
 # Создаем экземпляр Flask
 template_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'templates')
 static_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'static')
@@ -27,6 +37,9 @@ app = Flask(__name__,
 # Устанавливаем секретный ключ для flash сообщений
 app.secret_key = 'skud_secret_key_2025'
 
+# Профилирование по запросу (X-Profile / ?profile=) и по доле выборки
+init_profiling(app)
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -135,55 +148,79 @@ def notify_admin(message):
         spec.loader.exec_module(telegram_bot)
         
         # Вызываем функцию для отправки уведомления
-        telegram_bot.notify_admin(message)
+        with NOTIFICATIONS_IN_FLIGHT.track_inprogress():
+            sent = telegram_bot.notify_admin(message)
+        record_notification('admin', bool(sent))
     except Exception as e:
+        record_notification('admin', False)
         logger.error(f"Ошибка при отправке уведомления администратору: {str(e)}")
 
 # Маршрут для обработки запросов от ESP32
 @app.route('/api/attendance', methods=['POST'])
 def record_attendance():
+    debounce_key = None
     try:
-        data = request.json
-        logger.info(f"Получены данные: {data}")
-        
-        if not data or 'serial' not in data or 'time' not in data:
-            logger.error("Неверный формат данных")
-            return jsonify({
-                'status': 'error',
-                'message': 'Неверный формат данных'
-            }), 400
-        
-        serial = data['serial']
-        timestamp = data['time']
+        with stage_timer(STAGE_PARSE):
+            data = request.json
+            logger.info(f"Получены данные: {data}")
+            
+            if not data or 'serial' not in data or 'time' not in data:
+                logger.error("Неверный формат данных")
+                SCAN_REQUESTS.labels(status='bad_request').inc()
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Неверный формат данных'
+                }), 400
+            
+            serial = data['serial']
+            timestamp = data['time']
+            
+            # Парсим дату и время
+            dt = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+            date_str = dt.strftime('%Y-%m-%d')
+            time_str = dt.strftime('%H:%M')
+        
+        # Повтор того же сканирования (карта у считывателя, ретрай прошивки)
+        # получает ответ первого, без чтения файлов и уведомлений
+        debounce_key = (serial, f"{date_str} {time_str}")
+        cached = scan_debouncer.claim(*debounce_key)
+        if cached:
+            logger.info(f"Повторное сканирование {serial} в {time_str} ({date_str}) пропущено")
+            SCAN_REQUESTS.labels(status='duplicate').inc()
+            payload, status = cached
+            return jsonify(payload), status
         
         # Загружаем список сотрудников
-        employees = load_employees()
+        with stage_timer(STAGE_LOOKUP):
+            employees = load_employees()
         
         # Проверяем, есть ли сотрудник с таким серийным номером
         if serial not in employees:
             logger.warning(f"Неизвестный серийный номер: {serial}")
+            SCAN_REQUESTS.labels(status='unknown').inc()
+            UNKNOWN_CARDS.inc()
             
             # Отправляем уведомление администратору о неизвестной карте
             unknown_card_message = f"СКУД: Обнаружена неизвестная карта: {serial}\n\n" \
                                   f"Для добавления сотрудника отправьте команду:\n" \
                                   f"/add_employee {serial} Имя_Сотрудника"
-            notify_admin(unknown_card_message)
-            
-            return jsonify({
+            response = {
                 'status': 'unknown',
                 'message': f'Неизвестный ключ: {serial}'
-            }), 404
+            }
+            scan_debouncer.complete(*debounce_key, response, 404)
+            
+            with stage_timer(STAGE_NOTIFY_SEND):
+                notify_admin(unknown_card_message)
+            
+            return jsonify(response), 404
         
         employee_name = employees[serial]
         logger.info(f"Сотрудник: {employee_name}")
         
-        # Парсим дату и время
-        dt = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
-        date_str = dt.strftime('%Y-%m-%d')
-        time_str = dt.strftime('%H:%M')
-        
         # Загружаем данные посещаемости
-        df = load_attendance_data()
+        with stage_timer(STAGE_STORAGE_LOAD):
+            df = load_attendance_data()
         
         # Ищем запись для этого сотрудника и даты
         mask = (df['date'] == date_str) & (df['employee'] == employee_name)
@@ -217,26 +254,34 @@ def record_attendance():
             event_type = 'приход'
         
         # Сохраняем обновленные данные
-        save_attendance_data(df)
+        with stage_timer(STAGE_STORAGE_WRITE):
+            save_attendance_data(df)
         
         logger.info(f"Записано событие: {event_type} для {employee_name} в {time_str}")
-        
-        # Отправляем уведомление администратору
-        notification_message = f"СКУД: {employee_name}: {event_type} в {time_str} ({date_str})"
-        notify_admin(notification_message)
-        
-        # Возвращаем ответ
-        return jsonify({
+        SCAN_REQUESTS.labels(status='success').inc()
+        response = {
             'status': 'success',
             'message': 'Данные успешно записаны',
             'employee': employee_name,
             'event': event_type,
             'time': time_str,
             'date': date_str
-        })
+        }
+        scan_debouncer.complete(*debounce_key, response)
+        
+        # Отправляем уведомление администратору
+        notification_message = f"СКУД: {employee_name}: {event_type} в {time_str} ({date_str})"
+        with stage_timer(STAGE_NOTIFY_SEND):
+            notify_admin(notification_message)
+        
+        # Возвращаем ответ
+        return jsonify(response)
         
     except Exception as e:
+        if debounce_key:
+            scan_debouncer.release(*debounce_key)
         logger.exception(f"Ошибка при обработке запроса: {str(e)}")
+        SCAN_REQUESTS.labels(status='error').inc()
         return jsonify({
             'status': 'error',
             'message': f'Внутренняя ошибка сервера: {str(e)}'
@@ -251,6 +296,12 @@ def health_check():
         'message': 'Система СКУД работает нормально'
     })
 
+# Метрики в формате Prometheus
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, mimetype=content_type)
+
 # API для получения текущей статистики (для обновления в реальном времени)
 @app.route('/api/current-stats', methods=['GET'])
 def current_stats():
@@ -555,23 +606,10 @@ def reports():
             logger.error(f"Ошибка при обработке данных для графика по сотрудникам: {str(e)}")
             employee_hours_data = [0] * len(employee_labels)
         
-        # Получаем список последних отчетов
-        reports_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'reports')
-        os.makedirs(reports_dir, exist_ok=True)
-        
+        # Получаем список последних отчетов (из каталога, без обхода директории)
         recent_reports = []
         try:
-            for filename in os.listdir(reports_dir):
-                if filename.endswith('.xlsx') or filename.endswith('.pdf') or filename.endswith('.csv'):
-                    file_path = os.path.join(reports_dir, filename)
-                    recent_reports.append({
-                        'name': filename,
-                        'filename': filename
-                    })
-            
-            # Сортируем отчеты по времени создания (новые в начале)
-            recent_reports.sort(key=lambda x: os.path.getmtime(os.path.join(reports_dir, x['filename'])), reverse=True)
-            recent_reports = recent_reports[:5]  # Только последние 5 отчетов
+            recent_reports = recent_reports_from_catalog(5)
             logger.info(f"Найдено отчетов: {len(recent_reports)}")
         except Exception as e:
             logger.error(f"Ошибка при получении списка отчетов: {str(e)}")
@@ -587,7 +625,8 @@ def reports():
                               recent_reports=recent_reports,
                               weekday_arrival_data=weekday_arrival_data,
                               employee_labels=employee_labels,
-                              employee_hours_data=employee_hours_data)
+                              employee_hours_data=employee_hours_data,
+                              report_job_id=request.args.get('job'))
     except Exception as e:
         logger.exception(f"Критическая ошибка в функции reports(): {str(e)}")
         return f"Ошибка при загрузке страницы отчетов: {str(e)}", 500
@@ -639,23 +678,10 @@ def telegram_reports():
             12: "Декабрь"
         }
         
-        # Получаем список последних отчетов
-        reports_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'reports')
-        os.makedirs(reports_dir, exist_ok=True)
-        
+        # Получаем список последних отчетов (из каталога, без обхода директории)
         recent_reports = []
         try:
-            for filename in os.listdir(reports_dir):
-                if filename.endswith('.xlsx') or filename.endswith('.pdf') or filename.endswith('.csv'):
-                    file_path = os.path.join(reports_dir, filename)
-                    recent_reports.append({
-                        'name': filename,
-                        'filename': filename
-                    })
-            
-            # Сортируем отчеты по времени создания (новые в начале)
-            recent_reports.sort(key=lambda x: os.path.getmtime(os.path.join(reports_dir, x['filename'])), reverse=True)
-            recent_reports = recent_reports[:5]  # Только последние 5 отчетов
+            recent_reports = recent_reports_from_catalog(5)
             logger.info(f"Найдено отчетов: {len(recent_reports)}")
         except Exception as e:
             logger.error(f"Ошибка при получении списка отчетов: {str(e)}")
@@ -672,213 +698,264 @@ def telegram_reports():
         logger.exception(f"Критическая ошибка в функции telegram_reports(): {str(e)}")
         return f"Ошибка при загрузке страницы отчетов: {str(e)}", 500
 
+# Генерация отчета (выполняется в очереди задач, а не в запросе)
+@REPORT_GENERATION_SECONDS.time()
+def build_monthly_report(year, month, progress=lambda stage, percent: None):
+    """
+    Генерирует месячный отчет (Excel и график) в data/reports
+    
+    Args:
+        year (int): Год
+        month (int): Месяц (1-12)
+        progress (callable): progress(этап, процент) по ходу генерации
+    
+    Returns:
+        dict: Период и имена файлов отчета или None, если данных за месяц нет
+    """
+    progress('загрузка данных', 10)
+    # Загружаем данные посещаемости
+    df = load_attendance_data()
+    
+    # Преобразуем даты
+    df['date'] = pd.to_datetime(df['date'])
+    
+    # Фильтруем по году и месяцу
+    mask = (df['date'].dt.year == year) & (df['date'].dt.month == month)
+    monthly_data = df[mask].copy()
+    
+    if monthly_data.empty:
+        return None
+    
+    progress('расчет часов', 30)
+    # Преобразуем время в datetime для расчета разницы
+    monthly_data['arrival_time'] = pd.to_datetime(
+        monthly_data['date'].dt.strftime('%Y-%m-%d') + ' ' + monthly_data['arrival']
+    )
+    monthly_data['departure_time'] = pd.to_datetime(
+        monthly_data['date'].dt.strftime('%Y-%m-%d') + ' ' + monthly_data['departure']
+    )
+    
+    # Обрабатываем случаи, когда уход на следующий день
+    mask = monthly_data['departure_time'] < monthly_data['arrival_time']
+    monthly_data.loc[mask, 'departure_time'] = monthly_data.loc[mask, 'departure_time'] + pd.Timedelta(days=1)
+    
+    # Рассчитываем часы работы
+    monthly_data['hours_worked'] = (monthly_data['departure_time'] - monthly_data['arrival_time']).dt.total_seconds() / 3600
+    
+    # Определяем выходные дни (5=суббота, 6=воскресенье)
+    monthly_data['is_weekend'] = monthly_data['date'].dt.dayofweek >= 5
+    
+    # Создаем сводный отчет по сотрудникам
+    summary = monthly_data.groupby('employee').agg(
+        total_days=('date', 'nunique'),
+        total_hours=('hours_worked', 'sum'),
+        avg_hours=('hours_worked', 'mean')
+    ).reset_index()
+    
+    # Создаем сводные цифры по будням и выходным
+    weekend_data = monthly_data[monthly_data['is_weekend'] == True]
+    weekday_data = monthly_data[monthly_data['is_weekend'] == False]
+    
+    weekend_total_hours = weekend_data['hours_worked'].sum() if not weekend_data.empty else 0
+    weekday_total_hours = weekday_data['hours_worked'].sum() if not weekday_data.empty else 0
+    total_hours = monthly_data['hours_worked'].sum()
+    
+    # Создаем Excel-файл
+    month_name = calendar.month_name[month]
+    file_name = f"attendance_report_{year}_{month:02d}_{month_name}.xlsx"
+    reports_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'reports')
+    os.makedirs(reports_dir, exist_ok=True)
+    file_path = os.path.join(reports_dir, file_name)
+    
+    progress('формирование Excel', 50)
+    with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
+        # Получаем объект workbook
+        workbook = writer.book
+        
+        # Форматы для заголовков
+        header_format = workbook.add_format({
+            'bold': True,
+            'bg_color': '#D9E1F2',
+            'border': 1,
+            'align': 'center'
+        })
+        
+        # Формат для чисел
+        number_format = workbook.add_format({
+            'num_format': '0.0',
+            'border': 1
+        })
+        
+        # Формат для времени
+        time_format = workbook.add_format({
+            'num_format': 'hh:mm',
+            'border': 1
+        })
+        
+        # Формат для даты
+        date_format = workbook.add_format({
+            'num_format': 'yyyy-mm-dd',
+            'border': 1
+        })
+        
+        # Формат для выходных дней
+        weekend_format = workbook.add_format({
+            'bg_color': '#FFCCCC',
+            'border': 1
+        })
+        
+        # 1. Сводный отчет по сотрудникам
+        summary['avg_hours'] = summary['avg_hours'].round(2)
+        summary['total_hours'] = summary['total_hours'].round(2)
+        summary.rename(columns={
+            'employee': 'Сотрудник',
+            'total_days': 'Рабочих дней',
+            'total_hours': 'Всего часов',
+            'avg_hours': 'Средняя продолжительность дня'
+        }, inplace=True)
+        summary.to_excel(writer, sheet_name='Сводный отчет', index=False)
+        
+        # Форматируем сводный отчет
+        summary_sheet = writer.sheets['Сводный отчет']
+        for col_num, value in enumerate(summary.columns.values):
+            summary_sheet.write(0, col_num, value, header_format)
+            summary_sheet.set_column(col_num, col_num, 20)
+        
+        # 2. Детальный отчет с разбивкой по дням
+        detailed = monthly_data[['date', 'employee', 'arrival', 'departure', 'hours_worked', 'is_weekend']].copy()
+        detailed.loc[:, 'date'] = detailed['date'].dt.strftime('%Y-%m-%d')
+        detailed.loc[:, 'hours_worked'] = detailed['hours_worked'].round(2)
+        detailed.rename(columns={
+            'date': 'Дата',
+            'employee': 'Сотрудник',
+            'arrival': 'Приход',
+            'departure': 'Уход',
+            'hours_worked': 'Часов',
+            'is_weekend': 'Выходной'
+        }, inplace=True)
+        detailed.to_excel(writer, sheet_name='Детальный отчет', index=False)
+        
+        # Форматируем детальный отчет
+        detailed_sheet = writer.sheets['Детальный отчет']
+        for col_num, value in enumerate(detailed.columns.values):
+            detailed_sheet.write(0, col_num, value, header_format)
+            detailed_sheet.set_column(col_num, col_num, 15)
+        
+        # Выделяем выходные дни
+        for row_num, is_weekend in enumerate(detailed['Выходной']):
+            if is_weekend:
+                detailed_sheet.set_row(row_num + 1, None, weekend_format)
+        
+        # 3. Сводные цифры по будням и выходным
+        summary_data = pd.DataFrame({
+            'Показатель': ['Общее вых', 'Общее будни', 'Общий итог'],
+            'Часов': [weekend_total_hours, weekday_total_hours, total_hours]
+        })
+        summary_data['Часов'] = summary_data['Часов'].round(2)
+        summary_data.to_excel(writer, sheet_name='Сводные цифры', index=False)
+        
+        # Форматируем сводные цифры
+        summary_sheet = writer.sheets['Сводные цифры']
+        for col_num, value in enumerate(summary_data.columns.values):
+            summary_sheet.write(0, col_num, value, header_format)
+            summary_sheet.set_column(col_num, col_num, 20)
+        
+        # Применяем формат для колонки с часами
+        summary_sheet.set_column(1, 1, 15, number_format)
+    
+    # Создаем график для визуализации
+    progress('построение графика', 80)
+    plt.figure(figsize=(12, 8))
+    sns.set_style("whitegrid")
+    
+    # Создаем подграфики
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
+    
+    # График 1: Отработанные часы по сотрудникам
+    sns.barplot(x='Сотрудник', y='Всего часов', data=summary, ax=ax1)
+    ax1.set_title(f'Отработанные часы за {month_name} {year}')
+    ax1.set_ylabel('Часы')
+    ax1.set_xlabel('Сотрудник')
+    ax1.tick_params(axis='x', rotation=45)
+    
+    # График 2: Сводные цифры по будням и выходным
+    categories = ['Выходные', 'Будни', 'Общий итог']
+    values = [weekend_total_hours, weekday_total_hours, total_hours]
+    colors = ['#FF6B6B', '#4ECDC4', '#45B7D1']
+    
+    bars = ax2.bar(categories, values, color=colors)
+    ax2.set_title(f'Сводные цифры за {month_name} {year}')
+    ax2.set_ylabel('Часы')
+    
+    # Добавляем значения на столбцы
+    for bar, value in zip(bars, values):
+        height = bar.get_height()
+        ax2.text(bar.get_x() + bar.get_width()/2., height + 0.1,
+                f'{value:.1f}', ha='center', va='bottom')
+    
+    plt.tight_layout()
+    
+    # Сохраняем график
+    chart_file = os.path.join(reports_dir, f"chart_{year}_{month:02d}.png")
+    plt.savefig(chart_file, dpi=300, bbox_inches='tight')
+    plt.close()
+    
+    report_catalog.record(year, month, file_path, chart_file, f"{month_name} {year}")
+    
+    logger.info(f"Отчет сгенерирован: {file_path}")
+    return {
+        'period': f"{month_name} {year}",
+        'excel': file_name,
+        'chart': os.path.basename(chart_file)
+    }
+
+# Очередь отчетов: один поток, т.к. pyplot не рассчитан на параллельные графики
+report_jobs = ReportJobQueue(build_monthly_report, workers=1)
+
+def wants_json():
+    """Клиент ждет JSON (fetch со страницы), а не HTML с редиректом"""
+    accept = request.accept_mimetypes
+    return accept.accept_json and not accept.accept_html
+
+def report_job_payload(job):
+    """Статус задачи со ссылками для опроса и скачивания"""
+    data = job.to_dict()
+    data['status_url'] = url_for('report_job_status', job_id=job.id)
+    if job.result:
+        data['download_url'] = url_for('download_report', filename=job.result['excel'])
+    return data
+
 # Маршрут для генерации отчета
 @app.route('/generate_report', methods=['POST'])
 def generate_report():
     try:
         year = int(request.form.get('year'))
         month = int(request.form.get('month'))
-        report_type = request.form.get('report_type', 'excel')
-        
-        if not year or not month:
-            flash('Необходимо указать год и месяц', 'error')
-            return redirect(url_for('reports'))
-        
-        logger.info(f"Генерация отчета за {month}/{year}, тип: {report_type}")
-        
-        # Загружаем данные посещаемости
-        df = load_attendance_data()
-        
-        # Преобразуем даты
-        df['date'] = pd.to_datetime(df['date'])
-        
-        # Фильтруем по году и месяцу
-        mask = (df['date'].dt.year == year) & (df['date'].dt.month == month)
-        monthly_data = df[mask].copy()
-        
-        if monthly_data.empty:
-            flash(f'Нет данных за {calendar.month_name[month]} {year}', 'error')
-            return redirect(url_for('reports'))
-        
-        # Преобразуем время в datetime для расчета разницы
-        monthly_data['arrival_time'] = pd.to_datetime(
-            monthly_data['date'].dt.strftime('%Y-%m-%d') + ' ' + monthly_data['arrival']
-        )
-        monthly_data['departure_time'] = pd.to_datetime(
-            monthly_data['date'].dt.strftime('%Y-%m-%d') + ' ' + monthly_data['departure']
-        )
-        
-        # Обрабатываем случаи, когда уход на следующий день
-        mask = monthly_data['departure_time'] < monthly_data['arrival_time']
-        monthly_data.loc[mask, 'departure_time'] = monthly_data.loc[mask, 'departure_time'] + pd.Timedelta(days=1)
-        
-        # Рассчитываем часы работы
-        monthly_data['hours_worked'] = (monthly_data['departure_time'] - monthly_data['arrival_time']).dt.total_seconds() / 3600
-        
-        # Определяем выходные дни (5=суббота, 6=воскресенье)
-        monthly_data['is_weekend'] = monthly_data['date'].dt.dayofweek >= 5
-        
-        # Создаем сводный отчет по сотрудникам
-        summary = monthly_data.groupby('employee').agg(
-            total_days=('date', 'nunique'),
-            total_hours=('hours_worked', 'sum'),
-            avg_hours=('hours_worked', 'mean')
-        ).reset_index()
-        
-        # Создаем сводные цифры по будням и выходным
-        weekend_data = monthly_data[monthly_data['is_weekend'] == True]
-        weekday_data = monthly_data[monthly_data['is_weekend'] == False]
-        
-        weekend_total_hours = weekend_data['hours_worked'].sum() if not weekend_data.empty else 0
-        weekday_total_hours = weekday_data['hours_worked'].sum() if not weekday_data.empty else 0
-        total_hours = monthly_data['hours_worked'].sum()
-        
-        # Создаем Excel-файл
-        month_name = calendar.month_name[month]
-        file_name = f"attendance_report_{year}_{month:02d}_{month_name}.xlsx"
-        reports_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'reports')
-        os.makedirs(reports_dir, exist_ok=True)
-        file_path = os.path.join(reports_dir, file_name)
-        
-        with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
-            # Получаем объект workbook
-            workbook = writer.book
-            
-            # Форматы для заголовков
-            header_format = workbook.add_format({
-                'bold': True,
-                'bg_color': '#D9E1F2',
-                'border': 1,
-                'align': 'center'
-            })
-            
-            # Формат для чисел
-            number_format = workbook.add_format({
-                'num_format': '0.0',
-                'border': 1
-            })
-            
-            # Формат для времени
-            time_format = workbook.add_format({
-                'num_format': 'hh:mm',
-                'border': 1
-            })
-            
-            # Формат для даты
-            date_format = workbook.add_format({
-                'num_format': 'yyyy-mm-dd',
-                'border': 1
-            })
-            
-            # Формат для выходных дней
-            weekend_format = workbook.add_format({
-                'bg_color': '#FFCCCC',
-                'border': 1
-            })
-            
-            # 1. Сводный отчет по сотрудникам
-            summary['avg_hours'] = summary['avg_hours'].round(2)
-            summary['total_hours'] = summary['total_hours'].round(2)
-            summary.rename(columns={
-                'employee': 'Сотрудник',
-                'total_days': 'Рабочих дней',
-                'total_hours': 'Всего часов',
-                'avg_hours': 'Средняя продолжительность дня'
-            }, inplace=True)
-            summary.to_excel(writer, sheet_name='Сводный отчет', index=False)
-            
-            # Форматируем сводный отчет
-            summary_sheet = writer.sheets['Сводный отчет']
-            for col_num, value in enumerate(summary.columns.values):
-                summary_sheet.write(0, col_num, value, header_format)
-                summary_sheet.set_column(col_num, col_num, 20)
-            
-            # 2. Детальный отчет с разбивкой по дням
-            detailed = monthly_data[['date', 'employee', 'arrival', 'departure', 'hours_worked', 'is_weekend']].copy()
-            detailed.loc[:, 'date'] = detailed['date'].dt.strftime('%Y-%m-%d')
-            detailed.loc[:, 'hours_worked'] = detailed['hours_worked'].round(2)
-            detailed.rename(columns={
-                'date': 'Дата',
-                'employee': 'Сотрудник',
-                'arrival': 'Приход',
-                'departure': 'Уход',
-                'hours_worked': 'Часов',
-                'is_weekend': 'Выходной'
-            }, inplace=True)
-            detailed.to_excel(writer, sheet_name='Детальный отчет', index=False)
-            
-            # Форматируем детальный отчет
-            detailed_sheet = writer.sheets['Детальный отчет']
-            for col_num, value in enumerate(detailed.columns.values):
-                detailed_sheet.write(0, col_num, value, header_format)
-                detailed_sheet.set_column(col_num, col_num, 15)
-            
-            # Выделяем выходные дни
-            for row_num, is_weekend in enumerate(detailed['Выходной']):
-                if is_weekend:
-                    detailed_sheet.set_row(row_num + 1, None, weekend_format)
-            
-            # 3. Сводные цифры по будням и выходным
-            summary_data = pd.DataFrame({
-                'Показатель': ['Общее вых', 'Общее будни', 'Общий итог'],
-                'Часов': [weekend_total_hours, weekday_total_hours, total_hours]
-            })
-            summary_data['Часов'] = summary_data['Часов'].round(2)
-            summary_data.to_excel(writer, sheet_name='Сводные цифры', index=False)
-            
-            # Форматируем сводные цифры
-            summary_sheet = writer.sheets['Сводные цифры']
-            for col_num, value in enumerate(summary_data.columns.values):
-                summary_sheet.write(0, col_num, value, header_format)
-                summary_sheet.set_column(col_num, col_num, 20)
-            
-            # Применяем формат для колонки с часами
-            summary_sheet.set_column(1, 1, 15, number_format)
-        
-        # Создаем график для визуализации
-        plt.figure(figsize=(12, 8))
-        sns.set_style("whitegrid")
-        
-        # Создаем подграфики
-        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
-        
-        # График 1: Отработанные часы по сотрудникам
-        sns.barplot(x='Сотрудник', y='Всего часов', data=summary, ax=ax1)
-        ax1.set_title(f'Отработанные часы за {month_name} {year}')
-        ax1.set_ylabel('Часы')
-        ax1.set_xlabel('Сотрудник')
-        ax1.tick_params(axis='x', rotation=45)
-        
-        # График 2: Сводные цифры по будням и выходным
-        categories = ['Выходные', 'Будни', 'Общий итог']
-        values = [weekend_total_hours, weekday_total_hours, total_hours]
-        colors = ['#FF6B6B', '#4ECDC4', '#45B7D1']
-        
-        bars = ax2.bar(categories, values, color=colors)
-        ax2.set_title(f'Сводные цифры за {month_name} {year}')
-        ax2.set_ylabel('Часы')
-        
-        # Добавляем значения на столбцы
-        for bar, value in zip(bars, values):
-            height = bar.get_height()
-            ax2.text(bar.get_x() + bar.get_width()/2., height + 0.1,
-                    f'{value:.1f}', ha='center', va='bottom')
-        
-        plt.tight_layout()
-        
-        # Сохраняем график
-        chart_file = os.path.join(reports_dir, f"chart_{year}_{month:02d}.png")
-        plt.savefig(chart_file, dpi=300, bbox_inches='tight')
-        plt.close()
-        
-        logger.info(f"Отчет сгенерирован: {file_path}")
-        flash(f'Отчет за {month_name} {year} успешно сгенерирован', 'success')
-        return redirect(url_for('reports'))
-        
-    except Exception as e:
-        logger.exception(f"Ошибка при генерации отчета: {str(e)}")
-        flash(f'Ошибка при генерации отчета: {str(e)}', 'error')
+        if not 1 <= month <= 12:
+            raise ValueError(month)
+    except (TypeError, ValueError):
+        if wants_json():
+            return jsonify({'status': 'error', 'message': 'Необходимо указать год и месяц'}), 400
+        flash('Необходимо указать год и месяц', 'error')
         return redirect(url_for('reports'))
+    
+    report_type = request.form.get('report_type', 'excel')
+    logger.info(f"Генерация отчета за {month}/{year}, тип: {report_type}")
+    
+    # Генерация идет в фоне, страница опрашивает статус задачи
+    job = report_jobs.submit(year, month)
+    
+    if wants_json():
+        return jsonify(report_job_payload(job)), 202
+    return redirect(url_for('reports', job=job.id))
+
+# Статус задачи генерации отчета
+@app.route('/api/report_jobs/<job_id>', methods=['GET'])
+def report_job_status(job_id):
+    job = report_jobs.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Задача не найдена'}), 404
+    return jsonify(report_job_payload(job))
 
 # Маршрут для скачивания отчета
 @app.route('/download_report/<filename>')
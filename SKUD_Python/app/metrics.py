@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Метрики СКУД в формате Prometheus (эндпоинт /metrics)
+Значения собираются в процессе Flask (app/main.py)
+"""
+
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# Этапы обработки сканирования карты в /api/attendance
+STAGE_PARSE = 'parse'
+STAGE_LOOKUP = 'employee_lookup'
+STAGE_STORAGE_LOAD = 'storage_load'
+STAGE_STORAGE_WRITE = 'storage_write'
+STAGE_NOTIFY_SEND = 'notify_send'
+
+SCAN_STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+REPORT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+SCAN_STAGE_SECONDS = Histogram(
+    'skud_scan_stage_seconds',
+    'Время этапа обработки сканирования карты',
+    ['stage'],
+    buckets=SCAN_STAGE_BUCKETS
+)
+SCAN_REQUESTS = Counter(
+    'skud_scan_requests_total',
+    'Запросы /api/attendance по результату',
+    ['status']
+)
+UNKNOWN_CARDS = Counter(
+    'skud_unknown_cards_total',
+    'Сканирования неизвестных карт'
+)
+NOTIFICATIONS = Counter(
+    'skud_notifications_total',
+    'Уведомления Telegram по типу и результату',
+    ['kind', 'result']
+)
+NOTIFICATIONS_IN_FLIGHT = Gauge(
+    'skud_notifications_in_flight',
+    'Уведомления, отправляемые в данный момент'
+)
+REPORT_GENERATION_SECONDS = Histogram(
+    'skud_report_generation_seconds',
+    'Время генерации месячного отчета',
+    buckets=REPORT_BUCKETS
+)
+
+def stage_timer(stage):
+    """Контекстный менеджер, измеряющий длительность этапа сканирования"""
+    return SCAN_STAGE_SECONDS.labels(stage=stage).time()
+
+def record_notification(kind, success):
+    """Учитывает результат отправки уведомления"""
+    NOTIFICATIONS.labels(kind=kind, result='sent' if success else 'failed').inc()
+
+def render_metrics():
+    """Возвращает (тело, content-type) для ответа эндпоинта /metrics"""
+    return generate_latest(), CONTENT_TYPE_LATEST
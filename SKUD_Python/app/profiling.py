@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Профилирование запросов Flask (cProfile)
+
+Запрос профилируется, если в нем передан токен PROFILE_TOKEN (заголовок
+X-Profile или параметр ?profile=), либо случайно с вероятностью
+PROFILE_SAMPLE_RATE. В data/profiles сохраняются .prof (формат pstats,
+открывается snakeviz, конвертируется во flamegraph через flameprof) и .txt
+с топ-N функций по накопленному времени.
+"""
+
+import os
+import io
+import re
+import glob
+import hmac
+import time
+import random
+import pstats
+import cProfile
+import logging
+import threading
+from datetime import datetime
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# Настройки
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+PROFILES_DIR = os.path.join(DATA_DIR, 'profiles')
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_TOP_N = int(os.environ.get('PROFILE_TOP_N', '30'))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', '200'))
+
+# Одновременно активен только один профилировщик (в Python 3.12+ это
+# ограничение интерпретатора)
+_active_lock = threading.Lock()
+
+def should_profile(token=None):
+    """Решает, профилировать ли запрос (по токену или по доле выборки)"""
+    # Сравниваются байты: compare_digest не принимает строки с не-ASCII символами
+    if token and PROFILE_TOKEN and hmac.compare_digest(token.encode('utf-8'), PROFILE_TOKEN.encode('utf-8')):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def start_profile():
+    """Запускает профилировщик; None, если уже идет другое профилирование"""
+    if not _active_lock.acquire(blocking=False):
+        return None
+    
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Профилировщик уже установлен другим инструментом (отладчик, coverage)
+        _active_lock.release()
+        return None
+    return profiler
+
+def finish_profile(profiler, name, duration):
+    """Останавливает профилировщик и сохраняет результат, возвращает путь к .prof"""
+    try:
+        profiler.disable()
+    finally:
+        _active_lock.release()
+    
+    try:
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        safe_name = re.sub(r'[^A-Za-z0-9_-]+', '_', name).strip('_')[:80]
+        base_path = os.path.join(PROFILES_DIR, f"{datetime.now():%Y%m%d_%H%M%S_%f}_{safe_name}")
+        
+        profiler.dump_stats(base_path + '.prof')
+        
+        summary = io.StringIO()
+        summary.write(f"{name}: {duration * 1000:.1f} мс\n\n")
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(PROFILE_TOP_N)
+        with open(base_path + '.txt', 'w', encoding='utf-8') as f:
+            f.write(summary.getvalue())
+        
+        rotate_profiles(PROFILE_KEEP)
+        logger.info(f"Профиль {name} ({duration * 1000:.1f} мс) сохранен: {base_path}.prof")
+        return base_path + '.prof'
+    except Exception as e:
+        logger.error(f"Ошибка сохранения профиля {name}: {str(e)}")
+        return None
+
+def rotate_profiles(keep):
+    """Удаляет старые профили, оставляя keep последних"""
+    profiles = sorted(glob.glob(os.path.join(PROFILES_DIR, '*.prof')), reverse=True)
+    for old_profile in profiles[keep:]:
+        for path in (old_profile, old_profile[:-len('.prof')] + '.txt'):
+            if os.path.exists(path):
+                os.remove(path)
+
+def init_profiling(app):
+    """Подключает профилирование ко всем маршрутам Flask приложения"""
+    @app.before_request
+    def _start_request_profile():
+        token = request.headers.get('X-Profile') or request.args.get('profile')
+        if should_profile(token):
+            g.profiler = start_profile()
+            g.profile_started_at = time.perf_counter()
+    
+    @app.teardown_request
+    def _finish_request_profile(exc):
+        profiler = g.pop('profiler', None)
+        if profiler:
+            duration = time.perf_counter() - g.pop('profile_started_at')
+            finish_profile(profiler, f"{request.method} {request.path}", duration)
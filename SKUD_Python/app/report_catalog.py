@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Каталог месячных отчетов
+
+Индекс data/reports в data/report_catalog.json, который обновляется при
+записи отчета (веб-интерфейсом и ботом): страницы отчетов берут из него
+последние отчеты, а не перебирают директорию с os.stat каждого файла.
+Для каждого периода (YYYY-MM) хранятся файлы отчета (excel, chart),
+название периода, размер и sha256 Excel и время генерации.
+
+Записи хранятся в порядке генерации (последняя - в конце JSON), поэтому
+"последние N отчетов" - это N записей с конца, без сортировки.
+
+Хранение: файлы, которые новый отчет того же периода заменил под другим
+именем, удаляются сразу; отчеты сверх REPORTS_KEEP (дольше всех не
+строившиеся периоды) удаляются вместе с файлами - по данным их можно
+построить заново. Отчеты, лежавшие в data/reports до появления каталога,
+переносятся в него при первом чтении.
+
+Веб-сервер и бот - разные процессы (run.py): изменения каталога
+выполняются под блокировкой fcntl на report_catalog.json.lock, записи
+другого процесса перечитываются по отпечатку JSON. На Windows (нет fcntl)
+блокировка действует только между потоками одного процесса.
+"""
+
+import os
+import re
+import json
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+
+from file_id_cache import file_sha256
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+REPORTS_DIR = os.path.join(DATA_DIR, 'reports')
+REPORT_CATALOG_FILE = os.path.join(DATA_DIR, 'report_catalog.json')
+REPORTS_KEEP = int(os.getenv('REPORTS_KEEP', '36'))  # Сколько отчетов (периодов) хранить, 0 - все
+
+# Имена, под которыми сохраняются отчеты (для переноса существующих)
+REPORT_FILE_PATTERN = re.compile(r'^attendance_report_(\d{4})_(\d{2})_\w+\.xlsx$')
+
+def file_signature(path):
+    """(mtime_ns, размер) файла или None, если его нет"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+class ReportCatalog:
+    """Период -> файлы отчета, их размер, хэш и время генерации"""
+    
+    def __init__(self, path, reports_dir, keep):
+        self.path = path
+        self.reports_dir = reports_dir
+        self.keep = keep
+        self._lock = threading.RLock()
+        self._lock_fd = None
+        self._entries = {}
+        # Отпечаток JSON при последнем чтении: записи другого процесса перечитываются
+        self._loaded_signature = None
+    
+    @contextmanager
+    def _locked(self):
+        """Блокировка каталога между потоками и процессами (реентерабельная)"""
+        with self._lock:
+            # Повторный flock на новом дескрипторе заблокировал бы поток самого себя
+            if fcntl is None or self._lock_fd is not None:
+                yield
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._lock_fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+    
+    def _read(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _load(self):
+        signature = file_signature(self.path)
+        if signature is not None and signature == self._loaded_signature:
+            return self._entries
+        try:
+            self._entries = self._read()
+        except (OSError, ValueError):
+            with self._locked():
+                # Пока ждали блокировку, каталог мог построить другой процесс
+                try:
+                    self._entries = self._read()
+                except FileNotFoundError:
+                    self._entries = self._scan_reports_dir()
+                    self._save()
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Каталог отчетов поврежден, строим заново по {self.reports_dir}: {e}")
+                    self._entries = self._scan_reports_dir()
+                    self._save()
+        self._loaded_signature = file_signature(self.path)
+        return self._entries
+    
+    def _save(self):
+        # Временный файл и os.replace: прерванная запись не портит каталог
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._loaded_signature = file_signature(self.path)
+    
+    def _scan_reports_dir(self):
+        """Записи для отчетов, уже лежащих в директории"""
+        found = []
+        try:
+            filenames = os.listdir(self.reports_dir)
+        except FileNotFoundError:
+            return {}
+        for filename in filenames:
+            match = REPORT_FILE_PATTERN.match(filename)
+            if match:
+                year, month = int(match.group(1)), int(match.group(2))
+                excel = os.path.join(self.reports_dir, filename)
+                chart = os.path.join(self.reports_dir, f"chart_{year}_{month:02d}.png")
+                found.append((os.path.getmtime(excel), year, month, excel, chart if os.path.exists(chart) else None))
+        
+        entries = {}
+        obsolete = set()
+        for mtime, year, month, excel, chart in sorted(found):
+            # Несколько файлов одного периода: остается самый новый
+            obsolete |= self._put(entries, self._key(year, month), self._describe(
+                {'excel': excel, 'chart': chart, 'period': None},
+                generated_at=datetime.fromtimestamp(mtime)
+            ))
+        if entries:
+            logger.info(f"В каталог отчетов перенесено {len(entries)} отчетов из {self.reports_dir}")
+        self._remove_files(obsolete)
+        return entries
+    
+    @staticmethod
+    def _key(year, month):
+        return f"{year:04d}-{month:02d}"
+    
+    @staticmethod
+    def _describe(entry, generated_at=None):
+        """Дополняет запись размером, хэшем Excel и временем генерации (пути - абсолютные)"""
+        return dict(
+            entry,
+            excel=os.path.abspath(entry['excel']),
+            chart=os.path.abspath(entry['chart']) if entry['chart'] else None,
+            size=os.path.getsize(entry['excel']),
+            sha256=file_sha256(entry['excel']),
+            generated_at=(generated_at or datetime.now()).isoformat(timespec='seconds')
+        )
+    
+    @staticmethod
+    def _files(entry):
+        return {path for path in (entry['excel'], entry['chart']) if path}
+    
+    def _put(self, entries, key, entry):
+        """
+        Ставит запись последней и применяет правила хранения к entries;
+        возвращает файлы, которые больше не нужны
+        """
+        obsolete = set()
+        previous = entries.pop(key, None)
+        entries[key] = entry
+        if previous is not None:
+            obsolete |= self._files(previous) - self._files(entry)
+        while self.keep and len(entries) > self.keep:
+            # Первая запись - дольше всех не строившийся период
+            obsolete |= self._files(entries.pop(next(iter(entries))))
+        return obsolete
+    
+    def _remove_files(self, paths):
+        for path in paths:
+            try:
+                os.remove(path)
+                logger.info(f"Удален устаревший файл отчета: {path}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Не удалось удалить файл отчета {path}: {e}")
+    
+    def latest(self, n):
+        """Последние n построенных отчетов, новые в начале"""
+        with self._lock:
+            return list(islice(reversed(self._load().values()), n))
+    
+    def record(self, year, month, excel, chart, period):
+        """Добавляет построенный отчет и применяет правила хранения"""
+        entry = self._describe({'excel': excel, 'chart': chart, 'period': period})
+        with self._locked():
+            obsolete = self._put(self._load(), self._key(year, month), entry)
+            self._save()
+        self._remove_files(obsolete)
+
+report_catalog = ReportCatalog(REPORT_CATALOG_FILE, REPORTS_DIR, REPORTS_KEEP)
+
+def recent_reports(n=5):
+    """Последние отчеты для страниц отчетов: имя файла, размер и время генерации"""
+    reports = []
+    for entry in report_catalog.latest(n):
+        filename = os.path.basename(entry['excel'])
+        reports.append({
+            'name': filename,
+            'filename': filename,
+            'size': entry['size'],
+            'generated_at': entry['generated_at']
+        })
+    return reports
@@ -2,9 +2,11 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
 import logging
 import json
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
+from telegram.error import BadRequest
 from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
 import pandas as pd
 from datetime import datetime, timedelta
@@ -15,6 +17,10 @@ matplotlib.use('Agg')  # Для работы без GUI
 import io
 import seaborn as sns
 
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+from file_id_cache import telegram_file_ids
+from report_catalog import report_catalog
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -299,6 +305,8 @@ def generate_monthly_report(year, month):
     plt.savefig(chart_file, dpi=300, bbox_inches='tight')
     plt.close()
     
+    report_catalog.record(year, month, file_path, chart_file, f"{month_name} {year}")
+    
     logger.info(f"Отчет сгенерирован: {file_path}")
     return file_path, chart_file, f"{month_name} {year}"
 
@@ -705,26 +713,50 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
         
         # Отправляем Excel-файл
-        with open(excel_file, 'rb') as file:
-            await context.bot.send_document(
-                chat_id=query.message.chat_id,
-                document=file,
-                filename=os.path.basename(excel_file),
-                caption=f"📋 Отчет посещаемости за {period}"
-            )
+        await send_file(
+            context.bot, 'document', query.message.chat_id, excel_file,
+            caption=f"📋 Отчет посещаемости за {period}",
+            filename=os.path.basename(excel_file)
+        )
         
         # Отправляем график
-        with open(chart_file, 'rb') as file:
-            await context.bot.send_photo(
-                chat_id=query.message.chat_id,
-                photo=file,
-                caption=f"📊 График отработанных часов за {period}"
-            )
+        await send_file(
+            context.bot, 'photo', query.message.chat_id, chart_file,
+            caption=f"📊 График отработанных часов за {period}"
+        )
     
     elif data == "menu_report":
         # Перенаправляем на команду report
         await report(update, context)
 
+# Отправка отчета или графика с повторным использованием file_id
+async def send_file(bot, kind, chat_id, file_path, caption, filename=None):
+    """
+    Отправляет файл как документ или фото (kind: 'document' или 'photo')
+    
+    Файл, уже отправленный с тем же содержимым, отправляется по file_id без
+    повторной загрузки; после загрузки file_id запоминается под хэшем,
+    снятым до отправки.
+    """
+    send = bot.send_document if kind == 'document' else bot.send_photo
+    extra = {'filename': filename} if kind == 'document' and filename else {}
+    
+    digest = telegram_file_ids.digest(file_path)
+    file_id = telegram_file_ids.get(kind, file_path, digest)
+    if file_id:
+        try:
+            return await send(chat_id=chat_id, caption=caption, **{kind: file_id})
+        except BadRequest as e:
+            logger.warning(f"file_id для {file_path} не принят Telegram, загружаем файл заново: {e}")
+            telegram_file_ids.forget(kind, file_path)
+    
+    with open(file_path, 'rb') as file:
+        sent = await send(chat_id=chat_id, caption=caption, **{kind: file}, **extra)
+    # Для фото Telegram возвращает несколько размеров, последний - исходный
+    uploaded = sent.document if kind == 'document' else sent.photo[-1]
+    telegram_file_ids.put(kind, file_path, uploaded.file_id, digest)
+    return sent
+
 # Обработчик данных от Web App
 async def handle_webapp_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -796,21 +828,17 @@ async def handle_webapp_data(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 await update.message.reply_text(summary_message)
             
             # Отправляем Excel-файл
-            with open(excel_file, 'rb') as file:
-                await context.bot.send_document(
-                    chat_id=update.effective_message.chat_id,
-                    document=file,
-                    filename=os.path.basename(excel_file),
-                    caption=f"📋 Отчет посещаемости за {period}"
-                )
+            await send_file(
+                context.bot, 'document', update.effective_message.chat_id, excel_file,
+                caption=f"📋 Отчет посещаемости за {period}",
+                filename=os.path.basename(excel_file)
+            )
             
             # Отправляем график
-            with open(chart_file, 'rb') as file:
-                await context.bot.send_photo(
-                    chat_id=update.effective_message.chat_id,
-                    photo=file,
-                    caption=f"График отработанных часов за {period}"
-                )
+            await send_file(
+                context.bot, 'photo', update.effective_message.chat_id, chart_file,
+                caption=f"График отработанных часов за {period}"
+            )
         
         elif action == 'view_report':
             report_url = data.get('report_url')
@@ -823,13 +851,11 @@ async def handle_webapp_data(update: Update, context: ContextTypes.DEFAULT_TYPE)
             
             if os.path.exists(file_path):
                 # Отправляем файл пользователю
-                with open(file_path, 'rb') as file:
-                    await context.bot.send_document(
-                        chat_id=update.effective_message.chat_id,
-                        document=file,
-                        filename=filename,
-                        caption=f"Отчет: {filename}"
-                    )
+                await send_file(
+                    context.bot, 'document', update.effective_message.chat_id, file_path,
+                    caption=f"Отчет: {filename}",
+                    filename=filename
+                )
             else:
                 # Если файл не найден, отправляем ссылку
                 await update.message.reply_text(
@@ -891,8 +917,10 @@ async def send_admin_notification(message):
         bot = ApplicationBuilder().token(TELEGRAM_TOKEN).build().bot
         await bot.send_message(chat_id=ADMIN_USER_ID, text=message)
         logger.info(f"Уведомление администратору отправлено: {message}")
+        return True
     except Exception as e:
         logger.error(f"Ошибка при отправке уведомления администратору: {str(e)}")
+        return False
 
 # Синхронная версия для использования из других модулей
 def notify_admin(message):
@@ -909,7 +937,7 @@ def notify_admin(message):
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
     
-    loop.run_until_complete(send_admin_notification(message))
+    return loop.run_until_complete(send_admin_notification(message))
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -3,15 +3,30 @@
 
 import os
 import json
-import pandas as pd
 from datetime import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import logging
 from logging.handlers import RotatingFileHandler
 
+from utils.metrics import (
+    stage_timer, record_notification, render_metrics,
+    SCAN_REQUESTS, UNKNOWN_CARDS, NOTIFICATIONS_IN_FLIGHT,
+    STAGE_PARSE, STAGE_LOOKUP, STAGE_STORAGE_LOAD, STAGE_STORAGE_WRITE, STAGE_NOTIFY_SEND
+)
+from utils.profiling import init_flask_profiling
+from utils.storage import file_lock, write_csv
+from utils.debounce import scan_debouncer
+from utils.lazy import lazy_import
+
+# pandas нужен только при записи сканирования, /api/health его не загружает
+pd = lazy_import('pandas')
+
 # Создаем экземпляр Flask
 app = Flask(__name__)
 
+# Профилирование по запросу (X-Profile / ?profile=) и по доле выборки
+init_flask_profiling(app)
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -28,9 +43,6 @@ DATA_DIR = 'data'
 ATTENDANCE_FILE = os.path.join(DATA_DIR, 'attendance.csv')
 EMPLOYEES_FILE = os.path.join(DATA_DIR, 'employees.json')
 
-# Убедимся, что директория для данных существует
-os.makedirs(DATA_DIR, exist_ok=True)
-
 def load_employees():
     """Загружает список сотрудников из JSON файла"""
     try:
@@ -46,28 +58,43 @@ def load_employees():
         logger.error(f"Ошибка при загрузке сотрудников: {str(e)}")
         return {}
 
+class AttendanceStorageError(Exception):
+    """Не удалось прочитать или записать attendance.csv"""
+
 def load_attendance_data():
-    """Загружает данные посещаемости из CSV файла"""
+    """
+    Загружает данные посещаемости из CSV файла
+    
+    Ошибка чтения не подменяется пустой таблицей: иначе запись события
+    заменила бы всю историю одной строкой. Вместо этого поднимается
+    AttendanceStorageError (отдельный класс: ошибки разбора CSV в pandas -
+    подклассы ValueError, а ValueError в record_attendance означает
+    неверный формат запроса).
+    """
+    if not os.path.exists(ATTENDANCE_FILE):
+        logger.warning(f"Файл посещаемости {ATTENDANCE_FILE} не найден, создаем новый")
+        return pd.DataFrame(columns=['date', 'employee', 'arrival', 'departure'])
     try:
-        if os.path.exists(ATTENDANCE_FILE):
-            df = pd.read_csv(ATTENDANCE_FILE)
-            logger.info(f"Загружено {len(df)} записей посещаемости")
-            return df
-        else:
-            logger.warning(f"Файл посещаемости {ATTENDANCE_FILE} не найден, создаем новый")
-            df = pd.DataFrame(columns=['date', 'employee', 'arrival', 'departure'])
-            return df
+        df = pd.read_csv(ATTENDANCE_FILE)
     except Exception as e:
         logger.error(f"Ошибка при загрузке данных посещаемости: {str(e)}")
-        return pd.DataFrame(columns=['date', 'employee', 'arrival', 'departure'])
+        raise AttendanceStorageError(f"Не удалось прочитать {ATTENDANCE_FILE}: {e}") from e
+    logger.info(f"Загружено {len(df)} записей посещаемости")
+    return df
 
 def save_attendance_data(df):
-    """Сохраняет данные посещаемости в CSV файл"""
+    """
+    Сохраняет данные посещаемости в CSV файл (атомарно, через временный файл)
+    
+    Ошибка записи поднимается (AttendanceStorageError): запрос должен
+    завершиться ошибкой, а не вернуть успех, который запомнит отсев повторов.
+    """
     try:
-        df.to_csv(ATTENDANCE_FILE, index=False)
-        logger.info(f"Данные посещаемости сохранены: {len(df)} записей")
+        write_csv(df, ATTENDANCE_FILE)
     except Exception as e:
         logger.error(f"Ошибка при сохранении данных посещаемости: {str(e)}")
+        raise AttendanceStorageError(f"Не удалось записать {ATTENDANCE_FILE}: {e}") from e
+    logger.info(f"Данные посещаемости сохранены: {len(df)} записей")
 
 def save_new_employee(serial, name):
     """Добавляет нового сотрудника в список"""
@@ -102,14 +129,18 @@ def notify_telegram_bot(message):
         }
         
         # Отправляем HTTP запрос
-        response = requests.post(url, data=data, timeout=10)
+        with NOTIFICATIONS_IN_FLIGHT.track_inprogress():
+            response = requests.post(url, data=data, timeout=10)
         
         if response.status_code == 200:
+            record_notification('admin', True)
             logger.info(f"Уведомление успешно отправлено администратору: {message}")
         else:
+            record_notification('admin', False)
             logger.error(f"Ошибка отправки уведомления: {response.status_code} - {response.text}")
             
     except Exception as e:
+        record_notification('admin', False)
         logger.error(f"Ошибка при отправке уведомления в Telegram: {str(e)}")
 
 
@@ -181,126 +212,165 @@ def send_employee_notification(employee_name, event_type, time_str, date_str, se
         }
         
         # Отправляем HTTP запрос
-        response = requests.post(url, data=data, timeout=10)
+        with NOTIFICATIONS_IN_FLIGHT.track_inprogress():
+            response = requests.post(url, data=data, timeout=10)
         
         if response.status_code == 200:
+            record_notification('employee', True)
             logger.info(f"Уведомление отправлено сотруднику {employee_name} (ID: {employee_telegram_id}): {event_type}")
         else:
+            record_notification('employee', False)
             logger.error(f"Ошибка отправки уведомления сотруднику {employee_name}: {response.status_code} - {response.text}")
             
     except Exception as e:
+        record_notification('employee', False)
         logger.error(f"Ошибка при отправке уведомления сотруднику {employee_name}: {str(e)}")
 
 # Маршрут для обработки запросов от ESP32
 @app.route('/api/attendance', methods=['POST'])
 def record_attendance():
     """Основной API эндпоинт для записи данных от ESP32"""
+    debounce_key = None
     try:
-        data = request.json
-        logger.info(f"Получены данные от ESP32: {data}")
-        
-        # Проверяем формат данных
-        if not data or 'serial' not in data or 'time' not in data:
-            logger.error("Неверный формат данных от ESP32")
-            return jsonify({
-                'status': 'error',
-                'message': 'Неверный формат данных'
-            }), 400
-        
-        serial = data['serial'].upper()
-        timestamp = data['time']
+        with stage_timer(STAGE_PARSE):
+            data = request.json
+            logger.info(f"Получены данные от ESP32: {data}")
+            
+            # Проверяем формат данных
+            if not data or 'serial' not in data or 'time' not in data:
+                logger.error("Неверный формат данных от ESP32")
+                SCAN_REQUESTS.labels(status='bad_request').inc()
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Неверный формат данных'
+                }), 400
+            
+            serial = data['serial'].upper()
+            timestamp = data['time']
+            
+            # Парсим дату и время
+            dt = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+            date_str = dt.strftime('%Y-%m-%d')
+            time_str = dt.strftime('%H:%M')
+        
+        # Повтор того же сканирования (карта у считывателя, ретрай прошивки)
+        # получает ответ первого, без чтения файлов и уведомлений
+        debounce_key = (serial, f"{date_str} {time_str}")
+        cached = scan_debouncer.claim(*debounce_key)
+        if cached:
+            logger.info(f"Повторное сканирование {serial} в {time_str} ({date_str}) пропущено")
+            SCAN_REQUESTS.labels(status='duplicate').inc()
+            payload, status = cached
+            return jsonify(payload), status
         
         # Загружаем список сотрудников
-        employees = load_employees()
+        with stage_timer(STAGE_LOOKUP):
+            employees = load_employees()
         
         # Проверяем, есть ли сотрудник с таким серийным номером
         if serial not in employees:
             logger.warning(f"Неизвестный серийный номер: {serial}")
+            SCAN_REQUESTS.labels(status='unknown').inc()
+            UNKNOWN_CARDS.inc()
             
             # Отправляем уведомление о неизвестной карте
             unknown_card_message = f"СКУД: Обнаружена неизвестная карта: {serial}\\n\\n" \
                                   f"Для добавления сотрудника отправьте команду:\\n" \
                                   f"/add_employee {serial} Имя_Сотрудника"
-            notify_telegram_bot(unknown_card_message)
-            
-            return jsonify({
+            response = {
                 'status': 'unknown',
                 'message': f'Неизвестный ключ: {serial}'
-            }), 404
+            }
+            scan_debouncer.complete(*debounce_key, response, 404)
+            
+            with stage_timer(STAGE_NOTIFY_SEND):
+                notify_telegram_bot(unknown_card_message)
+            
+            return jsonify(response), 404
         
         employee_name = employees[serial]
         logger.info(f"Обработка события для сотрудника: {employee_name}")
         
-        # Парсим дату и время
-        dt = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
-        date_str = dt.strftime('%Y-%m-%d')
-        time_str = dt.strftime('%H:%M')
-        
-        # Загружаем данные посещаемости
-        df = load_attendance_data()
-        
-        # Ищем запись для этого сотрудника и даты
-        mask = (df['date'] == date_str) & (df['employee'] == employee_name)
-        
-        if mask.any():
-            # Запись уже существует
-            row = df.loc[mask].iloc[0]
-            idx = df.loc[mask].index[0]
+        # Чтение-изменение-запись под блокировкой: другие процессы (веб-сервер,
+        # воркеры gunicorn) пишут тот же файл
+        with file_lock(ATTENDANCE_FILE):
+            # Загружаем данные посещаемости
+            with stage_timer(STAGE_STORAGE_LOAD):
+                df = load_attendance_data()
             
-            if pd.isna(row['arrival']) or row['arrival'] == '':
-                # Записываем приход
-                df.at[idx, 'arrival'] = time_str
-                event_type = 'приход'
-            elif pd.isna(row['departure']) or row['departure'] == '':
-                # Записываем уход
-                df.at[idx, 'departure'] = time_str
-                event_type = 'уход'
+            # Ищем запись для этого сотрудника и даты
+            mask = (df['date'] == date_str) & (df['employee'] == employee_name)
+            
+            if mask.any():
+                # Запись уже существует
+                row = df.loc[mask].iloc[0]
+                idx = df.loc[mask].index[0]
+                
+                if pd.isna(row['arrival']) or row['arrival'] == '':
+                    # Записываем приход
+                    df.at[idx, 'arrival'] = time_str
+                    event_type = 'приход'
+                elif pd.isna(row['departure']) or row['departure'] == '':
+                    # Записываем уход
+                    df.at[idx, 'departure'] = time_str
+                    event_type = 'уход'
+                else:
+                    # Обновляем уход (повторное сканирование)
+                    df.at[idx, 'departure'] = time_str
+                    event_type = 'уход (обновлено)'
             else:
-                # Обновляем уход (повторное сканирование)
-                df.at[idx, 'departure'] = time_str
-                event_type = 'уход (обновлено)'
-        else:
-            # Создаем новую запись (первое сканирование = приход)
-            new_row = {
-                'date': date_str,
-                'employee': employee_name,
-                'arrival': time_str,
-                'departure': ''
-            }
-            df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-            event_type = 'приход'
-        
-        # Сохраняем обновленные данные
-        save_attendance_data(df)
+                # Создаем новую запись (первое сканирование = приход)
+                new_row = {
+                    'date': date_str,
+                    'employee': employee_name,
+                    'arrival': time_str,
+                    'departure': ''
+                }
+                df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
+                event_type = 'приход'
+            
+            # Сохраняем обновленные данные
+            with stage_timer(STAGE_STORAGE_WRITE):
+                save_attendance_data(df)
         
         logger.info(f"Записано событие: {event_type} для {employee_name} в {time_str} ({date_str})")
-        
-        # Отправляем простое уведомление администратору
-        notification_message = f"СКУД: {employee_name}: {event_type} в {time_str} ({date_str})"
-        notify_telegram_bot(notification_message)
-        
-        # Отправляем уведомление сотруднику
-        send_employee_notification(employee_name, event_type, time_str, date_str, serial)
-        
-        # Возвращаем ответ ESP32
-        return jsonify({
+        SCAN_REQUESTS.labels(status='success').inc()
+        response = {
             'status': 'success',
             'message': 'Данные успешно записаны',
             'employee': employee_name,
             'event': event_type,
             'time': time_str,
             'date': date_str
-        })
+        }
+        scan_debouncer.complete(*debounce_key, response)
+        
+        with stage_timer(STAGE_NOTIFY_SEND):
+            # Отправляем простое уведомление администратору
+            notification_message = f"СКУД: {employee_name}: {event_type} в {time_str} ({date_str})"
+            notify_telegram_bot(notification_message)
+            
+            # Отправляем уведомление сотруднику
+            send_employee_notification(employee_name, event_type, time_str, date_str, serial)
+        
+        # Возвращаем ответ ESP32
+        return jsonify(response)
         
     except ValueError as e:
+        if debounce_key:
+            scan_debouncer.release(*debounce_key)
         logger.error(f"Ошибка парсинга данных: {str(e)}")
+        SCAN_REQUESTS.labels(status='bad_request').inc()
         return jsonify({
             'status': 'error',
             'message': f'Ошибка формата времени: {str(e)}'
         }), 400
         
     except Exception as e:
+        if debounce_key:
+            scan_debouncer.release(*debounce_key)
         logger.exception(f"Ошибка при обработке запроса от ESP32: {str(e)}")
+        SCAN_REQUESTS.labels(status='error').inc()
         return jsonify({
             'status': 'error',
             'message': f'Внутренняя ошибка сервера: {str(e)}'
@@ -321,6 +391,13 @@ def health_check():
         }
     })
 
+# Метрики в формате Prometheus
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Метрики API сервера (задержки этапов сканирования, уведомления)"""
+    body, content_type = render_metrics()
+    return Response(body, mimetype=content_type)
+
 # API для получения статистики
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
@@ -398,6 +475,9 @@ def add_employee_api():
         }), 500
 
 if __name__ == '__main__':
+    # Убедимся, что директория для данных существует
+    os.makedirs(DATA_DIR, exist_ok=True)
+    
     logger.info("Запуск API сервера СКУД (новая версия)")
     logger.info(f"Рабочая директория: {os.getcwd()}")
     logger.info(f"Файл посещаемости: {ATTENDANCE_FILE}")
@@ -0,0 +1,499 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Асинхронный API сервер СКУД (aiohttp) - вариант api_server.py
+
+Тот же контракт: /api/attendance, /api/health, /api/stats, /api/add_employee
+и /metrics, ответы ESP32 идентичны. Отличия от Flask версии:
+
+- один процесс и один поток событий обслуживают тысячи соединений
+  считывателей, без потока на запрос;
+- запись в attendance.csv выполняет единственная задача-писатель: она
+  собирает накопившиеся сканирования в пачку и применяет их за одно
+  чтение и одну запись файла (в отдельном потоке, под той же блокировкой
+  utils.storage, что и api_server.py/web_server.py);
+- уведомления Telegram отправляются в фоне через общую aiohttp сессию
+  с ограничением одновременных запросов, ответ ESP32 их не ждет.
+
+Запуск вместо api_server.py:
+    python api_server_async.py --port 5001
+
+С TELEGRAM_UPDATES_MODE=webhook здесь же работает Telegram бот: обновления
+приходят на /telegram/webhook (см. utils/telegram_updates.py).
+"""
+
+import os
+import json
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import RotatingFileHandler
+
+import aiohttp
+from aiohttp import web
+
+from config import config
+from utils.metrics import (
+    stage_timer, record_notification, render_metrics,
+    SCAN_REQUESTS, UNKNOWN_CARDS, NOTIFICATIONS_IN_FLIGHT,
+    STAGE_PARSE, STAGE_LOOKUP, STAGE_STORAGE_LOAD, STAGE_STORAGE_WRITE, STAGE_NOTIFY_SEND
+)
+from utils.storage import file_lock, write_csv, atomic_write
+from utils.lazy import lazy_import
+
+# pandas нужен только задаче-писателю, при старте не загружается
+pd = lazy_import('pandas')
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        RotatingFileHandler('api_async.log', maxBytes=10485760, backupCount=5),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Настройки путей (относительно рабочей директории, как в api_server.py)
+DATA_DIR = 'data'
+ATTENDANCE_FILE = os.path.join(DATA_DIR, 'attendance.csv')
+EMPLOYEES_FILE = os.path.join(DATA_DIR, 'employees.json')
+EMPLOYEE_TELEGRAM_FILE = os.path.join(DATA_DIR, 'employee_telegram.json')
+
+COLUMNS = ['date', 'employee', 'arrival', 'departure']
+MAX_BATCH = 500  # Максимум сканирований за одну перезапись файла
+MAX_PARALLEL_NOTIFICATIONS = 20
+TELEGRAM_TIMEOUT = 10
+
+class JsonFileCache:
+    """JSON файл, перечитываемый только после изменения (по mtime)"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+        self.data = {}
+    
+    def get(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self.mtime, self.data = None, {}
+            return self.data
+        
+        if mtime != self.mtime:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+            self.mtime = mtime
+            logger.info(f"Загружено {len(self.data)} записей из {self.path}")
+        return self.data
+
+def load_attendance_data():
+    """Загружает данные посещаемости из CSV файла"""
+    if os.path.exists(ATTENDANCE_FILE):
+        return pd.read_csv(ATTENDANCE_FILE)
+    return pd.DataFrame(columns=COLUMNS)
+
+def apply_scan(df, date_str, employee_name, time_str):
+    """Применяет сканирование к таблице, возвращает (df, тип события)"""
+    mask = (df['date'] == date_str) & (df['employee'] == employee_name)
+    
+    if mask.any():
+        # Запись уже существует
+        idx = df.loc[mask].index[0]
+        row = df.loc[idx]
+        
+        if pd.isna(row['arrival']) or row['arrival'] == '':
+            df.at[idx, 'arrival'] = time_str
+            return df, 'приход'
+        if pd.isna(row['departure']) or row['departure'] == '':
+            df.at[idx, 'departure'] = time_str
+            return df, 'уход'
+        # Обновляем уход (повторное сканирование)
+        df.at[idx, 'departure'] = time_str
+        return df, 'уход (обновлено)'
+    
+    # Создаем новую запись (первое сканирование = приход)
+    new_row = {'date': date_str, 'employee': employee_name, 'arrival': time_str, 'departure': ''}
+    return pd.concat([df, pd.DataFrame([new_row])], ignore_index=True), 'приход'
+
+class AttendanceWriter:
+    """
+    Единственный писатель attendance.csv: сканирования ставятся в очередь,
+    задача забирает все накопившиеся и применяет их за одну перезапись файла
+    """
+    
+    def __init__(self, max_batch=MAX_BATCH):
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue()
+        # Один поток: pandas и файловый ввод-вывод не блокируют цикл событий
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='attendance-writer')
+        self.task = None
+    
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=True)
+    
+    async def submit(self, date_str, employee_name, time_str):
+        """Ставит сканирование в очередь и ждет тип записанного события"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(((date_str, employee_name, time_str), future))
+        return await future
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            
+            try:
+                events = await loop.run_in_executor(self.executor, self._write_batch, [scan for scan, _ in batch])
+            except Exception as e:
+                logger.exception(f"Ошибка записи пачки из {len(batch)} сканирований: {str(e)}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), event_type in zip(batch, events):
+                # Клиент мог отключиться, не дождавшись ответа
+                if not future.done():
+                    future.set_result(event_type)
+    
+    def _write_batch(self, scans):
+        """Чтение-изменение-запись файла для пачки сканирований (в потоке писателя)"""
+        with file_lock(ATTENDANCE_FILE):
+            with stage_timer(STAGE_STORAGE_LOAD):
+                df = load_attendance_data()
+            
+            events = []
+            for date_str, employee_name, time_str in scans:
+                df, event_type = apply_scan(df, date_str, employee_name, time_str)
+                events.append(event_type)
+            
+            with stage_timer(STAGE_STORAGE_WRITE):
+                write_csv(df, ATTENDANCE_FILE)
+        
+        logger.info(f"Записано сканирований: {len(scans)}, строк в файле: {len(df)}")
+        return events
+
+class TelegramNotifier:
+    """Фоновая отправка уведомлений через общую aiohttp сессию"""
+    
+    def __init__(self, token, admin_user_id):
+        self.url = f"https://api.telegram.org/bot{token}/sendMessage"
+        self.admin_user_id = admin_user_id
+        self.session = None
+        self.semaphore = asyncio.Semaphore(MAX_PARALLEL_NOTIFICATIONS)
+        self.tasks = set()
+    
+    async def start(self):
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=TELEGRAM_TIMEOUT))
+    
+    async def stop(self):
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.session:
+            await self.session.close()
+    
+    def notify(self, chat_id, text, kind):
+        """Планирует отправку сообщения, не дожидаясь ее"""
+        task = asyncio.create_task(self._send(chat_id, text, kind))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+    
+    def notify_admin(self, text):
+        if self.admin_user_id:
+            self.notify(self.admin_user_id, text, 'admin')
+    
+    async def _send(self, chat_id, text, kind):
+        async with self.semaphore:
+            try:
+                with NOTIFICATIONS_IN_FLIGHT.track_inprogress(), stage_timer(STAGE_NOTIFY_SEND):
+                    async with self.session.post(self.url, data={
+                        'chat_id': chat_id,
+                        'text': text,
+                        'parse_mode': 'HTML'
+                    }) as response:
+                        success = response.status == 200
+                        if not success:
+                            logger.error(f"Ошибка отправки уведомления ({kind}): {response.status} - {await response.text()}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                success = False
+                logger.error(f"Ошибка при отправке уведомления ({kind}): {str(e)}")
+        
+        record_notification(kind, success)
+
+def employee_message(event_type, time_str, date_str, serial):
+    """Текст уведомления сотруднику (как в api_server.py)"""
+    if event_type == "уход":
+        return f"🔴 До свидания!\n\n" \
+               f"📅 Ваш {event_type} зафиксирован в {time_str}\n" \
+               f"📆 Дата: {date_str}\n" \
+               f"🏷️ Карта: {serial}\n\n" \
+               f"Увидимся завтра! 👋"
+    
+    emoji = "🟢" if event_type == "приход" else "🔴"
+    return f"{emoji} Добро пожаловать!\n\n" \
+           f"📅 Ваш {event_type} зафиксирован в {time_str}\n" \
+           f"📆 Дата: {date_str}\n" \
+           f"🏷️ Карта: {serial}\n\n" \
+           f"Хорошего рабочего дня! 😊"
+
+def json_response(data, status=200):
+    """JSON ответ в том же виде, что и Flask jsonify (ключи по алфавиту, компактно)"""
+    body = json.dumps(data, sort_keys=True, separators=(',', ':')) + '\n'
+    return web.Response(text=body, status=status, content_type='application/json')
+
+routes = web.RouteTableDef()
+
+# Маршрут для обработки запросов от ESP32
+@routes.post('/api/attendance')
+async def record_attendance(request):
+    """Основной API эндпоинт для записи данных от ESP32"""
+    app = request.app
+    try:
+        with stage_timer(STAGE_PARSE):
+            try:
+                data = await request.json()
+            except ValueError:
+                data = None
+            logger.info(f"Получены данные от ESP32: {data}")
+            
+            # Проверяем формат данных
+            if not isinstance(data, dict) or 'serial' not in data or 'time' not in data:
+                logger.error("Неверный формат данных от ESP32")
+                SCAN_REQUESTS.labels(status='bad_request').inc()
+                return json_response({
+                    'status': 'error',
+                    'message': 'Неверный формат данных'
+                }, status=400)
+            
+            serial = data['serial'].upper()
+            
+            # Парсим дату и время
+            dt = datetime.strptime(data['time'], '%Y-%m-%d %H:%M:%S')
+            date_str = dt.strftime('%Y-%m-%d')
+            time_str = dt.strftime('%H:%M')
+        
+        with stage_timer(STAGE_LOOKUP):
+            employees = app['employees'].get()
+        
+        if serial not in employees:
+            logger.warning(f"Неизвестный серийный номер: {serial}")
+            SCAN_REQUESTS.labels(status='unknown').inc()
+            UNKNOWN_CARDS.inc()
+            
+            app['notifier'].notify_admin(
+                f"СКУД: Обнаружена неизвестная карта: {serial}\n\n"
+                f"Для добавления сотрудника отправьте команду:\n"
+                f"/add_employee {serial} Имя_Сотрудника"
+            )
+            return json_response({
+                'status': 'unknown',
+                'message': f'Неизвестный ключ: {serial}'
+            }, status=404)
+        
+        employee_name = employees[serial]
+        event_type = await app['writer'].submit(date_str, employee_name, time_str)
+        
+        logger.info(f"Записано событие: {event_type} для {employee_name} в {time_str} ({date_str})")
+        SCAN_REQUESTS.labels(status='success').inc()
+        
+        notifier = app['notifier']
+        notifier.notify_admin(f"СКУД: {employee_name}: {event_type} в {time_str} ({date_str})")
+        employee_telegram_id = app['employee_telegram'].get().get(employee_name)
+        if employee_telegram_id:
+            notifier.notify(employee_telegram_id, employee_message(event_type, time_str, date_str, serial), 'employee')
+        
+        # Возвращаем ответ ESP32
+        return json_response({
+            'status': 'success',
+            'message': 'Данные успешно записаны',
+            'employee': employee_name,
+            'event': event_type,
+            'time': time_str,
+            'date': date_str
+        })
+    
+    except ValueError as e:
+        logger.error(f"Ошибка парсинга данных: {str(e)}")
+        SCAN_REQUESTS.labels(status='bad_request').inc()
+        return json_response({
+            'status': 'error',
+            'message': f'Ошибка формата времени: {str(e)}'
+        }, status=400)
+    
+    except Exception as e:
+        logger.exception(f"Ошибка при обработке запроса от ESP32: {str(e)}")
+        SCAN_REQUESTS.labels(status='error').inc()
+        return json_response({
+            'status': 'error',
+            'message': f'Внутренняя ошибка сервера: {str(e)}'
+        }, status=500)
+
+# API для проверки работоспособности
+@routes.get('/api/health')
+async def health_check(request):
+    """Проверка работоспособности API"""
+    return json_response({
+        'status': 'ok',
+        'timestamp': datetime.now().isoformat(),
+        'message': 'API СКУД работает нормально',
+        'version': '2.0 (aiogram)',
+        'data_files': {
+            'attendance': os.path.exists(ATTENDANCE_FILE),
+            'employees': os.path.exists(EMPLOYEES_FILE)
+        }
+    })
+
+# Метрики в формате Prometheus
+@routes.get('/metrics')
+async def metrics(request):
+    """Метрики API сервера (задержки этапов сканирования, уведомления)"""
+    body, content_type = render_metrics()
+    # aiohttp не принимает параметры (charset) в content_type
+    return web.Response(body=body, headers={'Content-Type': content_type})
+
+def _collect_stats(employees_count):
+    df = load_attendance_data()
+    today = datetime.now().strftime('%Y-%m-%d')
+    
+    # Записи за сегодня
+    today_records = df[df['date'] == today]
+    
+    # Присутствующие (есть приход, нет ухода)
+    present_count = len(today_records[
+        (today_records['arrival'].notna()) &
+        (today_records['arrival'] != '') &
+        ((today_records['departure'].isna()) | (today_records['departure'] == ''))
+    ])
+    
+    return {
+        'today_present': present_count,
+        'total_employees': employees_count,
+        'total_records': len(df),
+        'today_records': len(today_records),
+        'timestamp': datetime.now().isoformat()
+    }
+
+# API для получения статистики
+@routes.get('/api/stats')
+async def get_stats(request):
+    """Получение статистики посещаемости"""
+    try:
+        employees = request.app['employees'].get()
+        stats = await asyncio.get_running_loop().run_in_executor(None, _collect_stats, len(employees))
+        return json_response(stats)
+    except Exception as e:
+        logger.error(f"Ошибка при получении статистики: {str(e)}")
+        return json_response({
+            'error': 'Ошибка при получении статистики',
+            'timestamp': datetime.now().isoformat()
+        }, status=500)
+
+def _save_new_employee(serial, name):
+    """Добавляет сотрудника в employees.json; False, если карта уже занята"""
+    with file_lock(EMPLOYEES_FILE):
+        employees = {}
+        if os.path.exists(EMPLOYEES_FILE):
+            with open(EMPLOYEES_FILE, 'r', encoding='utf-8') as f:
+                employees = json.load(f)
+        if serial in employees:
+            return False
+        
+        employees[serial] = name
+        atomic_write(EMPLOYEES_FILE, lambda f: json.dump(employees, f, ensure_ascii=False, indent=4))
+        return True
+
+# API для добавления сотрудника (вызывается ботом)
+@routes.post('/api/add_employee')
+async def add_employee_api(request):
+    """API для добавления сотрудника через бот"""
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or 'serial' not in data or 'name' not in data:
+            return json_response({
+                'status': 'error',
+                'message': 'Требуются поля serial и name'
+            }, status=400)
+        
+        serial = data['serial'].upper()
+        name = data['name']
+        
+        added = await asyncio.get_running_loop().run_in_executor(None, _save_new_employee, serial, name)
+        if not added:
+            return json_response({
+                'status': 'error',
+                'message': f'Сотрудник с картой {serial} уже существует'
+            }, status=409)
+        
+        logger.info(f"Через API добавлен сотрудник: {name} ({serial})")
+        return json_response({
+            'status': 'success',
+            'message': f'Сотрудник {name} с картой {serial} успешно добавлен'
+        })
+    
+    except Exception as e:
+        logger.error(f"Ошибка при добавлении сотрудника через API: {str(e)}")
+        return json_response({
+            'status': 'error',
+            'message': f'Внутренняя ошибка: {str(e)}'
+        }, status=500)
+
+async def on_startup(app):
+    app['writer'].start()
+    await app['notifier'].start()
+
+async def on_cleanup(app):
+    await app['writer'].stop()
+    await app['notifier'].stop()
+
+def create_app():
+    """Создает aiohttp приложение API сервера"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    config.startup()
+    
+    app = web.Application()
+    app['employees'] = JsonFileCache(EMPLOYEES_FILE)
+    app['employee_telegram'] = JsonFileCache(EMPLOYEE_TELEGRAM_FILE)
+    app['writer'] = AttendanceWriter()
+    app['notifier'] = TelegramNotifier(config.TELEGRAM_TOKEN, config.ADMIN_USER_ID)
+    app.add_routes(routes)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    
+    if config.TELEGRAM_UPDATES_MODE == 'webhook':
+        # Бот принимает обновления в этом процессе (импорт только в режиме вебхука)
+        from bot import bot, dp
+        from utils.telegram_updates import WebhookUpdates
+        WebhookUpdates(dp, bot).setup(app)
+    return app
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Асинхронный API сервер СКУД')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5001)
+    args = parser.parse_args()
+    
+    logger.info("Запуск асинхронного API сервера СКУД (aiohttp)")
+    logger.info(f"Рабочая директория: {os.getcwd()}")
+    logger.info(f"Файл посещаемости: {ATTENDANCE_FILE}")
+    logger.info(f"Файл сотрудников: {EMPLOYEES_FILE}")
+    
+    web.run_app(create_app(), host=args.host, port=args.port, access_log=None)
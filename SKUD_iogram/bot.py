@@ -6,10 +6,13 @@ import logging
 import json
 import calendar
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo, BufferedInputFile
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo, FSInputFile
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -17,6 +20,9 @@ from aiogram.fsm.storage.memory import MemoryStorage
 
 from config import config
 from utils.data_manager import data_manager
+from utils.file_ids import telegram_file_ids
+from utils.profiling import profile_handler
+from utils.telegram_updates import create_session
 
 # Настройка логирования
 logging.basicConfig(
@@ -30,10 +36,187 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Создаем экземпляры бота и диспетчера
-bot = Bot(token=config.TELEGRAM_TOKEN)
+bot = Bot(token=config.TELEGRAM_TOKEN, session=create_session())
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 
+# Администраторы, включившие профилирование своих сообщений командой /profile
+profiling_users = set()
+
+# Отчеты (pandas + xlsxwriter) строятся в пуле потоков, а не в цикле событий:
+# пока идет генерация, бот отвечает остальным пользователям. Пул только для
+# ReportJob, прочая блокирующая работа идет через run_blocking
+report_executor = ThreadPoolExecutor(max_workers=config.REPORT_WORKERS, thread_name_prefix='report')
+
+# Генерируемые сейчас отчеты: (год, месяц) -> ReportJob. Повторный запрос
+# того же месяца ждет уже запущенную генерацию, а не запускает вторую
+report_jobs = {}
+
+class ReportJob:
+    """Генерация отчета за месяц в пуле потоков"""
+    
+    def __init__(self, year: int, month: int):
+        self.year = year
+        self.month = month
+        self.stage = "в очереди"
+        self.started_at = time.monotonic()
+        self.future = asyncio.get_running_loop().run_in_executor(report_executor, self._run)
+    
+    def _run(self):
+        # Выполняется в потоке пула
+        self.stage = "формирование отчета"
+        excel_file, chart_file, period = data_manager.generate_monthly_report(self.year, self.month)
+        stats = None
+        if excel_file is not None:
+            # Сводные цифры считаются вместе с отчетом и хранятся в кэше отчетов
+            stats = data_manager.report_summary(self.year, self.month)
+            if stats is None:
+                self.stage = "подсчет сводных цифр"
+                stats = get_monthly_summary(self.year, self.month)
+        return excel_file, chart_file, period, stats
+
+def start_report_job(year: int, month: int) -> ReportJob:
+    """Запускает генерацию отчета или возвращает уже идущую за тот же месяц"""
+    key = (year, month)
+    job = report_jobs.get(key)
+    if job is None:
+        job = report_jobs[key] = ReportJob(year, month)
+        job.future.add_done_callback(lambda _: report_jobs.pop(key, None))
+    return job
+
+async def wait_report(job: ReportJob, status: types.Message):
+    """Ждет отчет, обновляя сообщение status с этапом и временем генерации"""
+    title = f"{calendar.month_name[job.month]} {job.year}"
+    while True:
+        try:
+            # shield: отмена одного ожидающего не прерывает общую генерацию
+            return await asyncio.wait_for(asyncio.shield(job.future), config.REPORT_PROGRESS_INTERVAL)
+        except asyncio.TimeoutError:
+            elapsed = int(time.monotonic() - job.started_at)
+            try:
+                await status.edit_text(f"⏳ Генерация отчета за {title}: {job.stage} ({elapsed} с)...")
+            except TelegramBadRequest:
+                # Сообщение не изменилось или удалено - прогресс не критичен
+                pass
+
+async def send_monthly_report(chat_id: int, status: types.Message, year: int, month: int):
+    """Генерирует отчет за месяц и отправляет сводку, Excel и график в чат"""
+    excel_file, chart_file, period, stats = await wait_report(start_report_job(year, month), status)
+    
+    if excel_file is None:
+        logger.warning(f"Не удалось сгенерировать отчет за {calendar.month_name[month]} {year}")
+        await bot.send_message(
+            chat_id=chat_id,
+            text=f"Нет данных за {calendar.month_name[month]} {year}."
+        )
+        return
+    
+    logger.info(f"Отчет успешно сгенерирован: {excel_file}")
+    
+    if stats:
+        # Создаем сообщение со сводными цифрами
+        summary_message = f"📊 Сводные цифры за {period}:\n\n"
+        summary_message += f"🕐 Общее вых: {stats['weekend_hours']:.1f} ч\n"
+        summary_message += f"🕐 Общее будни: {stats['weekday_hours']:.1f} ч\n"
+        summary_message += f"🕐 Общий итог: {stats['total_hours']:.1f} ч\n\n"
+        summary_message += f"📈 Сотрудников: {stats['employees_count']}\n"
+        summary_message += f"📅 Рабочих дней: {stats['working_days']}"
+        
+        await bot.send_message(chat_id=chat_id, text=summary_message)
+    
+    await send_file(
+        'document', chat_id, excel_file,
+        filename=f"attendance_report_{period.replace(' ', '_')}.xlsx",
+        caption=f"📋 Отчет посещаемости за {period}"
+    )
+    await send_file(
+        'photo', chat_id, chart_file,
+        filename=f"chart_{period.replace(' ', '_')}.png",
+        caption=f"📊 График отработанных часов за {period}"
+    )
+
+async def send_file(kind: str, chat_id: int, file_path: str, filename: str, caption: str):
+    """
+    Отправляет файл как документ или фото (kind: 'document' или 'photo')
+    
+    Файл, уже отправленный с тем же содержимым, отправляется по file_id без
+    повторной загрузки. Иначе он читается с диска при отправке (FSInputFile),
+    а полученный file_id запоминается под хэшем, снятым до отправки.
+    Хэширование и запись кэша идут в пуле потоков, а не в цикле событий.
+    """
+    send = bot.send_document if kind == 'document' else bot.send_photo
+    
+    digest = await run_blocking(telegram_file_ids.digest, file_path)
+    file_id = await run_blocking(telegram_file_ids.get, kind, file_path, digest)
+    if file_id:
+        try:
+            return await send(chat_id=chat_id, caption=caption, **{kind: file_id})
+        except TelegramBadRequest as e:
+            logger.warning(f"file_id для {file_path} не принят Telegram, загружаем файл заново: {e}")
+            await run_blocking(telegram_file_ids.forget, kind, file_path)
+    
+    sent = await send(chat_id=chat_id, caption=caption, **{kind: FSInputFile(file_path, filename=filename)})
+    # Для фото Telegram возвращает несколько размеров, последний - исходный
+    uploaded = sent.document if kind == 'document' else sent.photo[-1]
+    await run_blocking(telegram_file_ids.put, kind, file_path, uploaded.file_id, digest)
+    return sent
+
+def previous_month(moment: datetime):
+    """(год, месяц) месяца, предшествующего moment"""
+    return (moment.year - 1, 12) if moment.month == 1 else (moment.year, moment.month - 1)
+
+def next_prerender_at(moment: datetime) -> datetime:
+    """Ближайшее после moment время предварительной генерации: 1-е число в REPORT_PRERENDER_AT"""
+    hour, minute = map(int, config.REPORT_PRERENDER_AT.split(':'))
+    candidate = moment.replace(day=1, hour=hour, minute=minute, second=0, microsecond=0)
+    if candidate <= moment:
+        year, month = (moment.year + 1, 1) if moment.month == 12 else (moment.year, moment.month + 1)
+        candidate = candidate.replace(year=year, month=month)
+    return candidate
+
+async def prerender_reports():
+    """
+    Предварительная генерация отчета за закрытый месяц
+    
+    1-го числа вскоре после полуночи (и при запуске бота, если отчет за
+    прошлый месяц еще не построен) отчет, график и сводные цифры строятся
+    заранее и попадают в кэш отчетов: администраторы, запрашивающие отчет
+    за месяц утром 1-го, получают готовые файлы с диска.
+    """
+    while True:
+        year, month = previous_month(datetime.now())
+        started_at = time.monotonic()
+        try:
+            excel_file, _, period, _ = await start_report_job(year, month).future
+            if excel_file is not None:
+                logger.info(f"Отчет за {period} подготовлен заранее за {time.monotonic() - started_at:.1f} с")
+        except Exception as e:
+            logger.error(f"Ошибка предварительной генерации отчета за {month}/{year}: {e}")
+        
+        # Спим частями: перевод системных часов не сдвигает запуск надолго
+        run_at = next_prerender_at(datetime.now())
+        while datetime.now() < run_at:
+            await asyncio.sleep(min((run_at - datetime.now()).total_seconds(), 3600))
+
+@dp.startup()
+async def on_startup():
+    if config.REPORT_PRERENDER_ENABLED:
+        dp['prerender_task'] = asyncio.create_task(prerender_reports())
+
+@dp.shutdown()
+async def on_shutdown():
+    task = dp.workflow_data.pop('prerender_task', None)
+    if task is not None:
+        task.cancel()
+
+async def run_blocking(func, *args):
+    """
+    Выполняет короткую блокирующую функцию (чтение CSV, хэш файла) в пуле
+    потоков цикла событий по умолчанию: report_executor занят генерацией
+    отчетов, и диагностика или отправка готового отчета не ждут ее
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
 # Состояния для FSM
 class EmployeeStates(StatesGroup):
     waiting_for_employee_data = State()
@@ -108,7 +291,7 @@ async def cmd_diagnose(message: types.Message):
     await message.reply("🔍 Запуск диагностики данных...")
     
     # Запускаем диагностику
-    report = data_manager.diagnose_data()
+    report = await run_blocking(data_manager.diagnose_data)
     await message.reply(report)
 
 @dp.message(Command("check_data"))
@@ -123,7 +306,7 @@ async def cmd_check_data(message: types.Message):
     await message.reply("🔍 Проверка данных в реальном времени...")
     
     # Получаем статистику данных
-    stats = data_manager.get_data_statistics()
+    stats = await run_blocking(data_manager.get_data_statistics)
     
     if stats['total_records'] == 0:
         await message.reply("❌ Данные не найдены")
@@ -252,6 +435,25 @@ async def cmd_webapp(message: types.Message):
         reply_markup=reply_markup
     )
 
+@dp.message(Command("profile"))
+async def cmd_profile(message: types.Message):
+    """Обработчик команды /profile - включает/выключает профилирование своих сообщений"""
+    user_id = message.from_user.id
+    
+    if user_id != config.ADMIN_USER_ID:
+        await send_access_denied(message)
+        return
+    
+    if user_id in profiling_users:
+        profiling_users.discard(user_id)
+        await message.reply("⏹ Профилирование ваших запросов выключено")
+    else:
+        profiling_users.add(user_id)
+        await message.reply(
+            "⏺ Профилирование включено: каждый ваш запрос к боту будет сохранен "
+            f"в {config.PROFILES_DIR}. Повторите /profile, чтобы выключить."
+        )
+
 @dp.callback_query(F.data.startswith("report_"))
 async def handle_report_callback(callback: types.CallbackQuery):
     """Обработчик нажатий на кнопки отчетов"""
@@ -274,53 +476,7 @@ async def handle_report_callback(callback: types.CallbackQuery):
     logger.info(f"Запрос отчета за {calendar.month_name[month]} {year}")
     await callback.message.edit_text(f"Генерация отчета за {calendar.month_name[month]} {year}...")
     
-    # Генерируем отчет
-    excel_file, chart_file, period = data_manager.generate_monthly_report(year, month)
-    
-    if excel_file is None:
-        logger.warning(f"Не удалось сгенерировать отчет за {calendar.month_name[month]} {year}")
-        await bot.send_message(
-            chat_id=callback.message.chat.id,
-            text=f"Нет данных за {period}."
-        )
-        return
-    
-    logger.info(f"Отчет успешно сгенерирован: {excel_file}")
-    
-    # Загружаем данные для показа сводных цифр
-    stats = await get_monthly_summary(year, month)
-    
-    if stats:
-        # Создаем сообщение со сводными цифрами
-        summary_message = f"📊 Сводные цифры за {period}:\n\n"
-        summary_message += f"🕐 Общее вых: {stats['weekend_hours']:.1f} ч\n"
-        summary_message += f"🕐 Общее будни: {stats['weekday_hours']:.1f} ч\n"
-        summary_message += f"🕐 Общий итог: {stats['total_hours']:.1f} ч\n\n"
-        summary_message += f"📈 Сотрудников: {stats['employees_count']}\n"
-        summary_message += f"📅 Рабочих дней: {stats['working_days']}"
-        
-        await bot.send_message(
-            chat_id=callback.message.chat.id,
-            text=summary_message
-        )
-    
-    # Отправляем Excel-файл
-    with open(excel_file, 'rb') as file:
-        document = BufferedInputFile(file.read(), filename=f"attendance_report_{period.replace(' ', '_')}.xlsx")
-        await bot.send_document(
-            chat_id=callback.message.chat.id,
-            document=document,
-            caption=f"📋 Отчет посещаемости за {period}"
-        )
-    
-    # Отправляем график
-    with open(chart_file, 'rb') as file:
-        photo = BufferedInputFile(file.read(), filename=f"chart_{period.replace(' ', '_')}.png")
-        await bot.send_photo(
-            chat_id=callback.message.chat.id,
-            photo=photo,
-            caption=f"📊 График отработанных часов за {period}"
-        )
+    await send_monthly_report(callback.message.chat.id, callback.message, year, month)
 
 @dp.callback_query(F.data == "menu_report")
 async def handle_menu_report(callback: types.CallbackQuery):
@@ -419,7 +575,12 @@ async def debug_middleware(handler, event, data):
         logger.info(f"🚫 MIDDLEWARE: ПОЛНОЕ ИГНОРИРОВАНИЕ update от бота {user_id}")
         return None  # Полная остановка обработки
     
-    return await handler(event, data)
+    # Профилирование: для администраторов после /profile или по доле выборки
+    return await profile_handler(
+        handler, event, data,
+        name=f"update_{event.event_type}",
+        force=user_id in profiling_users
+    )
 
 @dp.message(F.web_app_data)
 async def handle_webapp_data(message: types.Message):
@@ -445,46 +606,9 @@ async def handle_webapp_data(message: types.Message):
             year = int(data.get('year'))
             month = int(data.get('month'))
             
-            await message.reply(f"Генерация отчета за {calendar.month_name[month]} {year}...")
-            
-            # Генерируем отчет
-            excel_file, chart_file, period = data_manager.generate_monthly_report(year, month)
-            
-            if excel_file is None:
-                await message.reply(f"Нет данных за {period}.")
-                return
-            
-            # Загружаем данные для показа сводных цифр
-            stats = await get_monthly_summary(year, month)
-            
-            if stats:
-                # Создаем сообщение со сводными цифрами
-                summary_message = f"📊 Сводные цифры за {period}:\n\n"
-                summary_message += f"🕐 Общее вых: {stats['weekend_hours']:.1f} ч\n"
-                summary_message += f"🕐 Общее будни: {stats['weekday_hours']:.1f} ч\n"
-                summary_message += f"🕐 Общий итог: {stats['total_hours']:.1f} ч\n\n"
-                summary_message += f"📈 Сотрудников: {stats['employees_count']}\n"
-                summary_message += f"📅 Рабочих дней: {stats['working_days']}"
-                
-                await message.reply(summary_message)
+            status = await message.reply(f"Генерация отчета за {calendar.month_name[month]} {year}...")
             
-            # Отправляем Excel-файл
-            with open(excel_file, 'rb') as file:
-                document = BufferedInputFile(file.read(), filename=f"attendance_report_{period.replace(' ', '_')}.xlsx")
-                await bot.send_document(
-                    chat_id=message.chat.id,
-                    document=document,
-                    caption=f"📋 Отчет посещаемости за {period}"
-                )
-            
-            # Отправляем график
-            with open(chart_file, 'rb') as file:
-                photo = BufferedInputFile(file.read(), filename=f"chart_{period.replace(' ', '_')}.png")
-                await bot.send_photo(
-                    chat_id=message.chat.id,
-                    photo=photo,
-                    caption=f"📊 График отработанных часов за {period}"
-                )
+            await send_monthly_report(message.chat.id, status, year, month)
         
         elif action == 'view_report':
             report_url = data.get('report_url')
@@ -503,13 +627,7 @@ async def handle_webapp_data(message: types.Message):
             if os.path.exists(file_path):
                 # Отправляем файл пользователю
                 logger.info(f"📤 Sending file: {filename}")
-                with open(file_path, 'rb') as file:
-                    document = BufferedInputFile(file.read(), filename=filename)
-                    await bot.send_document(
-                        chat_id=message.chat.id,
-                        document=document,
-                        caption=f"Отчет: {filename}"
-                    )
+                await send_file('document', message.chat.id, file_path, filename=filename, caption=f"Отчет: {filename}")
             else:
                 # Если файл не найден, отправляем ссылку
                 await message.reply(
@@ -544,24 +662,18 @@ async def handle_all_messages(message: types.Message):
     # Если сообщение не обработано другими хендлерами
     await message.reply("Команда не распознана. Используйте /start для списка команд.")
 
-async def get_monthly_summary(year: int, month: int) -> dict:
-    """Получает сводную статистику за месяц"""
+def get_monthly_summary(year: int, month: int) -> dict:
+    """Получает сводную статистику за месяц (блокирующая, вызывается из ReportJob)"""
     try:
-        df = data_manager.load_attendance_data()
-        if df.empty:
+        # В памяти только записи месяца, а не вся история
+        monthly_data = data_manager.load_attendance_range(*data_manager.month_range(year, month))
+        if monthly_data.empty:
             return None
         
         import pandas as pd
         
         # Преобразуем даты
-        df['date'] = pd.to_datetime(df['date'])
-        
-        # Фильтруем по году и месяцу
-        mask = (df['date'].dt.year == year) & (df['date'].dt.month == month)
-        monthly_data = df[mask].copy()
-        
-        if monthly_data.empty:
-            return None
+        monthly_data['date'] = pd.to_datetime(monthly_data['date'])
         
         # Рассчитываем часы работы
         monthly_data['arrival_time'] = pd.to_datetime(
@@ -612,16 +724,24 @@ async def send_admin_notification(message: str):
 async def main():
     """Главная функция запуска бота"""
     logger.info("Запуск Telegram бота СКУД на aiogram")
+    if config.TELEGRAM_UPDATES_MODE == 'webhook':
+        logger.info("Режим вебхука: обновления принимает api_server_async.py, polling не запускается")
+        return
+    config.startup()
+    data_manager.log_paths()
     
     # Краткая проверка доступности данных при старте (без полной диагностики)
     try:
-        stats = data_manager.get_data_statistics()
+        stats = await run_blocking(data_manager.get_data_statistics)
         logger.info(f"Данные СКУД: {stats['total_records']} записей, {stats['employees_count']} сотрудников")
     except Exception as e:
         logger.warning(f"Не удалось проверить данные при старте: {e}")
     
     # Запускаем бота
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        report_executor.shutdown(wait=False, cancel_futures=True)
 
 if __name__ == '__main__':
     asyncio.run(main())
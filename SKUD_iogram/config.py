@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 @dataclass
 class Config:
@@ -27,16 +27,53 @@ class Config:
     ATTENDANCE_FILE: str = "data/attendance.csv"
     EMPLOYEES_FILE: str = "data/employees.json"
     REPORTS_DIR: str = "data/reports"
+    PROFILES_DIR: str = "data/profiles"
+    REPORTS_KEEP: int = int(os.getenv('REPORTS_KEEP', '36'))  # Сколько отчетов (периодов) хранить, 0 - все
+    
+    # Генерация отчетов ботом в пуле потоков: сколько отчетов строится одновременно
+    REPORT_WORKERS: int = int(os.getenv('REPORT_WORKERS', '2'))
+    REPORT_PROGRESS_INTERVAL: int = 5  # Как часто обновлять сообщение о ходе генерации, сек
+    # Предварительная генерация отчета за прошлый месяц 1-го числа (ЧЧ:ММ)
+    REPORT_PRERENDER_ENABLED: bool = os.getenv('REPORT_PRERENDER_ENABLED', 'true').lower() == 'true'
+    REPORT_PRERENDER_AT: str = os.getenv('REPORT_PRERENDER_AT', '00:05')
+    
+    # Прием обновлений Telegram: 'polling' (процесс бота) или 'webhook' (маршрут в api_server_async.py)
+    TELEGRAM_UPDATES_MODE: str = os.getenv('TELEGRAM_UPDATES_MODE', 'polling')
+    TELEGRAM_WEBHOOK_URL: str = os.getenv('TELEGRAM_WEBHOOK_URL', '')  # Публичный HTTPS адрес api_server_async.py
+    TELEGRAM_WEBHOOK_PATH: str = '/telegram/webhook'
+    TELEGRAM_WEBHOOK_SECRET: str = os.getenv('TELEGRAM_WEBHOOK_SECRET', '')  # Пусто - производный от токена
+    TELEGRAM_API_URL: str = os.getenv('TELEGRAM_API_URL', '')  # Другой сервер Bot API, например benchmarks/fake_telegram.py
+    
+    # Отсев повторных сканирований (карта, минута) на входе /api/attendance, 0 - выключен
+    SCAN_DEBOUNCE_SECONDS: int = int(os.getenv('SCAN_DEBOUNCE_SECONDS', '60'))
+    
+    # Профилирование запросов и обработчиков бота (cProfile)
+    PROFILE_TOKEN: str = os.getenv('PROFILE_TOKEN', '')  # Заголовок X-Profile или ?profile=<токен>
+    PROFILE_SAMPLE_RATE: float = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # Доля случайно профилируемых запросов
+    PROFILE_TOP_N: int = 30
+    PROFILE_KEEP: int = 200  # Сколько последних профилей хранить
+    
+    _started: bool = field(default=False, init=False, repr=False)
     
     def __post_init__(self):
-        """Создание директорий при инициализации"""
-        os.makedirs(self.DATA_DIR, exist_ok=True)
-        os.makedirs(self.REPORTS_DIR, exist_ok=True)
-        
+        """Значения по умолчанию (без побочных эффектов: конфигурацию импортирует каждый модуль)"""
         # Если не указаны разрешенные пользователи, добавляем администратора
         if self.ALLOWED_USERS is None:
             self.ALLOWED_USERS = [self.ADMIN_USER_ID] if self.ADMIN_USER_ID else []
-            
+    
+    def startup(self):
+        """
+        Подготовка окружения при запуске процесса: директории данных и
+        менеджер уведомлений. Вызывается точкой входа (бот, API и веб-сервер),
+        а не при импорте конфигурации. Повторный вызов ничего не делает.
+        """
+        if self._started:
+            return
+        self._started = True
+        
+        os.makedirs(self.DATA_DIR, exist_ok=True)
+        os.makedirs(self.REPORTS_DIR, exist_ok=True)
+        
         # Инициализация менеджера уведомлений
         self._init_notifications()
     
@@ -54,18 +54,22 @@ async def main():
         
         # Быстрая проверка конфигурации без загрузки данных
         from config import config
+        config.startup()
         logger.info(f"Токен настроен: {'Да' if config.TELEGRAM_TOKEN else 'Нет'}")
         logger.info(f"Админ настроен: {'Да' if config.ADMIN_USER_ID else 'Нет'}")
         
-        # Запуск polling с обработкой shutdown
-        polling_task = asyncio.create_task(dp.start_polling(bot))
         shutdown_task = asyncio.create_task(shutdown_event.wait())
+        tasks = [shutdown_task]
+        if config.TELEGRAM_UPDATES_MODE == 'webhook':
+            # Обновления принимает api_server_async.py; процесс ждет остановки,
+            # чтобы служба не перезапускалась
+            logger.info("Режим вебхука: обновления принимает api_server_async.py, polling не запускается")
+        else:
+            # Запуск polling с обработкой shutdown
+            tasks.append(asyncio.create_task(dp.start_polling(bot)))
         
         # Ждем либо завершения polling, либо сигнала shutdown
-        done, pending = await asyncio.wait(
-            [polling_task, shutdown_task],
-            return_when=asyncio.FIRST_COMPLETED
-        )
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
         
         # Отменяем незавершенные задачи
         for task in pending:
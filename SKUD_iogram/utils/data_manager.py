@@ -1,25 +1,38 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from __future__ import annotations  # pd.DataFrame в аннотациях не импортирует pandas
+
 import os
 import json
-import pandas as pd
 import logging
+import threading
 from datetime import datetime, timedelta
-from typing import Optional, Tuple
+from typing import Callable, Iterator, Optional, Tuple
 import calendar
-import matplotlib.pyplot as plt
-import matplotlib
-import seaborn as sns
 import io
 
 from config import config
+from utils.lazy import lazy_import
+from utils.metrics import REPORT_GENERATION_SECONDS
+from utils.report_catalog import report_catalog, frame_digest, file_signature
+from utils.storage import atomic_write, file_lock, write_csv
+
+def _use_agg_backend():
+    """Настройка matplotlib для работы без GUI (до импорта pyplot)"""
+    import matplotlib
+    matplotlib.use('Agg')
 
-# Настройка matplotlib для работы без GUI
-matplotlib.use('Agg')
+# pandas и графические библиотеки загружаются при первом отчете, а не при импорте
+pd = lazy_import('pandas')
+plt = lazy_import('matplotlib.pyplot', on_import=_use_agg_backend)
+sns = lazy_import('seaborn', on_import=_use_agg_backend)
 
 logger = logging.getLogger(__name__)
 
+# Сколько строк CSV iter_attendance читает за раз
+ATTENDANCE_BATCH_SIZE = 10000
+
 class DataManager:
     """Класс для работы с данными СКУД"""
     
@@ -33,9 +46,11 @@ class DataManager:
         self.alternative_data_dir = os.path.join(os.getcwd(), 'data')
         self.alternative_attendance_file = os.path.join(self.alternative_data_dir, 'attendance.csv')
         
-        self._log_paths()
+        # Сводка файла посещаемости для /check_data и /diagnose: (версия файла, сводка)
+        self._profile = None
+        self._profile_lock = threading.Lock()
 
-    def _log_paths(self):
+    def log_paths(self):
         """Логирование путей для отладки"""
         logger.info(f"Текущая директория: {os.getcwd()}")
         logger.info(f"Директория данных: {self.data_dir}")
@@ -108,10 +123,53 @@ class DataManager:
         logger.warning(f"Файл данных не найден ни по одному из путей")
         logger.warning(f"Проверенные пути: {self.attendance_file}, {self.alternative_attendance_file}")
         df = pd.DataFrame(columns=['date', 'employee', 'arrival', 'departure'])
-        os.makedirs(os.path.dirname(self.attendance_file), exist_ok=True)
-        df.to_csv(self.attendance_file, index=False)
+        with file_lock(self.attendance_file):
+            # Файл мог создать другой процесс, пока мы проверяли пути
+            if not os.path.exists(self.attendance_file):
+                write_csv(df, self.attendance_file)
         return df
 
+    def _find_attendance_file(self) -> Optional[str]:
+        """Путь к файлу посещаемости (основной или альтернативный), None если его нет"""
+        for path in (self.attendance_file, self.alternative_attendance_file):
+            if os.path.exists(path):
+                return path
+        return None
+
+    @staticmethod
+    def month_range(year: int, month: int) -> Tuple[str, str]:
+        """Полуинтервал дат месяца [первое число, первое число следующего месяца)"""
+        start = datetime(year, month, 1)
+        end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+        return start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+    def iter_attendance(self, start: str, end: str, employee: Optional[str] = None,
+                        batch_size: int = ATTENDANCE_BATCH_SIZE) -> Iterator[pd.DataFrame]:
+        """
+        Потоково читает посещаемость за период [start, end) пачками
+        
+        CSV читается кусками по batch_size строк, из каждого остаются только
+        строки периода (и сотрудника), так что память ограничена размером
+        пачки, а не всей историей. Пустые пачки не возвращаются.
+        """
+        path = self._find_attendance_file()
+        if path is None:
+            return
+        
+        for chunk in pd.read_csv(path, chunksize=batch_size, dtype={'date': str, 'employee': str}):
+            mask = (chunk['date'] >= start) & (chunk['date'] < end)
+            if employee is not None:
+                mask &= chunk['employee'] == employee
+            if mask.any():
+                yield chunk[mask]
+
+    def load_attendance_range(self, start: str, end: str, employee: Optional[str] = None) -> pd.DataFrame:
+        """Посещаемость за период [start, end) одним DataFrame (собирается из пачек iter_attendance)"""
+        batches = list(self.iter_attendance(start, end, employee))
+        if not batches:
+            return pd.DataFrame(columns=['date', 'employee', 'arrival', 'departure'])
+        return pd.concat(batches, ignore_index=True)
+
     def _log_recent_records(self, df: pd.DataFrame):
         """Логирует последние 5 записей для диагностики (только при включенном debug)"""
         if logger.isEnabledFor(logging.DEBUG):
@@ -119,37 +177,74 @@ class DataManager:
             for i, row in df.tail(5).iterrows():
                 logger.debug(f"  {row['date']} - {row['employee']} - {row['arrival']} - {row['departure']}")
 
-    def generate_monthly_report(self, year: int, month: int) -> Tuple[Optional[str], Optional[str], Optional[str]]:
-        """Генерирует месячный отчет в Excel и PNG формате"""
-        df = self.load_attendance_data()
+    def generate_monthly_report(self, year: int, month: int,
+                                progress: Optional[Callable[[str, int], None]] = None) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """
+        Генерирует месячный отчет в Excel и PNG формате
+        
+        progress(этап, процент), если передан, вызывается по ходу генерации
+        (очередь отчетов веб-сервера показывает его на странице).
+        
+        Отчет, уже построенный по тем же данным месяца (предварительной
+        генерацией, другим запросом или другим процессом), берется с диска
+        без повторной генерации (utils/report_catalog.py).
+        """
+        progress = progress or (lambda stage, percent: None)
+        data_signature = file_signature(self._find_attendance_file())
+        
+        cached = report_catalog.get(year, month)
+        if cached is not None and data_signature is not None and cached['data_signature'] == data_signature:
+            logger.info(f"Отчет за {cached['period']} взят из кэша: файл данных не менялся")
+            return cached['excel'], cached['chart'], cached['period']
+        
+        progress('загрузка данных', 10)
+        # В памяти только записи месяца, а не вся история
+        monthly_data = self.load_attendance_range(*self.month_range(year, month))
+        if monthly_data.empty:
+            logger.warning(f"Нет данных за {calendar.month_name[month]} {year}")
+            return None, None, None
         
-        # Отладочная информация только при debug режиме
-        if logger.isEnabledFor(logging.DEBUG):
-            logger.debug(f"Загружено всего записей: {len(df)}")
-            if not df.empty:
-                logger.debug(f"Период данных: с {df['date'].min()} по {df['date'].max()}")
-                unique_dates = sorted(df['date'].unique())
-                logger.debug(f"Уникальные даты в данных: {unique_dates[:10]}...")  # Показываем первые 10
+        digest = frame_digest(monthly_data)
+        if cached is not None and cached['digest'] == digest:
+            # Файл менялся, но не в строках этого месяца
+            report_catalog.update(year, month, data_signature=data_signature)
+            logger.info(f"Отчет за {cached['period']} взят из кэша: данные месяца не менялись")
+            return cached['excel'], cached['chart'], cached['period']
+        
+        with REPORT_GENERATION_SECONDS.time():
+            file_path, chart_file, period, stats = self._generate_monthly_report(year, month, monthly_data, progress)
+        
+        report_catalog.record(year, month, {
+            'excel': file_path,
+            'chart': chart_file,
+            'period': period,
+            'stats': stats,
+            'digest': digest,
+            'data_signature': data_signature
+        })
+        return file_path, chart_file, period
+
+    def report_summary(self, year: int, month: int) -> Optional[dict]:
+        """Сводные цифры последнего построенного отчета за месяц (из каталога отчетов)"""
+        cached = report_catalog.get(year, month)
+        return cached['stats'] if cached is not None else None
+
+    def _generate_monthly_report(self, year: int, month: int, monthly_data: pd.DataFrame,
+                                 progress: Callable[[str, int], None]) -> Tuple[str, str, str, dict]:
+        os.makedirs(self.reports_dir, exist_ok=True)
         
         # Преобразуем даты
-        df['date'] = pd.to_datetime(df['date'])
-        
-        # Фильтруем по году и месяцу
-        mask = (df['date'].dt.year == year) & (df['date'].dt.month == month)
-        monthly_data = df[mask].copy()
+        monthly_data['date'] = pd.to_datetime(monthly_data['date'])
         
         logger.info(f"Найдено записей за {calendar.month_name[month]} {year}: {len(monthly_data)}")
         
-        if monthly_data.empty:
-            logger.warning(f"Нет данных за {calendar.month_name[month]} {year}")
-            return None, None, None
-        
         # Показываем диапазон дат в отфильтрованных данных (только в debug режиме)
-        if not monthly_data.empty and logger.isEnabledFor(logging.DEBUG):
+        if logger.isEnabledFor(logging.DEBUG):
             min_date = monthly_data['date'].min()
             max_date = monthly_data['date'].max()
             logger.debug(f"Период данных в отчете: с {min_date.strftime('%Y-%m-%d')} по {max_date.strftime('%Y-%m-%d')}")
         
+        progress('расчет часов', 30)
         # Преобразуем время в datetime для расчета разницы
         monthly_data['arrival_time'] = pd.to_datetime(
             monthly_data['date'].dt.strftime('%Y-%m-%d') + ' ' + monthly_data['arrival']
@@ -191,20 +286,42 @@ class DataManager:
         file_name = f"attendance_report_{year}_{month:02d}_{month_name}.xlsx"
         file_path = os.path.join(self.reports_dir, file_name)
         
+        progress('формирование Excel', 50)
         self._create_excel_report(monthly_data, summary, file_path, year, month, 
                                 weekend_total_hours, weekday_total_hours, total_hours)
         
         # Создаем график
+        progress('построение графика', 85)
         chart_file = self._create_chart(summary, year, month, 
                                       weekend_total_hours, weekday_total_hours, total_hours)
         
+        # Сводные цифры для сообщения бота (в JSON кэша, поэтому без типов numpy)
+        stats = {
+            'weekend_hours': float(weekend_total_hours),
+            'weekday_hours': float(weekday_total_hours),
+            'total_hours': float(total_hours),
+            'employees_count': int(monthly_data['employee'].nunique()),
+            'working_days': int(monthly_data['date'].nunique())
+        }
+        
         logger.info(f"Отчет сгенерирован: {file_path}")
-        return file_path, chart_file, f"{month_name} {year}"
+        return file_path, chart_file, f"{month_name} {year}", stats
 
     def _create_excel_report(self, monthly_data, summary, file_path, year, month,
                            weekend_total_hours, weekday_total_hours, total_hours):
-        """Создает Excel отчет"""
-        with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
+        """
+        Создает Excel отчет
+        
+        Файл пишется через atomic_write: тот же месяц может одновременно
+        строить другой процесс (бот и веб-сервер), пока третий отдает файл.
+        """
+        atomic_write(file_path, lambda f: self._write_excel_report(
+            f, monthly_data, summary, year, month, weekend_total_hours, weekday_total_hours, total_hours
+        ), mode='wb', encoding=None, newline=None)
+
+    def _write_excel_report(self, f, monthly_data, summary, year, month,
+                            weekend_total_hours, weekday_total_hours, total_hours):
+        with pd.ExcelWriter(f, engine='xlsxwriter') as writer:
             # Получаем объект workbook
             workbook = writer.book
             
@@ -297,20 +414,85 @@ class DataManager:
             import base64
             # Минимальный PNG файл в base64
             png_data = base64.b64decode('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==')
-            with open(chart_file, 'wb') as f:
-                f.write(png_data)
+            atomic_write(chart_file, lambda f: f.write(png_data), mode='wb', encoding=None, newline=None)
         except:
             # Если не получилось, создаем текстовый файл
-            with open(chart_file, 'w') as f:
-                f.write("График временно отключен")
+            atomic_write(chart_file, lambda f: f.write("График временно отключен"))
         
         return chart_file
 
+    def _data_profile(self, path: Optional[str]) -> Optional[dict]:
+        """
+        Сводка файла посещаемости: число записей и сотрудников, записи по датам
+        
+        Считается за один проход по CSV (пачками, как iter_attendance) и
+        кэшируется до изменения файла: версия - путь и (mtime_ns, размер).
+        Повторные /check_data и /diagnose нескольких администраторов берут
+        готовую сводку; одновременные запросы ждут одного пересчета.
+        """
+        if path is None:
+            return None
+        signature = file_signature(path)
+        if signature is None:
+            return None
+        version = [path] + signature
+        
+        with self._profile_lock:
+            if self._profile is not None and self._profile[0] == version:
+                return self._profile[1]
+            
+            total_records = 0
+            employees = set()
+            raw_counts = {}
+            for chunk in pd.read_csv(path, chunksize=ATTENDANCE_BATCH_SIZE, usecols=['date', 'employee'],
+                                     dtype={'date': str, 'employee': str}):
+                total_records += len(chunk)
+                employees.update(chunk['employee'].dropna().unique())
+                for value, count in chunk['date'].value_counts().items():
+                    raw_counts[value] = raw_counts.get(value, 0) + count
+            
+            # Даты разбираются по уникальным значениям, а не по каждой строке
+            day_counts = {}
+            if raw_counts:
+                days = pd.to_datetime(pd.Series(list(raw_counts))).dt.strftime('%Y-%m-%d')
+                for day, count in zip(days, raw_counts.values()):
+                    day_counts[day] = day_counts.get(day, 0) + int(count)
+            
+            profile = {
+                'total_records': total_records,
+                'employees_count': len(employees),
+                'day_counts': day_counts,
+                'start': min(day_counts) if day_counts else None,
+                'end': max(day_counts) if day_counts else None
+            }
+            self._profile = (version, profile)
+            logger.info(f"Сводка данных пересчитана: {total_records} записей, {len(day_counts)} дней")
+            return profile
+
+    @staticmethod
+    def _recent_days(day_counts: dict, days: int = 5) -> list:
+        """Записи за последние дни (сегодня первым) по индексу дата -> число записей"""
+        current_date = datetime.now()
+        recent_days = []
+        for i in range(days):
+            check_date = current_date - timedelta(days=i)
+            records_count = day_counts.get(check_date.strftime('%Y-%m-%d'), 0)
+            recent_days.append({
+                'date': check_date.strftime('%d.%m'),
+                'records_count': records_count,
+                'has_data': records_count > 0
+            })
+        return recent_days
+
+    @staticmethod
+    def _format_day(day: str) -> str:
+        return datetime.strptime(day, '%Y-%m-%d').strftime('%d.%m.%Y')
+
     def get_data_statistics(self) -> dict:
         """Возвращает статистику по данным"""
-        df = self.load_attendance_data()
+        profile = self._data_profile(self._find_attendance_file())
         
-        if df.empty:
+        if profile is None or profile['total_records'] == 0:
             return {
                 'total_records': 0,
                 'period': None,
@@ -318,34 +500,16 @@ class DataManager:
                 'recent_days': []
             }
         
-        # Преобразуем даты
-        df['date'] = pd.to_datetime(df['date'])
-        
-        # Базовая статистика
-        stats = {
-            'total_records': len(df),
+        return {
+            'total_records': profile['total_records'],
             'period': {
-                'start': df['date'].min().strftime('%d.%m.%Y'),
-                'end': df['date'].max().strftime('%d.%m.%Y')
+                'start': self._format_day(profile['start']),
+                'end': self._format_day(profile['end'])
             },
-            'employees_count': df['employee'].nunique(),
-            'recent_days': []
+            'employees_count': profile['employees_count'],
+            # Окно последних дней считается от текущей даты, поэтому не кэшируется
+            'recent_days': self._recent_days(profile['day_counts'])
         }
-        
-        # Проверяем последние 5 дней
-        current_date = datetime.now()
-        for i in range(5):
-            check_date = current_date - timedelta(days=i)
-            check_date_str = check_date.strftime('%Y-%m-%d')
-            records_for_date = df[df['date'] == check_date_str]
-            
-            stats['recent_days'].append({
-                'date': check_date.strftime('%d.%m'),
-                'records_count': len(records_for_date),
-                'has_data': len(records_for_date) > 0
-            })
-        
-        return stats
 
     def diagnose_data(self) -> str:
         """Проводит диагностику данных и возвращает отчет"""
@@ -359,36 +523,29 @@ class DataManager:
         report = "🔍 Диагностика данных СКУД\n\n"
         
         # Проверяем существование файлов
-        if os.path.exists(self.attendance_file):
+        profile = self._data_profile(self.attendance_file)
+        if profile is not None:
             file_size = os.path.getsize(self.attendance_file)
             report += f"✅ Основной файл данных найден\n"
             report += f"📁 Размер файла: {file_size} байт\n\n"
             
-            # Читаем данные
-            df = pd.read_csv(self.attendance_file)
-            report += f"📊 Загружено записей: {len(df)}\n"
+            report += f"📊 Загружено записей: {profile['total_records']}\n"
             
-            if not df.empty:
-                df['date'] = pd.to_datetime(df['date'])
-                latest_date = df['date'].max()
-                current_date = datetime.now()
+            if profile['total_records'] > 0:
+                latest_date = self._format_day(profile['end'])
                 
-                report += f"📅 Период данных: {df['date'].min().strftime('%d.%m.%Y')} - {latest_date.strftime('%d.%m.%Y')}\n"
-                report += f"📅 Последняя запись: {latest_date.strftime('%d.%m.%Y')}\n\n"
+                report += f"📅 Период данных: {self._format_day(profile['start'])} - {latest_date}\n"
+                report += f"📅 Последняя запись: {latest_date}\n\n"
                 
                 # Проверяем последние 5 дней
                 report += "📈 Последние 5 дней:\n"
                 missing_days = 0
                 
-                for i in range(5):
-                    check_date = current_date - timedelta(days=i)
-                    check_date_str = check_date.strftime('%Y-%m-%d')
-                    records_for_date = df[df['date'] == check_date_str]
-                    
-                    if not records_for_date.empty:
-                        report += f"✅ {check_date.strftime('%d.%m')}: {len(records_for_date)} записей\n"
+                for day_info in self._recent_days(profile['day_counts']):
+                    if day_info['has_data']:
+                        report += f"✅ {day_info['date']}: {day_info['records_count']} записей\n"
                     else:
-                        report += f"❌ {check_date.strftime('%d.%m')}: нет данных\n"
+                        report += f"❌ {day_info['date']}: нет данных\n"
                         missing_days += 1
                 
                 if missing_days > 0:
@@ -397,7 +554,7 @@ class DataManager:
                     report += f"\n✅ Данные за последние 5 дней присутствуют"
             else:
                 report += "❌ Файл данных пуст"
-                
+        
         elif os.path.exists(self.alternative_attendance_file):
             report += f"✅ Альтернативный файл данных найден\n"
             # Аналогичная проверка для альтернативного файла
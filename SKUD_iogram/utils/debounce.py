@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Отсев повторных сканирований карты на входе /api/attendance
+
+Карта, задержанная у считывателя, и повторы прошивки ESP32 присылают одно и
+то же сканирование несколько раз. Без отсева каждый повтор перечитывает и
+перезаписывает attendance.csv, превращает запись в 'уход (обновлено)' и
+отправляет еще одно уведомление. Здесь в памяти хранятся пары
+(карта, минута) за последние config.SCAN_DEBOUNCE_SECONDS секунд: повтор
+получает ответ первого сканирования, не затрагивая хранилище и Telegram.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+from config import config
+
+MAX_ENTRIES = 10000
+WAIT_TIMEOUT = 10  # Сколько повтор ждет завершения первого сканирования, сек
+
+class _Entry:
+    __slots__ = ('expires_at', 'done', 'response')
+    
+    def __init__(self, expires_at):
+        self.expires_at = expires_at
+        self.done = threading.Event()
+        self.response = None
+
+class ScanDebouncer:
+    """TTL кэш (карта, минута) -> ответ на первое сканирование"""
+    
+    def __init__(self, ttl_seconds, max_entries=MAX_ENTRIES):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @property
+    def enabled(self):
+        return self.ttl > 0
+    
+    def _purge(self, now):
+        # Записи добавляются по возрастанию времени, устаревшие - в начале
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+    
+    def claim(self, serial, minute):
+        """
+        Регистрирует сканирование. Возвращает None, если его нужно обработать,
+        или (ответ, код) первого такого же сканирования, если это повтор.
+        """
+        if not self.enabled:
+            return None
+        
+        key = (serial, minute)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._purge(now)
+                entry = self._entries.get(key)
+                if entry is None:
+                    self._entries[key] = _Entry(now + self.ttl)
+                    return None
+            
+            # Первое сканирование еще обрабатывается (другим потоком)
+            if not entry.done.wait(WAIT_TIMEOUT):
+                return None
+            if entry.response is not None:
+                return entry.response
+            # Первое сканирование завершилось ошибкой и освободило ключ, повторяем
+    
+    def complete(self, serial, minute, payload, status=200):
+        """Сохраняет ответ на сканирование для последующих повторов"""
+        self._finish((serial, minute), (payload, status))
+    
+    def release(self, serial, minute):
+        """Освобождает ключ после ошибки, чтобы повтор обработался заново"""
+        self._finish((serial, minute), None)
+    
+    def _finish(self, key, response):
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            # Ответ уже сохранен: ошибка после записи (например, в уведомлениях)
+            # не должна открывать дорогу повтору
+            if entry is None or entry.done.is_set():
+                return
+            if response is None:
+                del self._entries[key]
+        entry.response = response
+        entry.done.set()
+
+scan_debouncer = ScanDebouncer(config.SCAN_DEBOUNCE_SECONDS)
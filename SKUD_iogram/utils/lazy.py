@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Отложенный импорт тяжелых модулей (pandas, matplotlib, seaborn)
+
+pandas и matplotlib импортируются сотни миллисекунд, а нужны только при
+работе с данными и отчетами. lazy_import возвращает заглушку модуля:
+настоящий импорт происходит при первом обращении к атрибуту, поэтому
+запуск сервера, бота и проверка /api/health их не загружают.
+
+    pd = lazy_import('pandas')
+    df = pd.read_csv(path)  # pandas импортируется здесь
+
+Заглушку нельзя использовать в аннотациях, вычисляемых при импорте
+модуля: в таких модулях нужен from __future__ import annotations.
+"""
+
+import importlib
+import threading
+import types
+
+class LazyModule(types.ModuleType):
+    """Модуль, импортируемый при первом обращении к атрибуту"""
+    
+    def __init__(self, name, on_import=None):
+        super().__init__(name)
+        self.__dict__['_lazy_on_import'] = on_import
+        self.__dict__['_lazy_module'] = None
+        self.__dict__['_lazy_lock'] = threading.Lock()
+    
+    def _lazy_load(self):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            with self.__dict__['_lazy_lock']:
+                module = self.__dict__['_lazy_module']
+                if module is None:
+                    on_import = self.__dict__['_lazy_on_import']
+                    if on_import is not None:
+                        on_import()
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__['_lazy_module'] = module
+        return module
+    
+    def __getattr__(self, attr):
+        return getattr(self._lazy_load(), attr)
+    
+    def __dir__(self):
+        return dir(self._lazy_load())
+
+def lazy_import(name, on_import=None):
+    """
+    Заглушка модуля name; on_import вызывается перед настоящим импортом
+    (например, выбрать бэкенд matplotlib до импорта pyplot)
+    """
+    return LazyModule(name, on_import)
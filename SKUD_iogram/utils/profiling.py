@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Профилирование запросов Flask и обработчиков бота (cProfile)
+
+Запрос профилируется, если в нем передан config.PROFILE_TOKEN (заголовок
+X-Profile или параметр ?profile=), либо случайно с вероятностью
+config.PROFILE_SAMPLE_RATE. В боте администратор включает профилирование
+своих сообщений командой /profile. Для каждого профиля в data/profiles
+сохраняются .prof (формат pstats, открывается snakeviz, конвертируется во
+flamegraph через flameprof) и .txt с топ-N функций по накопленному времени.
+"""
+
+import os
+import io
+import re
+import glob
+import hmac
+import time
+import random
+import pstats
+import cProfile
+import logging
+import threading
+from datetime import datetime
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Одновременно активен только один профилировщик: в Python 3.12+ это
+# ограничение интерпретатора, а в asyncio профили соседних задач смешались бы
+_active_lock = threading.Lock()
+
+def should_profile(token=None):
+    """Решает, профилировать ли запрос (по токену или по доле выборки)"""
+    # Сравниваются байты: compare_digest не принимает строки с не-ASCII символами
+    if token and config.PROFILE_TOKEN and hmac.compare_digest(token.encode('utf-8'), config.PROFILE_TOKEN.encode('utf-8')):
+        return True
+    return config.PROFILE_SAMPLE_RATE > 0 and random.random() < config.PROFILE_SAMPLE_RATE
+
+def start_profile():
+    """Запускает профилировщик; None, если уже идет другое профилирование"""
+    if not _active_lock.acquire(blocking=False):
+        return None
+    
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Профилировщик уже установлен другим инструментом (отладчик, coverage)
+        _active_lock.release()
+        return None
+    return profiler
+
+def finish_profile(profiler, name, duration):
+    """Останавливает профилировщик и сохраняет результат, возвращает путь к .prof"""
+    try:
+        profiler.disable()
+    finally:
+        _active_lock.release()
+    
+    try:
+        os.makedirs(config.PROFILES_DIR, exist_ok=True)
+        safe_name = re.sub(r'[^A-Za-z0-9_-]+', '_', name).strip('_')[:80]
+        base_path = os.path.join(config.PROFILES_DIR, f"{datetime.now():%Y%m%d_%H%M%S_%f}_{safe_name}")
+        
+        profiler.dump_stats(base_path + '.prof')
+        
+        summary = io.StringIO()
+        summary.write(f"{name}: {duration * 1000:.1f} мс\n\n")
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(config.PROFILE_TOP_N)
+        with open(base_path + '.txt', 'w', encoding='utf-8') as f:
+            f.write(summary.getvalue())
+        
+        rotate_profiles(config.PROFILE_KEEP)
+        logger.info(f"Профиль {name} ({duration * 1000:.1f} мс) сохранен: {base_path}.prof")
+        return base_path + '.prof'
+    except Exception as e:
+        logger.error(f"Ошибка сохранения профиля {name}: {str(e)}")
+        return None
+
+def rotate_profiles(keep):
+    """Удаляет старые профили, оставляя keep последних"""
+    profiles = sorted(glob.glob(os.path.join(config.PROFILES_DIR, '*.prof')), reverse=True)
+    for old_profile in profiles[keep:]:
+        for path in (old_profile, old_profile[:-len('.prof')] + '.txt'):
+            if os.path.exists(path):
+                os.remove(path)
+
+def init_flask_profiling(app):
+    """Подключает профилирование ко всем маршрутам Flask приложения"""
+    from flask import g, request
+    
+    @app.before_request
+    def _start_request_profile():
+        token = request.headers.get('X-Profile') or request.args.get('profile')
+        if should_profile(token):
+            g.profiler = start_profile()
+            g.profile_started_at = time.perf_counter()
+    
+    @app.teardown_request
+    def _finish_request_profile(exc):
+        profiler = g.pop('profiler', None)
+        if profiler:
+            duration = time.perf_counter() - g.pop('profile_started_at')
+            finish_profile(profiler, f"{request.method} {request.path}", duration)
+
+async def profile_handler(handler, event, data, name, force=False):
+    """Выполняет обработчик aiogram под профилировщиком (force или по доле выборки)"""
+    if not (force or should_profile()):
+        return await handler(event, data)
+    
+    profiler = start_profile()
+    if not profiler:
+        return await handler(event, data)
+    
+    started_at = time.perf_counter()
+    try:
+        return await handler(event, data)
+    finally:
+        # Пока обработчик ждет (await), профиль захватывает и другие задачи цикла
+        finish_profile(profiler, name, time.perf_counter() - started_at)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Каталог месячных отчетов
+
+Индекс data/reports в data/report_catalog.json, который обновляется при
+записи отчета: страница отчетов берет из него последние отчеты, а не
+перебирает директорию с os.stat каждого файла. Для каждого периода
+(YYYY-MM) хранятся:
+
+- excel, chart: файлы отчета;
+- size, sha256, generated_at: размер и хэш содержимого Excel, время генерации;
+- stats: сводные цифры для бота;
+- digest, data_signature: версия данных, по которой построен отчет
+  (sha256 строк месяца и (mtime_ns, размер) attendance.csv), - по ней
+  DataManager.generate_monthly_report отдает готовый отчет без генерации.
+
+Записи хранятся в порядке генерации (последняя - в конце JSON), поэтому
+"последние N отчетов" - это N записей с конца, без сортировки.
+
+Хранение: файлы, которые новый отчет того же периода заменил под другим
+именем, удаляются сразу; отчеты сверх REPORTS_KEEP (дольше всех не
+строившиеся периоды) удаляются вместе с файлами - по данным их можно
+построить заново. Отчеты, лежавшие в data/reports до появления каталога,
+переносятся в него при первом чтении.
+
+Каталог общий для бота и веб-сервера: изменения выполняются под
+блокировкой файла, записи другого процесса перечитываются по отпечатку
+JSON.
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from itertools import islice
+
+from config import config
+from utils.file_ids import file_sha256
+from utils.storage import atomic_write, file_lock
+
+logger = logging.getLogger(__name__)
+
+REPORT_CATALOG_FILE = os.path.join(config.DATA_DIR, 'report_catalog.json')
+
+# Имена, под которыми DataManager сохраняет отчеты (для переноса существующих)
+REPORT_FILE_PATTERN = re.compile(r'^attendance_report_(\d{4})_(\d{2})_\w+\.xlsx$')
+
+def frame_digest(df):
+    """sha256 содержимого DataFrame (строки в порядке чтения из CSV)"""
+    return hashlib.sha256(df.to_csv(index=False).encode('utf-8')).hexdigest()
+
+def file_signature(path):
+    """(mtime_ns, размер) файла или None, если его нет"""
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+class ReportCatalog:
+    """Период -> файлы отчета, их размер, хэш, время генерации и версия данных"""
+    
+    def __init__(self, path, reports_dir, keep):
+        self.path = path
+        self.reports_dir = reports_dir
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._entries = {}
+        # Отпечаток JSON при последнем чтении: записи другого процесса перечитываются
+        self._loaded_signature = None
+    
+    def _read(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _load(self):
+        signature = file_signature(self.path)
+        if signature is not None and signature == self._loaded_signature:
+            return self._entries
+        try:
+            self._entries = self._read()
+        except (OSError, ValueError):
+            with file_lock(self.path):
+                # Пока ждали блокировку, каталог мог построить другой процесс
+                try:
+                    self._entries = self._read()
+                except FileNotFoundError:
+                    self._entries = self._scan_reports_dir()
+                    self._save()
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Каталог отчетов поврежден, строим заново по {self.reports_dir}: {e}")
+                    self._entries = self._scan_reports_dir()
+                    self._save()
+        self._loaded_signature = file_signature(self.path)
+        return self._entries
+    
+    def _save(self):
+        atomic_write(self.path, lambda f: json.dump(self._entries, f, ensure_ascii=False, indent=2))
+        self._loaded_signature = file_signature(self.path)
+    
+    def _scan_reports_dir(self):
+        """Записи для отчетов, уже лежащих в директории (без версии данных)"""
+        found = []
+        try:
+            filenames = os.listdir(self.reports_dir)
+        except FileNotFoundError:
+            return {}
+        for filename in filenames:
+            match = REPORT_FILE_PATTERN.match(filename)
+            if match:
+                year, month = int(match.group(1)), int(match.group(2))
+                excel = os.path.join(self.reports_dir, filename)
+                chart = os.path.join(self.reports_dir, f"chart_{year}_{month:02d}.png")
+                found.append((os.path.getmtime(excel), year, month, excel, chart if os.path.exists(chart) else None))
+        
+        entries = {}
+        obsolete = set()
+        for mtime, year, month, excel, chart in sorted(found):
+            # Несколько файлов одного периода: остается самый новый
+            obsolete |= self._put(entries, self._key(year, month), self._describe(
+                {'excel': excel, 'chart': chart, 'period': None, 'stats': None,
+                 'digest': None, 'data_signature': None},
+                generated_at=datetime.fromtimestamp(mtime)
+            ))
+        if entries:
+            logger.info(f"В каталог отчетов перенесено {len(entries)} отчетов из {self.reports_dir}")
+        self._remove_files(obsolete)
+        return entries
+    
+    @staticmethod
+    def _key(year, month):
+        return f"{year:04d}-{month:02d}"
+    
+    @staticmethod
+    def _describe(entry, generated_at=None):
+        """Дополняет запись размером, хэшем Excel и временем генерации (пути - абсолютные)"""
+        return dict(
+            entry,
+            excel=os.path.abspath(entry['excel']),
+            chart=os.path.abspath(entry['chart']) if entry['chart'] else None,
+            size=os.path.getsize(entry['excel']),
+            sha256=file_sha256(entry['excel']),
+            generated_at=(generated_at or datetime.now()).isoformat(timespec='seconds')
+        )
+    
+    @staticmethod
+    def _files(entry):
+        return {path for path in (entry['excel'], entry['chart']) if path}
+    
+    def _put(self, entries, key, entry):
+        """
+        Ставит запись последней и применяет правила хранения к entries;
+        возвращает файлы, которые больше не нужны
+        """
+        obsolete = set()
+        previous = entries.pop(key, None)
+        entries[key] = entry
+        if previous is not None:
+            obsolete |= self._files(previous) - self._files(entry)
+        while self.keep and len(entries) > self.keep:
+            # Первая запись - дольше всех не строившийся период
+            obsolete |= self._files(entries.pop(next(iter(entries))))
+        return obsolete
+    
+    def _remove_files(self, paths):
+        for path in paths:
+            try:
+                os.remove(path)
+                logger.info(f"Удален устаревший файл отчета: {path}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Не удалось удалить файл отчета {path}: {e}")
+    
+    def get(self, year, month):
+        """Запись периода, если файлы отчета на месте, иначе None"""
+        with self._lock:
+            entry = self._load().get(self._key(year, month))
+        if entry is None:
+            return None
+        if not all(os.path.exists(path) for path in self._files(entry)):
+            return None
+        return entry
+    
+    def latest(self, n):
+        """Последние n построенных отчетов, новые в начале"""
+        with self._lock:
+            return list(islice(reversed(self._load().values()), n))
+    
+    def record(self, year, month, entry):
+        """
+        Добавляет построенный отчет (excel, chart, period, stats, digest,
+        data_signature) и применяет правила хранения
+        """
+        entry = self._describe(entry)
+        key = self._key(year, month)
+        with self._lock, file_lock(self.path):
+            obsolete = self._put(self._load(), key, entry)
+            self._save()
+        self._remove_files(obsolete)
+    
+    def update(self, year, month, **fields):
+        """Меняет поля записи, не считая отчет построенным заново (порядок не меняется)"""
+        key = self._key(year, month)
+        with self._lock, file_lock(self.path):
+            entries = self._load()
+            if key in entries:
+                entries[key].update(fields)
+                self._save()
+
+report_catalog = ReportCatalog(REPORT_CATALOG_FILE, config.REPORTS_DIR, config.REPORTS_KEEP)
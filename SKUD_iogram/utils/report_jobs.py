@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Очередь генерации отчетов для /generate_report
+
+Отчет за большой месяц строится дольше таймаута nginx, поэтому запрос не
+ждет генерации: он ставит задачу в очередь и сразу получает ее id, а
+страница опрашивает /api/report_jobs/<id> (статус, этап, процент, ссылка
+на файл). Повторный запрос того же месяца, пока задача не завершилась,
+получает ту же задачу, а не запускает вторую генерацию.
+
+Очередь живет в процессе веб-сервера: задачи выполняет пул потоков,
+завершенные хранятся в памяти (последние MAX_JOBS).
+"""
+
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+MAX_JOBS = 100
+
+class ReportJob:
+    """Задача генерации отчета за месяц"""
+    
+    def __init__(self, year, month):
+        self.id = uuid.uuid4().hex
+        self.year = year
+        self.month = month
+        self.status = 'queued'  # queued, running, done, empty (нет данных), error
+        self.stage = 'в очереди'
+        self.progress = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+    
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+    
+    def set_progress(self, stage, percent):
+        """Этап и процент выполнения (вызывается из генерации отчета)"""
+        self.stage = stage
+        self.progress = percent
+    
+    def to_dict(self):
+        finished_at = self.finished_at or time.time()
+        return {
+            'job_id': self.id,
+            'year': self.year,
+            'month': self.month,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': self.progress,
+            'result': self.result,
+            'error': self.error,
+            'created_at': datetime.fromtimestamp(self.created_at).isoformat(timespec='seconds'),
+            'elapsed': round(finished_at - (self.started_at or finished_at), 1)
+        }
+
+class ReportJobQueue:
+    """
+    Очередь задач build(year, month, progress) -> результат (dict) или None,
+    если данных за месяц нет
+    """
+    
+    def __init__(self, build, workers=1, max_jobs=MAX_JOBS):
+        self._build = build
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report-job')
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._active = {}  # (год, месяц) -> незавершенная задача
+        self._lock = threading.Lock()
+    
+    def submit(self, year, month):
+        """Ставит генерацию в очередь или возвращает уже идущую за тот же месяц"""
+        with self._lock:
+            job = self._active.get((year, month))
+            if job is not None:
+                return job
+            job = ReportJob(year, month)
+            self._jobs[job.id] = job
+            self._active[(year, month)] = job
+            self._trim()
+        self._executor.submit(self._run, job)
+        logger.info(f"Отчет за {month}/{year} поставлен в очередь: задача {job.id}")
+        return job
+    
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def _run(self, job):
+        job.status = 'running'
+        job.started_at = time.time()
+        job.set_progress('генерация', 5)
+        try:
+            job.result = self._build(job.year, job.month, job.set_progress)
+            job.status = 'done' if job.result else 'empty'
+            job.set_progress('готово' if job.result else 'нет данных', 100)
+        except Exception as e:
+            logger.exception(f"Ошибка при генерации отчета за {job.month}/{job.year}: {str(e)}")
+            job.status = 'error'
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._active.pop((job.year, job.month), None)
+        logger.info(f"Задача {job.id}: {job.status} за {job.finished_at - job.started_at:.1f} с")
+    
+    def _trim(self):
+        # Удаляем самые старые завершенные задачи сверх лимита
+        excess = len(self._jobs) - self.max_jobs
+        for job_id in [job_id for job_id, job in self._jobs.items() if not job.active][:max(excess, 0)]:
+            del self._jobs[job_id]
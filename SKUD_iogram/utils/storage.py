@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Безопасная запись attendance.csv из нескольких процессов
+
+api_server.py и web_server.py (и воркеры gunicorn) делают
+чтение-изменение-запись одного и того же CSV. Чтобы обновления не терялись:
+
+- чтение-изменение-запись выполняется под эксклюзивной блокировкой fcntl
+  на соседнем файле <имя>.lock (сам CSV заменяется целиком, поэтому
+  блокировать его inode бессмысленно);
+- новое содержимое пишется во временный файл в той же директории и
+  атомарно подменяет старое через os.replace, так что читатели без
+  блокировки всегда видят либо старую, либо новую версию файла целиком.
+
+На Windows (нет fcntl) блокировка действует только между потоками
+одного процесса.
+"""
+
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_thread_lock = threading.RLock()
+
+# Блокировки, уже удерживаемые текущим потоком: повторный flock на новом
+# дескрипторе того же файла заблокировал бы поток самого себя
+_held = threading.local()
+
+def lock_path(path):
+    """Путь к файлу блокировки для файла данных"""
+    return path + '.lock'
+
+@contextmanager
+def file_lock(path):
+    """Эксклюзивная блокировка файла данных между процессами (реентерабельная)"""
+    if fcntl is None:
+        with _thread_lock:
+            yield
+        return
+    
+    held = _held.__dict__.setdefault('paths', set())
+    key = os.path.abspath(path)
+    if key in held:
+        yield
+        return
+    
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    
+    fd = os.open(lock_path(path), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        # flock привязан к открытому файлу, поэтому разделяет и потоки
+        # одного процесса, у каждого из которых свой дескриптор
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        held.add(key)
+        try:
+            yield
+        finally:
+            held.discard(key)
+    finally:
+        os.close(fd)
+
+def atomic_write(path, write, mode='w', encoding='utf-8', newline=''):
+    """
+    Атомарно перезаписывает файл: write(f) пишет во временный файл рядом
+    с path, затем он сбрасывается на диск и подменяет path через os.replace
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode, encoding=encoding, newline=newline) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        
+        # mkstemp создает файл с правами 0600, сохраняем права исходного
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        else:
+            os.chmod(tmp_path, 0o644)
+        
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_csv(df, path):
+    """Атомарно сохраняет DataFrame в CSV"""
+    atomic_write(path, lambda f: df.to_csv(f, index=False))
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Прием обновлений Telegram ботом: long polling или вебхук
+
+polling (TELEGRAM_UPDATES_MODE=polling, по умолчанию): процесс бота
+(start_optimized.py или bot.py) держит открытый запрос getUpdates.
+
+webhook: Telegram сам присылает обновления POST-запросом на
+TELEGRAM_WEBHOOK_URL + TELEGRAM_WEBHOOK_PATH. Маршрут регистрируется в
+aiohttp-приложении api_server_async.py, отдельный процесс бота не нужен:
+
+- заголовок X-Telegram-Bot-Api-Secret-Token сверяется с секретом, с
+  которым был установлен вебхук; чужие запросы получают 403;
+- обновление обрабатывается в фоне, Telegram сразу получает 200 и не
+  повторяет доставку из-за долгого обработчика;
+- если установить вебхук не удалось (не задан публичный адрес, Telegram
+  недоступен), процесс принимает обновления через polling.
+
+TELEGRAM_API_URL направляет запросы бота на другой сервер Bot API:
+локальный telegram-bot-api или benchmarks/fake_telegram.py для проверки
+задержки и пропускной способности без сети.
+"""
+
+import hmac
+import asyncio
+import hashlib
+import logging
+
+from aiohttp import web
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+def create_session():
+    """Сессия бота для сервера Bot API из TELEGRAM_API_URL (None - api.telegram.org)"""
+    if not config.TELEGRAM_API_URL:
+        return None
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    return AiohttpSession(api=TelegramAPIServer.from_base(config.TELEGRAM_API_URL.rstrip('/')))
+
+def webhook_secret():
+    """Секрет вебхука: TELEGRAM_WEBHOOK_SECRET или производный от токена бота"""
+    if config.TELEGRAM_WEBHOOK_SECRET:
+        return config.TELEGRAM_WEBHOOK_SECRET
+    return hashlib.sha256(config.TELEGRAM_TOKEN.encode('utf-8')).hexdigest()
+
+def webhook_url():
+    return config.TELEGRAM_WEBHOOK_URL.rstrip('/') + config.TELEGRAM_WEBHOOK_PATH
+
+class WebhookUpdates:
+    """Вебхук бота в aiohttp-приложении с переходом на polling при ошибке"""
+    
+    def __init__(self, dp, bot):
+        self.dp = dp
+        self.bot = bot
+        self.secret = webhook_secret()
+        self._tasks = set()
+        self._polling = None
+    
+    def setup(self, app):
+        app.router.add_post(config.TELEGRAM_WEBHOOK_PATH, self.handle)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+    
+    async def handle(self, request):
+        # Сравниваются байты: compare_digest не принимает строки с не-ASCII символами
+        token = request.headers.get(SECRET_HEADER, '').encode('utf-8')
+        if not hmac.compare_digest(token, self.secret.encode('utf-8')):
+            logger.warning(f"Запрос к вебхуку с неверным секретом от {request.remote}")
+            return web.json_response({'ok': False}, status=403)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.json_response({'ok': False}, status=400)
+        
+        task = asyncio.create_task(self.dp.feed_raw_update(self.bot, update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({'ok': True})
+    
+    async def on_startup(self, app):
+        if not config.TELEGRAM_WEBHOOK_URL:
+            logger.warning("TELEGRAM_WEBHOOK_URL не задан, обновления принимаются через polling")
+            self._polling = asyncio.create_task(self._poll())
+            return
+        try:
+            await self.bot.set_webhook(
+                webhook_url(),
+                secret_token=self.secret,
+                allowed_updates=self.dp.resolve_used_update_types()
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось установить вебхук {webhook_url()}: {e}; переходим на polling")
+            self._polling = asyncio.create_task(self._poll())
+            return
+        
+        # При polling события запуска диспетчера вызывает start_polling
+        await self.dp.emit_startup(bot=self.bot, dispatcher=self.dp, **self.dp.workflow_data)
+        logger.info(f"Вебхук установлен: {webhook_url()}")
+    
+    async def _poll(self):
+        try:
+            # getUpdates не работает, пока установлен вебхук
+            await self.bot.delete_webhook()
+        except Exception as e:
+            logger.warning(f"Не удалось удалить вебхук: {e}")
+        await self.dp.start_polling(self.bot, handle_signals=False, close_bot_session=False)
+    
+    async def on_cleanup(self, app):
+        # Вебхук не удаляется: пока процесс перезапускается, Telegram копит обновления
+        if self._polling is not None:
+            self._polling.cancel()
+            await asyncio.gather(self._polling, return_exceptions=True)
+        else:
+            await self.dp.emit_shutdown(bot=self.bot, dispatcher=self.dp, **self.dp.workflow_data)
+        
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.bot.session.close()
@@ -10,22 +10,31 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
-from flask import Flask, request, jsonify, render_template, redirect, url_for, send_from_directory, flash
-import pandas as pd
+from flask import Flask, Response, request, jsonify, render_template, redirect, url_for, send_from_directory, flash
 import os
 import json
 from datetime import datetime, timedelta
 import logging
 from logging.handlers import RotatingFileHandler
 import calendar
-import matplotlib.pyplot as plt
-import seaborn as sns
-import matplotlib
-matplotlib.use('Agg')  # Для работы без GUI
 
 # Импортируем наши модули
 from config import config
 from utils.data_manager import data_manager
+from utils.metrics import (
+    stage_timer, record_notification, render_metrics,
+    SCAN_REQUESTS, UNKNOWN_CARDS, NOTIFICATIONS_IN_FLIGHT,
+    STAGE_PARSE, STAGE_LOOKUP, STAGE_STORAGE_LOAD, STAGE_STORAGE_WRITE, STAGE_NOTIFY_SEND
+)
+from utils.profiling import init_flask_profiling
+from utils.storage import file_lock, write_csv
+from utils.debounce import scan_debouncer
+from utils.lazy import lazy_import
+from utils.report_catalog import report_catalog
+from utils.report_jobs import ReportJobQueue
+
+# pandas загружается при первом обращении к данным, а не при старте
+pd = lazy_import('pandas')
 
 # Создаем экземпляр Flask
 app = Flask(__name__)
@@ -33,6 +42,9 @@ app = Flask(__name__)
 # Устанавливаем секретный ключ для flash сообщений
 app.secret_key = 'skud_secret_key_2025'
 
+# Профилирование по запросу (X-Profile / ?profile=) и по доле выборки
+init_flask_profiling(app)
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -65,14 +77,18 @@ def notify_admin(message):
         }
         
         # Отправляем HTTP запрос
-        response = requests.post(url, data=data, timeout=10)
+        with NOTIFICATIONS_IN_FLIGHT.track_inprogress():
+            response = requests.post(url, data=data, timeout=10)
         
         if response.status_code == 200:
+            record_notification('admin', True)
             logger.info(f"Уведомление успешно отправлено администратору: {message}")
         else:
+            record_notification('admin', False)
             logger.error(f"Ошибка отправки уведомления: {response.status_code} - {response.text}")
             
     except Exception as e:
+        record_notification('admin', False)
         logger.error(f"Ошибка при отправке уведомления администратору: {str(e)}")
 
 def load_employee_telegram_ids():
@@ -143,124 +159,163 @@ def send_employee_notification(employee_name, event_type, time_str, date_str, se
         }
         
         # Отправляем HTTP запрос
-        response = requests.post(url, data=data, timeout=10)
+        with NOTIFICATIONS_IN_FLIGHT.track_inprogress():
+            response = requests.post(url, data=data, timeout=10)
         
         if response.status_code == 200:
+            record_notification('employee', True)
             logger.info(f"Уведомление отправлено сотруднику {employee_name} (ID: {employee_telegram_id}): {event_type}")
         else:
+            record_notification('employee', False)
             logger.error(f"Ошибка отправки уведомления сотруднику {employee_name}: {response.status_code} - {response.text}")
             
     except Exception as e:
+        record_notification('employee', False)
         logger.error(f"Ошибка при отправке уведомления сотруднику {employee_name}: {str(e)}")
 
 # Маршрут для обработки запросов от ESP32
 @app.route('/api/attendance', methods=['POST'])
 def record_attendance():
+    debounce_key = None
     try:
-        data = request.json
-        logger.info(f"Получены данные: {data}")
-        
-        if not data or 'serial' not in data or 'time' not in data:
-            logger.error("Неверный формат данных")
-            return jsonify({
-                'status': 'error',
-                'message': 'Неверный формат данных'
-            }), 400
-        
-        serial = data['serial'].upper()
-        timestamp = data['time']
+        with stage_timer(STAGE_PARSE):
+            data = request.json
+            logger.info(f"Получены данные: {data}")
+            
+            if not data or 'serial' not in data or 'time' not in data:
+                logger.error("Неверный формат данных")
+                SCAN_REQUESTS.labels(status='bad_request').inc()
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Неверный формат данных'
+                }), 400
+            
+            serial = data['serial'].upper()
+            timestamp = data['time']
+            
+            # Парсим дату и время
+            dt = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+            date_str = dt.strftime('%Y-%m-%d')
+            time_str = dt.strftime('%H:%M')
+        
+        # Повтор того же сканирования (карта у считывателя, ретрай прошивки)
+        # получает ответ первого, без чтения файлов и уведомлений
+        debounce_key = (serial, f"{date_str} {time_str}")
+        cached = scan_debouncer.claim(*debounce_key)
+        if cached:
+            logger.info(f"Повторное сканирование {serial} в {time_str} ({date_str}) пропущено")
+            SCAN_REQUESTS.labels(status='duplicate').inc()
+            payload, status = cached
+            return jsonify(payload), status
         
         # Загружаем список сотрудников
-        employees = data_manager.load_employees()
+        with stage_timer(STAGE_LOOKUP):
+            employees = data_manager.load_employees()
         
         # Проверяем, есть ли сотрудник с таким серийным номером
         if serial not in employees:
             logger.warning(f"Неизвестный серийный номер: {serial}")
+            SCAN_REQUESTS.labels(status='unknown').inc()
+            UNKNOWN_CARDS.inc()
             
             # Отправляем уведомление администратору о неизвестной карте
             unknown_card_message = f"СКУД: Обнаружена неизвестная карта: {serial}\n\n" \
                                   f"Для добавления сотрудника отправьте команду:\n" \
                                   f"/add_employee {serial} Имя_Сотрудника"
-            notify_admin(unknown_card_message)
-            
-            return jsonify({
+            response = {
                 'status': 'unknown',
                 'message': f'Неизвестный ключ: {serial}'
-            }), 404
+            }
+            scan_debouncer.complete(*debounce_key, response, 404)
+            
+            with stage_timer(STAGE_NOTIFY_SEND):
+                notify_admin(unknown_card_message)
+            
+            return jsonify(response), 404
         
         employee_name = employees[serial]
         logger.info(f"Сотрудник: {employee_name}")
         
-        # Парсим дату и время
-        dt = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
-        date_str = dt.strftime('%Y-%m-%d')
-        time_str = dt.strftime('%H:%M')
-        
-        # Загружаем данные посещаемости
-        df = data_manager.load_attendance_data()
-        
-        # Ищем запись для этого сотрудника и даты
-        mask = (df['date'] == date_str) & (df['employee'] == employee_name)
-        
-        if mask.any():
-            # Запись уже существует
-            row = df.loc[mask].iloc[0]
-            idx = df.loc[mask].index[0]
+        # Чтение-изменение-запись под блокировкой: другие процессы (API сервер,
+        # воркеры gunicorn) пишут тот же файл
+        with file_lock(config.ATTENDANCE_FILE):
+            # Загружаем данные посещаемости
+            with stage_timer(STAGE_STORAGE_LOAD):
+                df = data_manager.load_attendance_data()
             
-            if pd.isna(row['arrival']) or row['arrival'] == '':
-                # Записываем приход
-                df.at[idx, 'arrival'] = time_str
-                event_type = 'приход'
-            elif pd.isna(row['departure']) or row['departure'] == '':
-                # Записываем уход
-                df.at[idx, 'departure'] = time_str
-                event_type = 'уход'
+            # Ищем запись для этого сотрудника и даты
+            mask = (df['date'] == date_str) & (df['employee'] == employee_name)
+            
+            if mask.any():
+                # Запись уже существует
+                row = df.loc[mask].iloc[0]
+                idx = df.loc[mask].index[0]
+                
+                if pd.isna(row['arrival']) or row['arrival'] == '':
+                    # Записываем приход
+                    df.at[idx, 'arrival'] = time_str
+                    event_type = 'приход'
+                elif pd.isna(row['departure']) or row['departure'] == '':
+                    # Записываем уход
+                    df.at[idx, 'departure'] = time_str
+                    event_type = 'уход'
+                else:
+                    # Обновляем уход (повторное сканирование)
+                    df.at[idx, 'departure'] = time_str
+                    event_type = 'уход (обновлено)'
             else:
-                # Обновляем уход (повторное сканирование)
-                df.at[idx, 'departure'] = time_str
-                event_type = 'уход (обновлено)'
-        else:
-            # Создаем новую запись (первое сканирование = приход)
-            new_row = {
-                'date': date_str,
-                'employee': employee_name,
-                'arrival': time_str,
-                'departure': ''
-            }
-            df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-            event_type = 'приход'
-        
-        # Сохраняем обновленные данные
-        df.to_csv(config.ATTENDANCE_FILE, index=False)
+                # Создаем новую запись (первое сканирование = приход)
+                new_row = {
+                    'date': date_str,
+                    'employee': employee_name,
+                    'arrival': time_str,
+                    'departure': ''
+                }
+                df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
+                event_type = 'приход'
+            
+            # Сохраняем обновленные данные
+            with stage_timer(STAGE_STORAGE_WRITE):
+                write_csv(df, config.ATTENDANCE_FILE)
         
         logger.info(f"Записано событие: {event_type} для {employee_name} в {time_str} ({date_str})")
-        
-        # Отправляем уведомление администратору
-        notification_message = f"СКУД: {employee_name}: {event_type} в {time_str} ({date_str})"
-        notify_admin(notification_message)
-        
-        # Отправляем уведомление сотруднику
-        send_employee_notification(employee_name, event_type, time_str, date_str, serial)
-        
-        # Возвращаем ответ ESP32
-        return jsonify({
+        SCAN_REQUESTS.labels(status='success').inc()
+        response = {
             'status': 'success',
             'message': 'Данные успешно записаны',
             'employee': employee_name,
             'event': event_type,
             'time': time_str,
             'date': date_str
-        })
+        }
+        scan_debouncer.complete(*debounce_key, response)
+        
+        with stage_timer(STAGE_NOTIFY_SEND):
+            # Отправляем уведомление администратору
+            notification_message = f"СКУД: {employee_name}: {event_type} в {time_str} ({date_str})"
+            notify_admin(notification_message)
+            
+            # Отправляем уведомление сотруднику
+            send_employee_notification(employee_name, event_type, time_str, date_str, serial)
+        
+        # Возвращаем ответ ESP32
+        return jsonify(response)
         
     except ValueError as e:
+        if debounce_key:
+            scan_debouncer.release(*debounce_key)
         logger.error(f"Ошибка парсинга данных: {str(e)}")
+        SCAN_REQUESTS.labels(status='bad_request').inc()
         return jsonify({
             'status': 'error',
             'message': f'Ошибка формата времени: {str(e)}'
         }), 400
         
     except Exception as e:
+        if debounce_key:
+            scan_debouncer.release(*debounce_key)
         logger.exception(f"Ошибка при обработке запроса от ESP32: {str(e)}")
+        SCAN_REQUESTS.labels(status='error').inc()
         return jsonify({
             'status': 'error',
             'message': f'Внутренняя ошибка сервера: {str(e)}'
@@ -280,6 +335,13 @@ def health_check():
         }
     })
 
+# Метрики в формате Prometheus
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Метрики веб-сервера (задержки этапов сканирования, уведомления, отчеты)"""
+    body, content_type = render_metrics()
+    return Response(body, mimetype=content_type)
+
 # API для получения текущей статистики
 @app.route('/api/current-stats', methods=['GET'])
 def current_stats():
@@ -443,16 +505,15 @@ def telegram_reports():
         # Получаем список последних отчетов
         recent_reports = []
         try:
-            for filename in os.listdir(config.REPORTS_DIR):
-                if filename.endswith('.xlsx') or filename.endswith('.pdf') or filename.endswith('.csv'):
-                    recent_reports.append({
-                        'name': filename,
-                        'filename': filename
-                    })
-            
-            # Сортируем отчеты по времени создания (новые в начале)
-            recent_reports.sort(key=lambda x: os.path.getmtime(os.path.join(config.REPORTS_DIR, x['filename'])), reverse=True)
-            recent_reports = recent_reports[:5]  # Только последние 5 отчетов
+            # Каталог хранит отчеты в порядке генерации - директорию не перебираем
+            for entry in report_catalog.latest(5):
+                filename = os.path.basename(entry['excel'])
+                recent_reports.append({
+                    'name': filename,
+                    'filename': filename,
+                    'size': entry['size'],
+                    'generated_at': entry['generated_at']
+                })
         except Exception as e:
             logger.error(f"Ошибка при получении списка отчетов: {str(e)}")
         
@@ -462,34 +523,68 @@ def telegram_reports():
                               recent_reports=recent_reports,
                               today_present=today_present,
                               total_employees=len(employees),
+                              report_job_id=request.args.get('job'),
                               tg_webapp=True)  # Флаг для WebApp
     except Exception as e:
         logger.exception(f"Ошибка в telegram_reports: {str(e)}")
         return f"Ошибка при загрузке страницы отчетов: {str(e)}", 500
 
+# Отчеты строятся в очереди задач: запрос /generate_report не ждет генерации
+def build_report(year, month, progress):
+    """Задача очереди отчетов: генерирует отчет и возвращает имена файлов"""
+    excel_file, chart_file, period = data_manager.generate_monthly_report(year, month, progress)
+    if excel_file is None:
+        return None
+    return {
+        'period': period,
+        'excel': os.path.basename(excel_file),
+        'chart': os.path.basename(chart_file)
+    }
+
+report_jobs = ReportJobQueue(build_report, workers=config.REPORT_WORKERS)
+
+def wants_json():
+    """Клиент ждет JSON (fetch со страницы), а не HTML с редиректом"""
+    accept = request.accept_mimetypes
+    return accept.accept_json and not accept.accept_html
+
+def report_job_payload(job):
+    """Статус задачи со ссылками для опроса и скачивания"""
+    data = job.to_dict()
+    data['status_url'] = url_for('report_job_status', job_id=job.id)
+    if job.result:
+        data['download_url'] = url_for('download_report', filename=job.result['excel'])
+    return data
+
 # Маршрут для генерации отчета
 @app.route('/generate_report', methods=['POST'])
 def generate_report():
     try:
         year = int(request.form.get('year'))
         month = int(request.form.get('month'))
-        
-        logger.info(f"Генерация отчета за {month}/{year}")
-        
-        # Генерируем отчет
-        excel_file, chart_file, period = data_manager.generate_monthly_report(year, month)
-        
-        if excel_file is None:
-            flash(f'Нет данных за {calendar.month_name[month]} {year}', 'error')
-            return redirect(url_for('telegram_reports'))
-        
-        flash(f'Отчет за {period} успешно сгенерирован', 'success')
-        return redirect(url_for('telegram_reports'))
-        
-    except Exception as e:
-        logger.exception(f"Ошибка при генерации отчета: {str(e)}")
-        flash(f'Ошибка при генерации отчета: {str(e)}', 'error')
+        if not 1 <= month <= 12:
+            raise ValueError(month)
+    except (TypeError, ValueError):
+        if wants_json():
+            return jsonify({'status': 'error', 'message': 'Необходимо указать год и месяц'}), 400
+        flash('Необходимо указать год и месяц', 'error')
         return redirect(url_for('telegram_reports'))
+    
+    # Генерация идет в фоне, страница опрашивает статус задачи
+    job = report_jobs.submit(year, month)
+    
+    if wants_json():
+        return jsonify(report_job_payload(job)), 202
+    
+    return redirect(url_for('telegram_reports', job=job.id))
+
+# Статус задачи генерации отчета
+@app.route('/api/report_jobs/<job_id>', methods=['GET'])
+def report_job_status(job_id):
+    job = report_jobs.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Задача не найдена'}), 404
+    return jsonify(report_job_payload(job))
 
 # Маршрут для скачивания отчета
 @app.route('/download_report/<filename>')
@@ -539,6 +634,9 @@ def add_employee_api():
         }), 500
 
 if __name__ == '__main__':
+    config.startup()
+    data_manager.log_paths()
+    
     logger.info("Запуск веб-сервера СКУД")
     logger.info(f"Рабочая директория: {os.getcwd()}")
     logger.info(f"Файл посещаемости: {config.ATTENDANCE_FILE}")
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Стресс-тест записи attendance.csv из нескольких процессов (SKUD_iogram/utils/storage.py)
+
+Несколько процессов-писателей одновременно выполняют чтение-изменение-запись
+одного CSV так же, как /api/attendance: читают файл целиком, добавляют
+строку своего сотрудника и перезаписывают файл. Параллельно процессы-читатели
+непрерывно читают файл и проверяют, что он не обрезан (заголовок на месте,
+в каждой строке 4 поля).
+
+После прогона проверяется, что в файле есть все N x P строк, т.е. ни одно
+обновление не потеряно. Для сравнения со старым поведением есть режимы
+--no-lock (без блокировки) и --direct-write (запись прямо в файл, без
+временного файла и os.replace).
+
+Код завершения 0, если потерь и обрезанных чтений нет.
+
+Пример:
+    python benchmarks/csv_storage_stress.py --writers 8 --scans 200 --readers 2
+    python benchmarks/csv_storage_stress.py --no-lock --direct-write
+"""
+
+import os
+import sys
+import csv
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from contextlib import nullcontext
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'SKUD_iogram'))
+
+from utils.storage import file_lock, atomic_write
+
+FIELDS = ['date', 'employee', 'arrival', 'departure']
+
+def read_rows(path):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return list(csv.reader(f))
+
+def write_rows(f, rows):
+    csv.writer(f).writerows(rows)
+
+def writer(path, writer_id, scans, use_lock, use_atomic):
+    """Писатель: scans раз добавляет строку под своим сотрудником"""
+    for i in range(scans):
+        with file_lock(path) if use_lock else nullcontext():
+            rows = read_rows(path)
+            rows.append(['2026-01-01', f"Сотрудник {writer_id:02d}-{i:05d}", '09:00', ''])
+            if use_atomic:
+                atomic_write(path, lambda f: write_rows(f, rows))
+            else:
+                with open(path, 'w', encoding='utf-8', newline='') as f:
+                    write_rows(f, rows)
+
+def reader(path, stop, torn_reads, reads):
+    """Читатель без блокировки: считает чтения обрезанного или пустого файла"""
+    while not stop.is_set():
+        try:
+            rows = read_rows(path)
+        except (FileNotFoundError, UnicodeDecodeError, csv.Error):
+            # Файл подменен или обрезан посреди многобайтового символа
+            rows = []
+        with reads.get_lock():
+            reads.value += 1
+        if not rows or rows[0] != FIELDS or any(len(row) != len(FIELDS) for row in rows):
+            with torn_reads.get_lock():
+                torn_reads.value += 1
+
+def main():
+    parser = argparse.ArgumentParser(description='Стресс-тест многопроцессной записи attendance.csv')
+    parser.add_argument('--writers', type=int, default=8, help='Число процессов-писателей')
+    parser.add_argument('--scans', type=int, default=100, help='Сканирований на писателя')
+    parser.add_argument('--readers', type=int, default=2, help='Число процессов-читателей')
+    parser.add_argument('--no-lock', action='store_true', help='Без блокировки (старое поведение)')
+    parser.add_argument('--direct-write', action='store_true', help='Без временного файла и os.replace')
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix='skud_stress_')
+    path = os.path.join(workdir, 'attendance.csv')
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        write_rows(f, [FIELDS])
+    
+    stop = multiprocessing.Event()
+    torn_reads = multiprocessing.Value('i', 0)
+    reads = multiprocessing.Value('i', 0)
+    
+    try:
+        readers = [
+            multiprocessing.Process(target=reader, args=(path, stop, torn_reads, reads))
+            for _ in range(args.readers)
+        ]
+        writers = [
+            multiprocessing.Process(target=writer, args=(path, i, args.scans, not args.no_lock, not args.direct_write))
+            for i in range(args.writers)
+        ]
+        
+        started_at = time.perf_counter()
+        for process in readers + writers:
+            process.start()
+        for process in writers:
+            process.join()
+        duration = time.perf_counter() - started_at
+        
+        stop.set()
+        for process in readers:
+            process.join()
+        
+        rows = read_rows(path)[1:]
+        expected = args.writers * args.scans
+        lost = expected - len({row[1] for row in rows if len(row) == len(FIELDS)})
+        failed = [process.exitcode for process in writers if process.exitcode != 0]
+        
+        print(f"Писателей {args.writers} x {args.scans} сканирований за {duration:.2f} с "
+              f"({expected / duration:.0f} в секунду), блокировка: {'нет' if args.no_lock else 'да'}, "
+              f"атомарная замена: {'нет' if args.direct_write else 'да'}")
+        print(f"Строк в файле: {len(rows)} из {expected}, потеряно обновлений: {lost}")
+        print(f"Чтений: {reads.value}, обрезанных: {torn_reads.value}")
+        if failed:
+            print(f"Писатели завершились с ошибкой: {failed}")
+        
+        sys.exit(1 if lost or torn_reads.value or failed else 0)
+    finally:
+        stop.set()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Локальная замена Telegram Bot API: задержка и пропускная способность бота без сети
+
+Сервер отвечает на методы Bot API, которые вызывают боты СКУД (getMe,
+setWebhook, deleteWebhook, getUpdates, sendMessage, ...), и сам доставляет
+боту обновления так же, как Telegram:
+
+- если бот установил вебхук (setWebhook), обновление отправляется
+  POST-запросом на его адрес с заголовком X-Telegram-Bot-Api-Secret-Token;
+- иначе оно отдается боту через getUpdates (long polling).
+
+Нагрузка: --updates сообщений /start от --user-id (он должен быть в
+ALLOWED_USERS бота), не больше --concurrency одновременно ждущих ответа.
+Каждое сообщение приходит из своего чата, поэтому ответ бота (sendMessage
+в этот чат) сопоставляется с обновлением; задержка - от доставки
+обновления до ответа бота. В режиме вебхука перед нагрузкой проверяется,
+что запрос с неверным секретом отклоняется.
+
+Бот направляется на этот сервер переменной TELEGRAM_API_URL. Код
+завершения 0, если бот ответил на все обновления и отклонил неверный секрет.
+
+Пример (SKUD_iogram, вебхук в api_server_async.py):
+    python benchmarks/fake_telegram.py --port 8081 --updates 500 --concurrency 20 &
+    cd SKUD_iogram && TELEGRAM_API_URL=http://127.0.0.1:8081 TELEGRAM_UPDATES_MODE=webhook \\
+        TELEGRAM_WEBHOOK_URL=http://127.0.0.1:5001 python api_server_async.py --port 5001
+
+Тот же прогон с polling для сравнения:
+    cd SKUD_iogram && TELEGRAM_API_URL=http://127.0.0.1:8081 python start_optimized.py
+
+SKUD Enhanced: те же переменные для run.py, TELEGRAM_WEBHOOK_URL - адрес Flask.
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+from collections import defaultdict
+from datetime import datetime
+
+import aiohttp
+from aiohttp import web
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+BOT_USER = {'id': 7000000001, 'is_bot': True, 'first_name': 'SKUD', 'username': 'skud_fake_bot'}
+FIRST_CHAT_ID = 900000000
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def latency_summary(values):
+    """Сводка задержек в миллисекундах"""
+    values_ms = sorted(value * 1000 for value in values)
+    if not values_ms:
+        return None
+    return {
+        'mean': round(sum(values_ms) / len(values_ms), 3),
+        'p50': round(percentile(values_ms, 50), 3),
+        'p95': round(percentile(values_ms, 95), 3),
+        'p99': round(percentile(values_ms, 99), 3),
+        'max': round(values_ms[-1], 3)
+    }
+
+async def read_params(request):
+    """Параметры метода: JSON или форма (aiogram передает вложенные объекты строкой JSON)"""
+    if request.content_type == 'application/json':
+        return await request.json()
+    params = {}
+    for key, value in (await request.post()).items():
+        if isinstance(value, str):
+            params[key] = value
+    params.update(request.query)
+    return params
+
+class FakeTelegram:
+    """Bot API в памяти: обновления для бота и ожидание его ответов по чатам"""
+    
+    def __init__(self):
+        self.webhook = None  # (url, secret)
+        self.queue = []  # обновления для getUpdates
+        self.queue_event = asyncio.Event()
+        self.connected = asyncio.Event()
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.waiting = {}  # chat_id -> future ответа бота
+        self.calls = defaultdict(int)
+    
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = await read_params(request)
+        self.calls[method] += 1
+        handler = getattr(self, f"api_{method.lower()}", None)
+        result = await handler(params) if handler else True
+        return web.json_response({'ok': True, 'result': result})
+    
+    def _message(self, chat_id, text=None):
+        self.next_message_id += 1
+        return {
+            'message_id': self.next_message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': text or ''
+        }
+    
+    def _reply(self, params, **extra):
+        chat_id = int(params.get('chat_id', 0))
+        future = self.waiting.pop(chat_id, None)
+        if future is not None and not future.done():
+            future.set_result(time.perf_counter())
+        return dict(self._message(chat_id, params.get('text') or params.get('caption')), **extra)
+    
+    async def api_getme(self, params):
+        return BOT_USER
+    
+    async def api_setwebhook(self, params):
+        self.webhook = (params['url'], params.get('secret_token', ''))
+        self.connected.set()
+        return True
+    
+    async def api_deletewebhook(self, params):
+        self.webhook = None
+        return True
+    
+    async def api_getwebhookinfo(self, params):
+        return {
+            'url': self.webhook[0] if self.webhook else '',
+            'has_custom_certificate': False,
+            'pending_update_count': len(self.queue)
+        }
+    
+    async def api_getupdates(self, params):
+        self.connected.set()
+        offset = int(params.get('offset') or 0)
+        self.queue = [update for update in self.queue if update['update_id'] >= offset]
+        if not self.queue:
+            self.queue_event.clear()
+            try:
+                await asyncio.wait_for(self.queue_event.wait(), float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self.queue[:int(params.get('limit') or 100)]
+    
+    async def api_sendmessage(self, params):
+        return self._reply(params)
+    
+    async def api_editmessagetext(self, params):
+        return self._reply(params)
+    
+    async def api_senddocument(self, params):
+        return self._reply(params, document={'file_id': 'fake-document', 'file_unique_id': 'fake-document'})
+    
+    async def api_sendphoto(self, params):
+        return self._reply(params, photo=[{'file_id': 'fake-photo', 'file_unique_id': 'fake-photo',
+                                           'width': 1, 'height': 1}])
+    
+    def make_update(self, chat_id, user_id, text='/start'):
+        self.next_update_id += 1
+        self.next_message_id += 1
+        return {
+            'update_id': self.next_update_id,
+            'message': {
+                'message_id': self.next_message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private', 'first_name': 'Load'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'Load'},
+                'text': text,
+                'entities': [{'offset': 0, 'length': len(text.split()[0]), 'type': 'bot_command'}]
+            }
+        }
+    
+    async def deliver(self, session, update, secret=None):
+        """Доставляет обновление боту; возвращает HTTP статус вебхука (None при polling)"""
+        if self.webhook is None:
+            self.queue.append(update)
+            self.queue_event.set()
+            return None
+        url, webhook_secret = self.webhook
+        headers = {SECRET_HEADER: webhook_secret if secret is None else secret}
+        async with session.post(url, json=update, headers=headers) as response:
+            await response.read()
+            return response.status
+
+async def run_load(fake, args):
+    """Отправляет обновления и ждет ответы бота"""
+    await asyncio.wait_for(fake.connected.wait(), args.wait_bot)
+    # Бот мог сначала начать polling, а затем установить вебхук (или наоборот)
+    await asyncio.sleep(args.settle)
+    mode = 'webhook' if fake.webhook else 'polling'
+    print(f"▶ Бот подключился ({mode}), {args.updates} обновлений, "
+          f"до {args.concurrency} одновременно", file=sys.stderr)
+    
+    results = {'mode': mode, 'webhook_statuses': defaultdict(int), 'latencies': [], 'timeouts': 0}
+    async with aiohttp.ClientSession() as session:
+        if fake.webhook:
+            update = fake.make_update(FIRST_CHAT_ID - 1, args.user_id)
+            results['bad_secret_status'] = await fake.deliver(session, update, secret='wrong-secret')
+        
+        semaphore = asyncio.Semaphore(args.concurrency)
+        
+        async def one(index):
+            async with semaphore:
+                chat_id = FIRST_CHAT_ID + index
+                future = asyncio.get_running_loop().create_future()
+                fake.waiting[chat_id] = future
+                sent_at = time.perf_counter()
+                status = await fake.deliver(session, fake.make_update(chat_id, args.user_id))
+                if status is not None:
+                    results['webhook_statuses'][str(status)] += 1
+                try:
+                    answered_at = await asyncio.wait_for(future, args.timeout)
+                    results['latencies'].append(answered_at - sent_at)
+                except asyncio.TimeoutError:
+                    fake.waiting.pop(chat_id, None)
+                    results['timeouts'] += 1
+        
+        started = time.perf_counter()
+        await asyncio.gather(*(one(index) for index in range(args.updates)))
+        results['duration'] = time.perf_counter() - started
+    return results
+
+async def main_async(args):
+    fake = FakeTelegram()
+    app = web.Application()
+    app.router.add_route('*', '/bot{token}/{method}', fake.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, args.host, args.port).start()
+    print(f"▶ Fake Telegram Bot API: http://{args.host}:{args.port} (TELEGRAM_API_URL)", file=sys.stderr)
+    try:
+        return await run_load(fake, args), dict(fake.calls)
+    finally:
+        await runner.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальная замена Telegram Bot API для нагрузки на бота СКУД')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--updates', type=int, default=200, help='Сколько обновлений отправить')
+    parser.add_argument('--concurrency', type=int, default=10, help='Обновлений без ответа одновременно')
+    parser.add_argument('--user-id', type=int, default=42291783, help='Отправитель (из ALLOWED_USERS бота)')
+    parser.add_argument('--wait-bot', type=float, default=60.0, help='Сколько ждать подключения бота, сек')
+    parser.add_argument('--settle', type=float, default=1.0, help='Пауза после подключения бота, сек')
+    parser.add_argument('--timeout', type=float, default=10.0, help='Сколько ждать ответа на обновление, сек')
+    parser.add_argument('--output', help='Файл для результатов JSON')
+    args = parser.parse_args()
+    
+    results, calls = asyncio.run(main_async(args))
+    duration = results['duration']
+    answered = len(results['latencies'])
+    report = {
+        'benchmark': 'fake_telegram',
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'params': {key: value for key, value in vars(args).items() if key != 'output'},
+        'summary': {
+            'mode': results['mode'],
+            'updates': args.updates,
+            'answered': answered,
+            'timeouts': results['timeouts'],
+            'duration_seconds': round(duration, 3),
+            'updates_per_second': round(answered / duration, 2) if duration else None,
+            'latency_ms': latency_summary(results['latencies']),
+            'webhook_statuses': dict(results['webhook_statuses']),
+            'bad_secret_status': results.get('bad_secret_status'),
+            'api_calls': calls
+        }
+    }
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    summary = report['summary']
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    
+    rejected = summary['mode'] != 'webhook' or summary['bad_secret_status'] == 403
+    if summary['timeouts'] or not rejected:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Время импорта точек входа СКУД (python -X importtime)
+
+Для каждой точки входа запускается отдельный процесс
+python -X importtime -c "import <модуль>" и из его вывода берется полное
+(cumulative) время импорта модуля, список самых тяжелых зависимостей и
+признак того, загружены ли pandas, matplotlib и seaborn. Процесс
+запускается во временной рабочей директории: так видно, что импорт не
+создает файлов и директорий (data/, базы, логи), - созданные файлы
+попадают в отчет.
+
+    iogram_api         SKUD_iogram/api_server.py
+    iogram_api_async   SKUD_iogram/api_server_async.py
+    iogram_web         SKUD_iogram/web_server.py
+    iogram_bot         SKUD_iogram/bot.py
+    iogram_bot_simple  SKUD_iogram/bot_simple.py
+    iogram_start       SKUD_iogram/start_optimized.py
+    legacy_db          SKUD_Python/app/db.py
+
+С --baseline-rev то же измеряется для дерева из указанной ревизии git
+(извлекается через git archive). Результаты сохраняются в JSON, чтобы
+отслеживать время запуска между версиями.
+
+Пример:
+    python benchmarks/import_time.py --baseline-rev HEAD~1 --repeat 5 --output import_time.json
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import tarfile
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Точка входа: (каталог относительно корня, импортируемый модуль)
+ENTRY_POINTS = {
+    'iogram_api': ('SKUD_iogram', 'api_server'),
+    'iogram_api_async': ('SKUD_iogram', 'api_server_async'),
+    'iogram_web': ('SKUD_iogram', 'web_server'),
+    'iogram_bot': ('SKUD_iogram', 'bot'),
+    'iogram_bot_simple': ('SKUD_iogram', 'bot_simple'),
+    'iogram_start': ('SKUD_iogram', 'start_optimized'),
+    'legacy_db': ('SKUD_Python/app', 'db'),
+}
+
+HEAVY_MODULES = ('pandas', 'matplotlib', 'seaborn')
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+def parse_importtime(stderr):
+    """Строки -X importtime -> список (модуль, self мкс, cumulative мкс, вложенность)"""
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return rows
+
+def snapshot(directory):
+    result = set()
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            result.add(os.path.relpath(os.path.join(dirpath, filename), directory))
+    return result
+
+def measure_once(tree, subdir, module):
+    """Один запуск: время импорта, тяжелые зависимости и созданные файлы"""
+    workdir = tempfile.mkdtemp(prefix='skud_importtime_')
+    try:
+        env = dict(os.environ, PYTHONPATH=os.path.join(tree, subdir), PYTHONDONTWRITEBYTECODE='1')
+        code = f"import {module}, sys; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+        )
+        rows = parse_importtime(process.stderr)
+        if process.returncode != 0:
+            error = [line for line in process.stderr.splitlines() if not line.startswith('import time:')]
+            return {'error': error[-1] if error else f"код завершения {process.returncode}"}
+        
+        total = next((cumulative for name, _, cumulative, _ in reversed(rows) if name == module), None)
+        if total is None:
+            return {'error': f"модуль {module} не найден в выводе -X importtime"}
+        top = sorted(rows, key=lambda row: row[2], reverse=True)
+        return {
+            'total_ms': total / 1000,
+            'heavy_loaded': [name for name in process.stdout.strip().split(',') if name],
+            # Тяжелые прямые зависимости: модули первого уровня вложенности
+            'top_imports': [
+                {'module': name, 'cumulative_ms': round(cumulative / 1000, 1)}
+                for name, _, cumulative, depth in top if depth == 1
+            ][:10],
+            'created_files': sorted(snapshot(workdir))
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def measure_tree(tree, entry_points, repeat):
+    results = {}
+    for label in entry_points:
+        subdir, module = ENTRY_POINTS[label]
+        runs = [measure_once(tree, subdir, module) for _ in range(repeat)]
+        failed = [run for run in runs if 'error' in run]
+        if failed:
+            results[label] = {'error': failed[0]['error']}
+            continue
+        result = dict(runs[-1])
+        result['total_ms'] = round(statistics.median(run['total_ms'] for run in runs), 1)
+        results[label] = result
+    return results
+
+def extract_revision(rev, directory):
+    """Извлекает SKUD_iogram и SKUD_Python из ревизии git в directory"""
+    archive = os.path.join(directory, 'tree.tar')
+    subprocess.run(
+        ['git', 'archive', '--format=tar', '-o', archive, rev, 'SKUD_iogram', 'SKUD_Python'],
+        cwd=ROOT_DIR, check=True
+    )
+    with tarfile.open(archive) as tar:
+        tar.extractall(directory)
+    os.remove(archive)
+
+def main():
+    parser = argparse.ArgumentParser(description='Время импорта точек входа СКУД')
+    parser.add_argument('--entry-points', nargs='+', choices=sorted(ENTRY_POINTS), default=list(ENTRY_POINTS))
+    parser.add_argument('--repeat', type=int, default=3, help='Запусков на точку входа (берется медиана)')
+    parser.add_argument('--baseline-rev', help='Ревизия git для сравнения')
+    parser.add_argument('--output', help='Файл для результатов JSON')
+    args = parser.parse_args()
+    
+    report = {'benchmark': 'import_time', 'python': sys.version.split()[0],
+              'baseline_rev': args.baseline_rev, 'results': {}}
+    versions = [('current', ROOT_DIR)]
+    tmpdir = None
+    try:
+        if args.baseline_rev:
+            tmpdir = tempfile.mkdtemp(prefix='skud_importtime_rev_')
+            extract_revision(args.baseline_rev, tmpdir)
+            versions.insert(0, ('baseline', tmpdir))
+        
+        for label, tree in versions:
+            print(f"▶ {label}...", file=sys.stderr)
+            report['results'][label] = measure_tree(tree, args.entry_points, args.repeat)
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+    
+    print(f"{'entry point':<18} {'version':<9} {'import ms':>10}  heavy modules / created files")
+    for entry in args.entry_points:
+        for label, _ in versions:
+            result = report['results'][label][entry]
+            if 'error' in result:
+                print(f"{entry:<18} {label:<9} {'-':>10}  ошибка: {result['error']}")
+                continue
+            notes = ', '.join(result['heavy_loaded']) or '-'
+            if result['created_files']:
+                notes += f" / {', '.join(result['created_files'])}"
+            print(f"{entry:<18} {label:<9} {result['total_ms']:>10}  {notes}")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
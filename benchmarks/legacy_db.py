@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Задержка вызовов SKUD_Python/app/db.py: текущая версия против базовой
+
+Сравнивает две версии модуля на одинаковых данных: текущую из рабочей
+копии и базовую из ревизии git (--baseline-rev, например ревизия до
+перехода на постоянное соединение, WAL и индексы). Для каждой функции
+измеряется задержка одного вызова (p50/p95/p99):
+
+    get_employee_by_serial   поиск сотрудника по карте
+    record_attendance        приход и уход (чередуются по дням)
+    get_monthly_attendance   выборка месяца из всей истории
+
+Обе версии копируются во временный каталог (app/db.py), чтобы база
+создавалась там, а не в SKUD_Python/data (старые версии создают ее при
+импорте, новые - в init_db()).
+
+Пример:
+    python benchmarks/legacy_db.py --baseline-rev 4799afc --rows 200000 --employees 200
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+import importlib.util
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_MODULE = 'SKUD_Python/app/db.py'
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def latency_summary(values):
+    values_ms = sorted(value * 1000 for value in values)
+    return {
+        'calls': len(values_ms),
+        'mean': round(sum(values_ms) / len(values_ms), 4),
+        'p50': round(percentile(values_ms, 50), 4),
+        'p95': round(percentile(values_ms, 95), 4),
+        'p99': round(percentile(values_ms, 99), 4)
+    }
+
+def load_module(label, source, workdir):
+    """Загружает версию db.py из исходного текста и создает базу в workdir/data"""
+    module_dir = os.path.join(workdir, label, 'app')
+    os.makedirs(module_dir)
+    path = os.path.join(module_dir, 'db.py')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(source)
+    
+    spec = importlib.util.spec_from_file_location(f"db_{label}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.init_db()
+    return module
+
+def seed(db_file, rows, employees):
+    """Заполняет базу: сотрудники и история по дню на сотрудника, дни назад от вчерашнего"""
+    rnd = random.Random(42)
+    yesterday = datetime.now().date() - timedelta(days=1)
+    conn = sqlite3.connect(db_file)
+    try:
+        conn.executemany(
+            "INSERT INTO employees (id, serial, name) VALUES (?, ?, ?)",
+            ((i + 1, f"{0xD0000000 + i:08X}", f"Сотрудник {i:04d}") for i in range(employees))
+        )
+        conn.executemany(
+            "INSERT INTO attendance (employee_id, date, arrival, departure) VALUES (?, ?, ?, ?)",
+            (
+                (i % employees + 1, (yesterday - timedelta(days=i // employees)).strftime('%Y-%m-%d'),
+                 f"{rnd.randint(8, 9):02d}:{rnd.randint(0, 59):02d}",
+                 f"{rnd.randint(17, 18):02d}:{rnd.randint(0, 59):02d}")
+                for i in range(rows)
+            )
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+def measure(db, calls, employees):
+    """Измеряет задержку функций модуля"""
+    rnd = random.Random(7)
+    serials = [f"{0xD0000000 + i:08X}" for i in range(employees)]
+    results = {}
+    
+    latencies = []
+    for _ in range(calls):
+        serial = rnd.choice(serials)
+        started_at = time.perf_counter()
+        db.get_employee_by_serial(serial)
+        latencies.append(time.perf_counter() - started_at)
+    results['get_employee_by_serial'] = latency_summary(latencies)
+    
+    # Сканирования за сегодня и следующие дни: приход, затем уход
+    latencies = []
+    today = datetime.now().date()
+    for i in range(calls):
+        employee_id = i % employees + 1
+        day = (today + timedelta(days=i // (2 * employees))).strftime('%Y-%m-%d')
+        first_scan = (i // employees) % 2 == 0
+        started_at = time.perf_counter()
+        if first_scan:
+            db.record_attendance(employee_id, day, arrival='09:00')
+        else:
+            db.record_attendance(employee_id, day, departure='18:00')
+        latencies.append(time.perf_counter() - started_at)
+    results['record_attendance'] = latency_summary(latencies)
+    
+    latencies = []
+    month = today.replace(day=1) - timedelta(days=1)
+    for _ in range(max(calls // 50, 5)):
+        started_at = time.perf_counter()
+        db.get_monthly_attendance(month.year, month.month)
+        latencies.append(time.perf_counter() - started_at)
+    results['get_monthly_attendance'] = latency_summary(latencies)
+    
+    return results
+
+def git_show(rev):
+    return subprocess.run(
+        ['git', 'show', f"{rev}:{DB_MODULE}"], cwd=ROOT_DIR,
+        stdout=subprocess.PIPE, check=True, text=True
+    ).stdout
+
+def main():
+    parser = argparse.ArgumentParser(description='Задержка вызовов app/db.py до и после оптимизации')
+    parser.add_argument('--baseline-rev', help='Ревизия git с базовой версией db.py')
+    parser.add_argument('--rows', type=int, default=100000, help='Строк истории посещаемости')
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--calls', type=int, default=2000, help='Вызовов на функцию')
+    parser.add_argument('--output', help='Файл для результатов JSON')
+    args = parser.parse_args()
+    
+    with open(os.path.join(ROOT_DIR, DB_MODULE), 'r', encoding='utf-8') as f:
+        versions = [('current', f.read())]
+    if args.baseline_rev:
+        versions.insert(0, ('baseline', git_show(args.baseline_rev)))
+    
+    report = {'benchmark': 'legacy_db', 'rows': args.rows, 'employees': args.employees,
+              'baseline_rev': args.baseline_rev, 'results': {}}
+    workdir = tempfile.mkdtemp(prefix='skud_bench_db_')
+    try:
+        for label, source in versions:
+            print(f"▶ {label}...", file=sys.stderr)
+            db = load_module(label, source, workdir)
+            seed(db.DB_FILE, args.rows, args.employees)
+            report['results'][label] = measure(db, args.calls, args.employees)
+            if hasattr(db, 'close_connection'):
+                db.close_connection()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    print(f"{'function':<24} {'version':<9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for function in ('get_employee_by_serial', 'record_attendance', 'get_monthly_attendance'):
+        for label, _ in versions:
+            latency = report['results'][label][function]
+            print(f"{function:<24} {label:<9} {latency['p50']:>9} {latency['p95']:>9} {latency['p99']:>9}")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк записи сканирования карты для трех реализаций хранилища СКУД
+
+    csv         pandas + CSV: /api/attendance из SKUD_iogram/api_server.py
+                (через Flask test_client, без сети)
+    sqlite      sqlite3: SKUD_Python/app/db.py, get_employee_by_serial +
+                record_attendance
+    sqlalchemy  SQLAlchemy: AttendanceService.process_card_scan из
+                SKUD_Python/SKUD_Enhanced
+
+Для каждого случая (реализация x размер истории x число сотрудников)
+создается история посещаемости заданного размера, после чего измеряются
+задержка одного сканирования (p50/p95/p99), устойчивая скорость
+(сканирований в секунду) и пиковая память процесса. Уведомления Telegram
+отключены, чтобы мерить только запись.
+
+Каждый случай выполняется в отдельном процессе: пакет app есть и в
+SKUD_Python, и в SKUD_Enhanced, а пиковая память должна относиться к
+одному случаю. Результаты сохраняются в JSON для сравнения между версиями.
+
+Пример:
+    python benchmarks/scan_ingest.py --rows 1000 100000 1000000 \\
+        --employees 10 2000 --backends csv sqlite sqlalchemy \\
+        --duration 10 --output scan_ingest.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import platform
+import tempfile
+import subprocess
+import importlib.util
+from datetime import datetime, timedelta
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LEGACY_DIR = os.path.join(ROOT_DIR, 'SKUD_Python')
+ENHANCED_DIR = os.path.join(LEGACY_DIR, 'SKUD_Enhanced')
+IOGRAM_DIR = os.path.join(ROOT_DIR, 'SKUD_iogram')
+
+BACKENDS = ('csv', 'sqlite', 'sqlalchemy')
+SEED_CHUNK_SIZE = 50000
+
+def employee_serial(index):
+    return f"{0xB0000000 + index:08X}"
+
+def employee_name(index):
+    return f"Сотрудник {index:04d}"
+
+def generate_history(rows, employees, seed=42):
+    """
+    Генерирует историю посещаемости: по одной строке на сотрудника в день,
+    дни идут назад от вчерашнего. Возвращает (date, employee_index, arrival, departure).
+    """
+    rnd = random.Random(seed)
+    yesterday = datetime.now().date() - timedelta(days=1)
+    for i in range(rows):
+        day = yesterday - timedelta(days=i // employees)
+        arrival = f"{rnd.randint(8, 9):02d}:{rnd.randint(0, 59):02d}"
+        departure = f"{rnd.randint(17, 18):02d}:{rnd.randint(0, 59):02d}"
+        yield day.strftime('%Y-%m-%d'), i % employees, arrival, departure
+
+def peak_rss_mb():
+    """Пиковая память процесса (ru_maxrss), МБ"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдает килобайты, macOS - байты
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+class CsvBackend:
+    """pandas + CSV (SKUD_iogram/api_server.py)"""
+    
+    def setup(self, workdir, rows, employees):
+        # api_server вычисляет пути к данным относительно рабочей директории
+        os.chdir(workdir)
+        os.makedirs('data', exist_ok=True)
+        
+        with open(os.path.join('data', 'employees.json'), 'w', encoding='utf-8') as f:
+            json.dump({employee_serial(i): employee_name(i) for i in range(employees)}, f, ensure_ascii=False)
+        
+        with open(os.path.join('data', 'attendance.csv'), 'w', encoding='utf-8', newline='') as f:
+            f.write('date,employee,arrival,departure\n')
+            # История пишется по возрастанию даты, как ее дописывает сервер
+            history = sorted(generate_history(rows, employees), key=lambda row: row[0])
+            for date, index, arrival, departure in history:
+                f.write(f"{date},{employee_name(index)},{arrival},{departure}\n")
+        
+        sys.path.insert(0, IOGRAM_DIR)
+        import api_server
+        
+        api_server.notify_telegram_bot = lambda message: None
+        api_server.send_employee_notification = lambda *args, **kwargs: None
+        self.client = api_server.app.test_client()
+    
+    def scan(self, serial, moment):
+        response = self.client.post('/api/attendance', json={
+            'serial': serial,
+            'time': moment.strftime('%Y-%m-%d %H:%M:%S')
+        })
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.get_data(as_text=True)}")
+
+class SqliteBackend:
+    """sqlite3 (SKUD_Python/app/db.py)"""
+    
+    def setup(self, workdir, rows, employees):
+        spec = importlib.util.spec_from_file_location('legacy_db', os.path.join(LEGACY_DIR, 'app', 'db.py'))
+        self.db = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.db)
+        
+        self.db.DB_FILE = os.path.join(workdir, 'skud.db')
+        self.db.init_db()
+        
+        conn = sqlite3.connect(self.db.DB_FILE)
+        try:
+            conn.executemany(
+                "INSERT INTO employees (id, serial, name) VALUES (?, ?, ?)",
+                ((i + 1, employee_serial(i), employee_name(i)) for i in range(employees))
+            )
+            conn.executemany(
+                "INSERT INTO attendance (employee_id, date, arrival, departure) VALUES (?, ?, ?, ?)",
+                ((index + 1, date, arrival, departure)
+                 for date, index, arrival, departure in generate_history(rows, employees))
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        
+        # Первое сканирование дня - приход, остальные - уход (как в API)
+        self.seen_days = set()
+    
+    def scan(self, serial, moment):
+        employee = self.db.get_employee_by_serial(serial)
+        if not employee:
+            raise RuntimeError(f"Сотрудник {serial} не найден")
+        
+        date = moment.strftime('%Y-%m-%d')
+        time_str = moment.strftime('%H:%M')
+        key = (employee['id'], date)
+        if key in self.seen_days:
+            ok, _ = self.db.record_attendance(employee['id'], date, departure=time_str)
+        else:
+            self.seen_days.add(key)
+            ok, _ = self.db.record_attendance(employee['id'], date, arrival=time_str)
+        if not ok:
+            raise RuntimeError("record_attendance вернул ошибку")
+
+class SqlalchemyBackend:
+    """SQLAlchemy (SKUD_Enhanced AttendanceService.process_card_scan)"""
+    
+    def setup(self, workdir, rows, employees):
+        # URL базы читается конфигом при импорте
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'skud.db')}"
+        sys.path.insert(0, ENHANCED_DIR)
+        
+        from app.database import db_manager
+        from app.models import Employee, RFIDCard, AttendanceEvent, DailyAttendance, EventType
+        from app.services.attendance import AttendanceService
+        
+        self.db_manager = db_manager
+        self.service = AttendanceService()
+        db_manager.create_tables()
+        
+        with db_manager.get_session() as session:
+            session.bulk_insert_mappings(Employee, [
+                {'id': i + 1, 'name': employee_name(i), 'is_active': True} for i in range(employees)
+            ])
+            session.bulk_insert_mappings(RFIDCard, [
+                {'id': i + 1, 'serial_number': employee_serial(i), 'employee_id': i + 1, 'is_active': True}
+                for i in range(employees)
+            ])
+        
+        events, days = [], []
+        for date, index, arrival, departure in generate_history(rows, employees):
+            arrival_time = datetime.strptime(f"{date} {arrival}", '%Y-%m-%d %H:%M')
+            departure_time = datetime.strptime(f"{date} {departure}", '%Y-%m-%d %H:%M')
+            for event_type, event_time in ((EventType.ARRIVAL, arrival_time), (EventType.DEPARTURE, departure_time)):
+                events.append({
+                    'employee_id': index + 1,
+                    'card_id': index + 1,
+                    'event_type': event_type,
+                    'event_time': event_time,
+                    'event_date': date
+                })
+            days.append({
+                'employee_id': index + 1,
+                'date': date,
+                'arrival_time': arrival_time,
+                'departure_time': departure_time,
+                'hours_worked': int((departure_time - arrival_time).total_seconds() // 60),
+                'is_closed': True
+            })
+            
+            if len(days) >= SEED_CHUNK_SIZE:
+                self._flush_seed(AttendanceEvent, DailyAttendance, events, days)
+                events, days = [], []
+        self._flush_seed(AttendanceEvent, DailyAttendance, events, days)
+    
+    def _flush_seed(self, event_model, day_model, events, days):
+        with self.db_manager.get_session() as session:
+            session.bulk_insert_mappings(event_model, events)
+            session.bulk_insert_mappings(day_model, days)
+    
+    def scan(self, serial, moment):
+        with self.db_manager.get_session() as session:
+            success, message, _ = self.service.process_card_scan(session, serial, moment)
+        if not success:
+            raise RuntimeError(message)
+
+BACKEND_CLASSES = {
+    'csv': CsvBackend,
+    'sqlite': SqliteBackend,
+    'sqlalchemy': SqlalchemyBackend
+}
+
+def run_case(case):
+    """Выполняет один случай бенчмарка в текущем процессе"""
+    workdir = tempfile.mkdtemp(prefix=f"skud_bench_{case['backend']}_")
+    try:
+        return _measure(BACKEND_CLASSES[case['backend']](), workdir, case)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def _measure(backend, workdir, case):
+    started_at = time.perf_counter()
+    backend.setup(workdir, case['rows'], case['employees'])
+    seed_seconds = time.perf_counter() - started_at
+    rss_after_seed = peak_rss_mb()
+    
+    rnd = random.Random(7)
+    moment = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
+    
+    def next_scan():
+        nonlocal moment
+        moment += timedelta(seconds=1)
+        return employee_serial(rnd.randrange(case['employees'])), moment
+    
+    for _ in range(case['warmup']):
+        backend.scan(*next_scan())
+    
+    # Устойчивая нагрузка: сканирования подряд, пока не истечет время
+    latencies = []
+    run_started_at = time.perf_counter()
+    while True:
+        serial, scan_moment = next_scan()
+        scan_started_at = time.perf_counter()
+        backend.scan(serial, scan_moment)
+        latencies.append(time.perf_counter() - scan_started_at)
+        
+        elapsed = time.perf_counter() - run_started_at
+        if elapsed >= case['duration'] and len(latencies) >= case['min_scans']:
+            break
+    
+    latencies_ms = sorted(value * 1000 for value in latencies)
+    return {
+        **case,
+        'seed_seconds': round(seed_seconds, 3),
+        'scans': len(latencies),
+        'scans_per_second': round(len(latencies) / elapsed, 2),
+        'latency_ms': {
+            'mean': round(sum(latencies_ms) / len(latencies_ms), 3),
+            'p50': round(percentile(latencies_ms, 50), 3),
+            'p95': round(percentile(latencies_ms, 95), 3),
+            'p99': round(percentile(latencies_ms, 99), 3),
+            'max': round(latencies_ms[-1], 3)
+        },
+        'rss_after_seed_mb': rss_after_seed,
+        'rss_peak_mb': peak_rss_mb()
+    }
+
+def spawn_case(case, verbose=False):
+    """Запускает случай в отдельном процессе и возвращает его результат"""
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--worker', json.dumps(case)],
+        stdout=subprocess.PIPE,
+        stderr=None if verbose else subprocess.PIPE,
+        text=True
+    )
+    if process.returncode != 0:
+        error = (process.stderr or '').strip().splitlines()[-5:]
+        return {**case, 'error': '\n'.join(error) or f"код возврата {process.returncode}"}
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+def print_summary(results):
+    print(f"{'backend':<11} {'rows':>8} {'empl':>5} {'scan/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'RSS MB':>7}")
+    for result in results:
+        if 'error' in result:
+            print(f"{result['backend']:<11} {result['rows']:>8} {result['employees']:>5}  ОШИБКА: {result['error'].splitlines()[-1]}")
+            continue
+        latency = result['latency_ms']
+        print(f"{result['backend']:<11} {result['rows']:>8} {result['employees']:>5} "
+              f"{result['scans_per_second']:>8} {latency['p50']:>9} {latency['p95']:>9} "
+              f"{latency['p99']:>9} {result['rss_peak_mb'] or '-':>7}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк записи сканирования карты (CSV / sqlite3 / SQLAlchemy)')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--rows', nargs='+', type=int, default=[1000, 100000],
+                        help='Размеры истории посещаемости (строк)')
+    parser.add_argument('--employees', nargs='+', type=int, default=[10, 200],
+                        help='Число сотрудников')
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='Длительность устойчивой нагрузки на случай, сек')
+    parser.add_argument('--min-scans', type=int, default=5,
+                        help='Минимум сканирований на случай (для медленных реализаций)')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--output', help='Файл для результатов JSON (по умолчанию scan_ingest_<время>.json)')
+    parser.add_argument('--verbose', action='store_true', help='Показывать логи реализаций')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.worker:
+        print(json.dumps(run_case(json.loads(args.worker)), ensure_ascii=False))
+        return
+    
+    report = {
+        'benchmark': 'scan_ingest',
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': []
+    }
+    
+    for backend in args.backends:
+        for rows in args.rows:
+            for employees in args.employees:
+                case = {
+                    'backend': backend,
+                    'rows': rows,
+                    'employees': employees,
+                    'duration': args.duration,
+                    'min_scans': args.min_scans,
+                    'warmup': args.warmup
+                }
+                print(f"▶ {backend}: {rows} строк, {employees} сотрудников...", file=sys.stderr)
+                report['results'].append(spawn_case(case, args.verbose))
+    
+    output = args.output or f"scan_ingest_{datetime.now():%Y%m%d_%H%M%S}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    print_summary(report['results'])
+    print(f"\nРезультаты сохранены: {output}")
+
+if __name__ == '__main__':
+    main()
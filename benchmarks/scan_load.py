@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Нагрузочный генератор сканирований: N считывателей, M сотрудников
+
+В отличие от send_attendance.py и test_esp32_simulation.py, которые шлют
+по одному запросу с фиксированными картами, здесь моделируется смена
+целиком: каждый сотрудник приходит около 09:00 и уходит около 17:00
+(нормальное распределение, --spread минут), иногда прикладывает карту
+дважды. Каждое сканирование достается случайному считывателю; считыватель,
+как ESP32, отправляет запросы строго по одному, а разные считыватели
+работают параллельно (asyncio + aiohttp).
+
+Время смены сжимается в --speedup раз, а паузы между пиками (обед,
+ночь) ограничены --max-idle секундами, поэтому пики прихода и ухода
+создают настоящую конкурентную нагрузку на сервер.
+
+После прогона, если указан --data-dir (каталог data сервера с
+attendance.csv) или --verify-sqlite (база app/db.py), проверяется, что
+каждое подтвержденное сервером сканирование попало в хранилище: приход
+равен первому сканированию дня, уход - последнему. Расхождения считаются
+потерянными обновлениями.
+
+Пример (локальный api_server.py SKUD_iogram на свежем каталоге данных):
+    python benchmarks/scan_load.py --base-url http://localhost:5000 \\
+        --readers 8 --employees 200 --days 2 --data-dir SKUD_iogram/data \\
+        --output scan_load.json
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import asyncio
+import sqlite3
+import argparse
+import platform
+import subprocess
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import aiohttp
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ARRIVAL_PEAK = (9, 0)
+DEPARTURE_PEAK = (17, 0)
+
+def employee_serial(index):
+    return f"{0xC0000000 + index:08X}"
+
+def employee_name(index):
+    return f"Нагрузка {index:04d}"
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def latency_summary(values):
+    """Сводка задержек в миллисекундах"""
+    values_ms = sorted(value * 1000 for value in values)
+    if not values_ms:
+        return None
+    return {
+        'mean': round(sum(values_ms) / len(values_ms), 3),
+        'p50': round(percentile(values_ms, 50), 3),
+        'p95': round(percentile(values_ms, 95), 3),
+        'p99': round(percentile(values_ms, 99), 3),
+        'max': round(values_ms[-1], 3)
+    }
+
+def build_schedule(employees, days, end_date, spread_minutes, double_tap, seed=42):
+    """
+    Строит расписание сканирований: список (момент, индекс сотрудника),
+    отсортированный по времени. На каждый день - приход около 09:00 и уход
+    около 17:00, с вероятностью double_tap карта прикладывается повторно.
+    """
+    rnd = random.Random(seed)
+    schedule = []
+    for day_offset in range(days - 1, -1, -1):
+        day = datetime.combine(end_date - timedelta(days=day_offset), datetime.min.time())
+        for index in range(employees):
+            for hour, minute in (ARRIVAL_PEAK, DEPARTURE_PEAK):
+                peak = day.replace(hour=hour, minute=minute)
+                moment = peak + timedelta(seconds=int(rnd.gauss(0, spread_minutes * 60)))
+                # Смены не переходят через полночь
+                moment = max(day.replace(hour=0, minute=1), min(moment, day.replace(hour=23, minute=58)))
+                schedule.append((moment, index))
+                if rnd.random() < double_tap:
+                    schedule.append((moment + timedelta(seconds=rnd.randint(1, 5)), index))
+    
+    schedule.sort()
+    return schedule
+
+def wall_offsets(schedule, speedup, max_idle):
+    """Переводит время смены в смещения от начала прогона (сжатие и обрезка пауз)"""
+    offsets = []
+    offset = 0.0
+    previous = None
+    for moment, _ in schedule:
+        if previous is not None:
+            offset += min((moment - previous).total_seconds() / speedup, max_idle)
+        offsets.append(offset)
+        previous = moment
+    return offsets
+
+def register_employees(data_dir, employees):
+    """Добавляет синтетических сотрудников в employees.json сервера"""
+    path = os.path.join(data_dir, 'employees.json')
+    existing = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            existing = json.load(f)
+    
+    existing.update({employee_serial(i): employee_name(i) for i in range(employees)})
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(existing, f, ensure_ascii=False, indent=4)
+
+async def register_employees_api(session, base_url, employees):
+    """Добавляет сотрудников через /api/add_employee (SKUD_iogram)"""
+    for i in range(employees):
+        async with session.post(f"{base_url}/api/add_employee",
+                                json={'serial': employee_serial(i), 'name': employee_name(i)}) as response:
+            # 409 - сотрудник уже добавлен предыдущим прогоном
+            if response.status not in (200, 409):
+                raise RuntimeError(f"Не удалось добавить {employee_serial(i)}: HTTP {response.status}")
+
+class LoadRun:
+    """Один прогон: очереди считывателей и результаты сканирований"""
+    
+    def __init__(self, base_url, readers, timeout, seed=7):
+        self.url = f"{base_url}/api/attendance"
+        self.queues = [asyncio.Queue() for _ in range(readers)]
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.rnd = random.Random(seed)
+        self.results = []
+    
+    async def reader(self, session, reader_id):
+        """Считыватель: отправляет свои сканирования строго по одному"""
+        queue = self.queues[reader_id]
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            
+            moment, index, due_at = item
+            started_at = time.perf_counter()
+            result = {
+                'reader': reader_id,
+                'employee': index,
+                'moment': moment,
+                'lag': started_at - due_at
+            }
+            try:
+                async with session.post(self.url, json={
+                    'serial': employee_serial(index),
+                    'time': moment.strftime('%Y-%m-%d %H:%M:%S')
+                }, timeout=self.timeout) as response:
+                    await response.read()
+                    result['status'] = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                result['status'] = None
+                result['error'] = type(e).__name__
+            result['latency'] = time.perf_counter() - started_at
+            self.results.append(result)
+    
+    async def dispatch(self, schedule, offsets):
+        """Раздает сканирования считывателям в моменты по расписанию"""
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        perf_started_at = time.perf_counter()
+        for (moment, index), offset in zip(schedule, offsets):
+            delay = started_at + offset - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            queue = self.queues[self.rnd.randrange(len(self.queues))]
+            queue.put_nowait((moment, index, perf_started_at + offset))
+        
+        for queue in self.queues:
+            queue.put_nowait(None)
+    
+    async def run(self, schedule, offsets, register_via_api=False, employees=0):
+        connector = aiohttp.TCPConnector(limit=len(self.queues))
+        async with aiohttp.ClientSession(connector=connector) as session:
+            if register_via_api:
+                await register_employees_api(session, self.url.rsplit('/api/', 1)[0], employees)
+            
+            run_started_at = time.perf_counter()
+            readers = [asyncio.create_task(self.reader(session, i)) for i in range(len(self.queues))]
+            await self.dispatch(schedule, offsets)
+            await asyncio.gather(*readers)
+            return time.perf_counter() - run_started_at
+
+def expected_records(results):
+    """
+    Ожидаемое содержимое хранилища по подтвержденным сканированиям:
+    {(дата, сотрудник): (приход, уход)}. Дни, в которых хотя бы одно
+    сканирование завершилось ошибкой, неоднозначны и возвращаются отдельно.
+    """
+    scans_by_day = defaultdict(list)
+    ambiguous = set()
+    for result in results:
+        key = (result['moment'].strftime('%Y-%m-%d'), result['employee'])
+        if result['status'] == 200:
+            scans_by_day[key].append(result['moment'])
+        else:
+            ambiguous.add(key)
+    
+    expected = {}
+    for key, moments in scans_by_day.items():
+        if key in ambiguous:
+            continue
+        moments.sort()
+        arrival = moments[0].strftime('%H:%M')
+        departure = moments[-1].strftime('%H:%M') if len(moments) > 1 else ''
+        expected[key] = (arrival, departure)
+    return expected, ambiguous
+
+def load_csv_records(data_dir):
+    """Записи attendance.csv: {(дата, имя): [(приход, уход), ...]}"""
+    records = defaultdict(list)
+    with open(os.path.join(data_dir, 'attendance.csv'), 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            records[(row['date'], row['employee'])].append((row['arrival'] or '', row['departure'] or ''))
+    return records
+
+def load_sqlite_records(db_file):
+    """Записи базы app/db.py: {(дата, имя): [(приход, уход), ...]}"""
+    records = defaultdict(list)
+    conn = sqlite3.connect(db_file)
+    try:
+        rows = conn.execute('''
+            SELECT a.date, e.name, a.arrival, a.departure
+            FROM attendance a JOIN employees e ON e.id = a.employee_id
+        ''')
+        for date, name, arrival, departure in rows:
+            records[(date, name)].append((arrival or '', departure or ''))
+    finally:
+        conn.close()
+    return records
+
+def verify(expected, records):
+    """Сравнивает ожидаемые записи с хранилищем"""
+    report = {'checked': len(expected), 'missing': 0, 'duplicates': 0, 'lost_updates': 0, 'examples': []}
+    for (date, index), (arrival, departure) in sorted(expected.items()):
+        stored = records.get((date, employee_name(index)), [])
+        if not stored:
+            report['missing'] += 1
+            problem = 'нет записи'
+        elif len(stored) > 1:
+            report['duplicates'] += 1
+            problem = f"{len(stored)} записи за день"
+        elif stored[0] != (arrival, departure):
+            report['lost_updates'] += 1
+            problem = f"в хранилище {stored[0]}"
+        else:
+            continue
+        
+        if len(report['examples']) < 10:
+            report['examples'].append(
+                f"{date} {employee_name(index)}: ожидалось ({arrival}, {departure}), {problem}"
+            )
+    return report
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+def summarize(results, duration):
+    statuses = defaultdict(int)
+    for result in results:
+        statuses[str(result['status'] or result.get('error'))] += 1
+    errors = sum(count for status, count in statuses.items() if status not in ('200', '404'))
+    
+    return {
+        'scans': len(results),
+        'duration_seconds': round(duration, 3),
+        'scans_per_second': round(len(results) / duration, 2) if duration else None,
+        'statuses': dict(statuses),
+        'errors': errors,
+        'error_rate': round(errors / len(results), 4) if results else 0,
+        'latency_ms': latency_summary([result['latency'] for result in results]),
+        'dispatch_lag_ms': latency_summary([max(result['lag'], 0) for result in results])
+    }
+
+def print_summary(report):
+    summary = report['summary']
+    latency = summary['latency_ms'] or {}
+    print(f"Сканирований: {summary['scans']} за {summary['duration_seconds']} с "
+          f"({summary['scans_per_second']} в секунду)")
+    print(f"Задержка, мс: p50 {latency.get('p50')}  p95 {latency.get('p95')}  "
+          f"p99 {latency.get('p99')}  max {latency.get('max')}")
+    print(f"Ответы: {summary['statuses']}, ошибок {summary['errors']} ({summary['error_rate']:.2%})")
+    
+    verification = report.get('verification')
+    if verification:
+        print(f"Проверка хранилища: {verification['checked']} сотрудник-дней, "
+              f"потеряно обновлений {verification['lost_updates']}, нет записи {verification['missing']}, "
+              f"дублей {verification['duplicates']}, неоднозначных {verification['ambiguous']}")
+        for example in verification['examples']:
+            print(f"  - {example}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный генератор сканирований СКУД (N считывателей, M сотрудников)')
+    parser.add_argument('--base-url', default='http://localhost:5000', help='Адрес сервера с /api/attendance')
+    parser.add_argument('--readers', type=int, default=4, help='Число считывателей (параллельных клиентов)')
+    parser.add_argument('--employees', type=int, default=100, help='Число сотрудников')
+    parser.add_argument('--days', type=int, default=1, help='Число моделируемых дней')
+    parser.add_argument('--date', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+                        default=datetime.now().date(), help='Последний моделируемый день (YYYY-MM-DD)')
+    parser.add_argument('--spread', type=float, default=10.0,
+                        help='Разброс прихода и ухода вокруг 09:00 и 17:00, минут (сигма)')
+    parser.add_argument('--double-tap', type=float, default=0.05,
+                        help='Вероятность повторного прикладывания карты')
+    parser.add_argument('--speedup', type=float, default=60.0, help='Ускорение времени смены')
+    parser.add_argument('--max-idle', type=float, default=1.0,
+                        help='Максимальная пауза между сканированиями после сжатия, сек')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Таймаут запроса, сек')
+    parser.add_argument('--data-dir', help='Каталог data сервера: сотрудники добавляются в employees.json, '
+                                           'после прогона проверяется attendance.csv')
+    parser.add_argument('--verify-sqlite', help='Проверить базу SQLite (app/db.py) вместо attendance.csv')
+    parser.add_argument('--register-api', action='store_true',
+                        help='Добавить сотрудников через /api/add_employee (SKUD_iogram)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Файл для результатов JSON')
+    args = parser.parse_args()
+    
+    if args.data_dir:
+        register_employees(args.data_dir, args.employees)
+    
+    schedule = build_schedule(args.employees, args.days, args.date, args.spread, args.double_tap, args.seed)
+    offsets = wall_offsets(schedule, args.speedup, args.max_idle)
+    print(f"▶ {len(schedule)} сканирований, {args.readers} считывателей, {args.employees} сотрудников, "
+          f"~{offsets[-1] if offsets else 0:.1f} с", file=sys.stderr)
+    
+    load_run = LoadRun(args.base_url.rstrip('/'), args.readers, args.timeout, args.seed)
+    duration = asyncio.run(load_run.run(schedule, offsets, args.register_api, args.employees))
+    
+    report = {
+        'benchmark': 'scan_load',
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {
+            key: value.isoformat() if hasattr(value, 'isoformat') else value
+            for key, value in vars(args).items() if key != 'output'
+        },
+        'summary': summarize(load_run.results, duration)
+    }
+    
+    if args.verify_sqlite or args.data_dir:
+        records = load_sqlite_records(args.verify_sqlite) if args.verify_sqlite else load_csv_records(args.data_dir)
+        expected, ambiguous = expected_records(load_run.results)
+        report['verification'] = {**verify(expected, records), 'ambiguous': len(ambiguous)}
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    print_summary(report)
+    
+    verification = report.get('verification') or {}
+    if verification.get('lost_updates') or verification.get('missing') or verification.get('duplicates'):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()